@@ -45,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First so its timings cover every other middleware too
+    'spending_app.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -85,6 +87,34 @@ DATABASES = {
     }
 }
 
+# Database Profile
+# - default: plain SQLite, fine for runserver + a single worker
+# - concurrent: several gunicorn workers/pods sharing the file (DATABASE_PROFILE=concurrent)
+#   python manage.py benchmark_concurrency shows what it buys
+DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'default')
+if DATABASE_PROFILE == 'concurrent':
+    DATABASES['default'].update({
+        'OPTIONS': {
+            # WAL: readers don't block the writer and the writer doesn't block readers
+            # synchronous=NORMAL is safe with WAL (a power cut can only lose the last commits, never corrupt)
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA cache_size=-32000;'
+                'PRAGMA temp_store=MEMORY;'
+                'PRAGMA mmap_size=268435456'
+            ),
+            # Grab the write lock at BEGIN, so a transaction waits for it up front instead of failing
+            # with "database is locked" when it tries to upgrade from a read halfway through
+            'transaction_mode': 'IMMEDIATE',
+            # How long (seconds) we wait for the write lock, way longer than one ingest chunk holds it
+            'timeout': 20,
+        },
+        # Keep connections around between requests (+ check they still work before reusing them)
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    })
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -149,4 +179,101 @@ REST_FRAMEWORK = {
 # Corsheader 
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
-]
\ No newline at end of file
+]
+
+# CSV Ingestion
+# - Uploads are parsed + inserted this many rows at a time so memory stays flat no matter how big the file is
+# - Anything bigger than FILE_UPLOAD_MAX_MEMORY_SIZE (2.5MB default) is already spooled to a temp file by Django
+# - Each chunk is one write transaction, with several workers smaller chunks keep the write lock short
+INGEST_CHUNK_SIZE = 5000 if DATABASE_PROFILE == 'concurrent' else 50000
+# CSV reader (spending_app/parsing.py): 'auto' uses pyarrow if it's installed (pip install pyarrow), 'c' is Python's csv module
+INGEST_CSV_ENGINE = 'auto'
+# Same as Django's default handlers, they just hash the file while it streams in (spending_app/uploadhandlers.py)
+# - Uploading the exact same file again is answered with the first upload instead of being ingested twice
+FILE_UPLOAD_HANDLERS = [
+    'spending_app.uploadhandlers.HashingMemoryFileUploadHandler',
+    'spending_app.uploadhandlers.HashingTemporaryFileUploadHandler',
+]
+
+# Worker Processes
+# - Every web worker starts its own parse + render pools (on first use), so they're sized by the cores
+#   each web worker gets: WEB_CONCURRENCY is the number of gunicorn workers (gunicorn reads it for --workers too)
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+CORES_PER_WEB_WORKER = max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY)
+
+# Upload Jobs
+# - POST /uploads/ returns right away and the file is ingested by a local background worker pool (spending_app/jobs.py)
+# - Eager runs the job inside the request instead (tests + scripts)
+# - Jobs parse their file (dates, amounts, fingerprints) in a pool of PARSE_WORKERS processes (spending_app/parsepool.py)
+#   and only take turns for the database writes, so the files of a multi-file/ZIP upload parse in parallel
+#   0 parses in the job's own thread instead
+PARSE_WORKERS = CORES_PER_WEB_WORKER
+# Job threads mostly wait on the parse pool or the write lock, one per parse process keeps every core busy
+UPLOAD_WORKERS = max(2, PARSE_WORKERS)
+UPLOAD_JOBS_EAGER = False
+# A pending/processing upload whose job showed no sign of life (start, every chunk) for this long is considered gone
+# (restart, crash), python manage.py recover_uploads marks it failed so the file can be uploaded again
+UPLOAD_JOB_TIMEOUT = 30 * 60
+# ZIP uploads: at most this many members and this many bytes once extracted (a small archive can unpack to a lot)
+UPLOAD_ARCHIVE_MAX_FILES = 200
+UPLOAD_ARCHIVE_MAX_SIZE = 1024 * 1024 * 1024
+
+# PDF Summary Reports
+# - Rendered PDFs are cached on disk (spending_app/reports.py), least recently used ones go once we're over the limit
+REPORT_CACHE_DIR = os.path.join(BASE_DIR, 'data', 'report_cache')
+REPORT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# - WeasyPrint runs in a pool of render processes (spending_app/rendering.py), 0 renders inside the request instead
+# - Each web worker gets its own pool, started by its first download (a gunicorn post_fork hook can call
+#   spending_app.rendering.warm_report_pool() to start it up front)
+REPORT_RENDER_WORKERS = min(2, CORES_PER_WEB_WORKER)
+# How long a download waits for its PDF before answering 202 (rendering continues in the background)
+REPORT_RENDER_TIMEOUT = 30
+# Parsed once per render process instead of on every render
+REPORT_STYLESHEETS = ['css/bootstrap.min.css']
+
+# Response Cache
+# - Category list/retrieve, upload detail + summary responses are cached until a write bumps the version
+#   of what they show (versions live in the database, spending_app/responsecache.py)
+# - Local memory is per worker process, which is fine: versions are shared so nobody serves an outdated entry
+#   (switch 'responses' to django.core.cache.backends.filebased.FileBasedCache to share the entries too)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+        'OPTIONS': {'MAX_ENTRIES': 2000},
+    },
+}
+RESPONSE_CACHE = 'responses'
+RESPONSE_CACHE_TIMEOUT = 60 * 60
+
+# Bulk Transaction API
+# - /transactions/bulk/ validates + writes a whole list of transactions per request (spending_app/bulk.py)
+# - Every batch is one write transaction, keep it small enough not to hold the write lock for long
+BULK_MAX_ITEMS = 10000
+
+# Columnar Snapshots
+# - Every upload also gets its transactions as typed numpy arrays on disk (spending_app/snapshots.py),
+#   memory-mapped by analytics instead of loading rows through the ORM
+# - Edits make them stale, python manage.py build_snapshots (re)builds whatever is missing
+SNAPSHOT_DIR = os.path.join(BASE_DIR, 'data', 'snapshots')
+
+# Spending Insights
+# - Recurring charges + anomalies per upload and across every upload (spending_app/insights.py),
+#   computed from the snapshots and cached like the summary until the transactions change
+# A vendor is recurring once it charged this often, mostly on one billing period + about the same amount
+RECURRING_MIN_OCCURRENCES = 3
+RECURRING_MIN_REGULARITY = 0.75
+RECURRING_MAX_AMOUNT_VARIATION = 0.1
+# Anomalies: z-score against the last ANOMALY_WINDOW transactions of the same category (once there are ANOMALY_MIN_HISTORY)
+ANOMALY_WINDOW = 30
+ANOMALY_MIN_HISTORY = 8
+ANOMALY_Z_SCORE = 3.0
+ANALYTICS_MAX_ANOMALIES = 100
+
+# Request Metrics
+# - Server-Timing header on every response + Prometheus histograms per view at /metrics (spending_app/metrics.py)
+# - False takes the middleware + query timer out completely
+METRICS_ENABLED = True
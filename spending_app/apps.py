@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
 
 
 class SpendingAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'spending_app'
+
+    def ready(self):
+        if settings.METRICS_ENABLED:
+            # Counts + times every query of the request we're in (see metrics.py)
+            from .metrics import install_query_timer
+            connection_created.connect(install_query_timer, dispatch_uid='spending_app.metrics')
@@ -0,0 +1,48 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+
+class AsyncAPIViewMixin:
+    """
+        Lets a DRF view (or viewset) have async def handlers next to the usual sync ones
+
+        - DRF's own dispatch is sync, under ASGI every request would be handed to a thread and back
+        - async handlers are awaited right on the event loop (use the async ORM in them: aget, afirst, async for)
+        - sync handlers (our writes) run through sync_to_async, same thread Django uses for all sync code
+        - Authentication/permissions (session lookup) run in that thread too, before the handler
+        Under WSGI (gunicorn sync workers, the test Client) Django runs the whole thing with async_to_sync
+    """
+    # Django checks this to decide whether the view function is a coroutine
+    view_is_async = True
+
+    @classmethod
+    def as_view(cls, *args, **initkwargs):
+        view = super().as_view(*args, **initkwargs)
+        # ViewSets build their own view function and never look at view_is_async
+        return markcoroutinefunction(view)
+
+    async def dispatch(self, request, *args, **kwargs):
+        # Same steps as APIView.dispatch, with the awaits in between
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            if iscoroutinefunction(handler):
+                response = await handler(request, *args, **kwargs)
+            else:
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
@@ -0,0 +1,180 @@
+from collections import namedtuple
+from django.conf import settings
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from hashlib import sha256
+import os
+import tempfile
+import zipfile
+import zlib
+from .jobs import IN_FLIGHT, current_uploads, enqueue_upload, recover_stale_uploads
+from .models import TransactionUploads
+from .uploadhandlers import file_content_hash
+
+# One CSV of a multi-file/ZIP upload: name (path inside the archive for members), archive it came out of (or None),
+# the file to store (None when we can't ingest it) + why not
+UploadMember = namedtuple('UploadMember', ['name', 'archive', 'file', 'error'])
+
+# Members are copied out of the archive this many bytes at a time
+EXTRACT_CHUNK_SIZE = 64 * 1024
+
+# Anything going wrong inside an archive: corrupt data, encryption, compression methods we don't have
+ARCHIVE_ERRORS = (zipfile.BadZipFile, RuntimeError, NotImplementedError, EOFError, zlib.error)
+
+
+def validate_member(name, size):
+    """
+        Why we won't ingest a file (None if we will), the same for plain files, archive members + single uploads
+    """
+    if not name.lower().endswith('.csv'):
+        return 'Only .csv files are ingested.'
+    if not size:
+        return 'The submitted file is empty.'
+    return None
+
+
+def duplicates_of(content_hash):
+    """
+        Earlier uploads of the exact same file (the first one first): done ones + ones still being processed
+
+        Failed uploads and ones whose job went away (see jobs.stale_uploads) don't count
+    """
+    return current_uploads().filter(content_hash=content_hash).order_by('id')
+
+
+def create_upload(file, content_hash):
+    """
+        The new TransactionUploads for a file, or the live upload that already has it: (upload, duplicate)
+
+        - Checking duplicates_of first and inserting after leaves a window for two requests with the same file,
+          the unique_live_upload_content constraint closes it: whoever inserts second is handed the first upload
+        - A stale upload of the file would hold the constraint without ever finishing, it's swept first
+    """
+    recover_stale_uploads(content_hash=content_hash)
+    duplicate = duplicates_of(content_hash).first()
+    if duplicate:
+        return None, duplicate
+    upload = TransactionUploads(file=file, content_hash=content_hash)
+    try:
+        with transaction.atomic():
+            upload.save()
+    except IntegrityError:
+        # The file was stored before the insert failed
+        upload.file.delete(save=False)
+        live = TransactionUploads.objects.filter(
+            content_hash=content_hash, status__in=[*IN_FLIGHT, TransactionUploads.Status.DONE]
+        )
+        return None, live.order_by('id').first()
+    return upload, None
+
+
+def is_zip_archive(file):
+    """
+        ZIP by content rather than by name, the file is left at its start either way
+    """
+    try:
+        return zipfile.is_zipfile(file)
+    finally:
+        file.seek(0)
+
+
+def _skipped(name):
+    # Folders macOS/Finder put next to the real files
+    return name.startswith('__MACOSX/') or os.path.basename(name).startswith('.')
+
+
+def _extract(archive, info):
+    """
+        Copies a member into a temporary file (in memory up to FILE_UPLOAD_MAX_MEMORY_SIZE), hashing it on the way
+        like our upload handlers do for plain files
+    """
+    spooled = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    hasher = sha256()
+    try:
+        with archive.open(info) as member:
+            for chunk in iter(lambda: member.read(EXTRACT_CHUNK_SIZE), b''):
+                hasher.update(chunk)
+                spooled.write(chunk)
+    except BaseException:
+        spooled.close()
+        raise
+    spooled.seek(0)
+    file = File(spooled, name=os.path.basename(info.filename))
+    file.content_hash = hasher.hexdigest()
+    return file
+
+
+def _archive_members(upload):
+    try:
+        archive = zipfile.ZipFile(upload)
+    except ARCHIVE_ERRORS:
+        return [UploadMember(upload.name, None, None, 'This archive could not be read.')]
+    with archive:
+        infos = [info for info in archive.infolist() if not info.is_dir() and not _skipped(info.filename)]
+        if len(infos) > settings.UPLOAD_ARCHIVE_MAX_FILES:
+            return [UploadMember(upload.name, None, None, f'Archives may hold at most {settings.UPLOAD_ARCHIVE_MAX_FILES} files.')]
+        # The sizes in the archive's directory are what zipfile lets a member grow to, never more
+        if sum(info.file_size for info in infos) > settings.UPLOAD_ARCHIVE_MAX_SIZE:
+            return [UploadMember(upload.name, None, None, f'Archives may hold at most {settings.UPLOAD_ARCHIVE_MAX_SIZE} bytes once extracted.')]
+
+        members = []
+        for info in infos:
+            error = validate_member(info.filename, info.file_size)
+            if error:
+                members.append(UploadMember(info.filename, upload.name, None, error))
+            else:
+                try:
+                    members.append(UploadMember(info.filename, upload.name, _extract(archive, info), None))
+                except ARCHIVE_ERRORS:
+                    members.append(UploadMember(info.filename, upload.name, None, 'This file could not be extracted.'))
+        return members
+
+
+def expand_uploads(files):
+    """
+        Every CSV of a request: plain files as they are, ZIP archives member by member
+
+        Members we can't ingest come back with an error instead of a file, so they still get a status
+    """
+    members = []
+    for file in files:
+        if is_zip_archive(file):
+            members.extend(_archive_members(file))
+        else:
+            error = validate_member(file.name, file.size)
+            members.append(UploadMember(file.name, None, None if error else file, error))
+    return members
+
+
+def start_uploads(members):
+    """
+        One TransactionUploads (+ its background job, see jobs.py) per member we can ingest
+
+        - A member we've seen before (same content hash, also earlier in this batch) points at the first upload
+        - The jobs run on the upload worker pool and parse in the parse processes, so members are parsed in parallel
+        Returns (status, upload id, error) per member, in order: the upload's status, 'duplicate' or 'rejected'
+    """
+    results = []
+    for member in members:
+        if member.error:
+            results.append(('rejected', None, member.error))
+            continue
+        upload, duplicate = create_upload(member.file, file_content_hash(member.file))
+        if duplicate:
+            results.append(('duplicate', duplicate.id, None))
+            continue
+        enqueue_upload(upload.id)
+        results.append((None, upload.id, None))
+
+    # Where every new upload is at by now (eager jobs are already done)
+    statuses = dict(TransactionUploads.objects.filter(
+        id__in=[upload_id for file_status, upload_id, _ in results if file_status is None]
+    ).values_list('id', 'status'))
+    return [(file_status or statuses[upload_id], upload_id, error) for file_status, upload_id, error in results]
+
+
+def close_members(members):
+    # The temporary copies of archive members, plain uploads are cleaned up by Django
+    for member in members:
+        if member.archive and member.file:
+            member.file.close()
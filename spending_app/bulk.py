@@ -0,0 +1,211 @@
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+import pandas as pd
+from .changes import TransactionRow, transactions_changed
+from .ingest import BULK_BATCH_SIZE
+from .models import Category, Transactions, TransactionUploads, Vendor
+from .vendors import resolve_vendor_ids
+
+# Payload field -> Transactions field
+FIELDS = {
+    'vendor': 'vendor_id',
+    'amount': 'amount',
+    'date': 'date',
+    'category': 'category_id',
+    'transaction_upload': 'transaction_upload_id',
+}
+VENDOR_MAX_LENGTH = Vendor._meta.get_field('name').max_length
+# At most 16 digits before the point so the amount (in cents) always fits in an int64
+AMOUNT_PATTERN = r'(-?)(\d{1,16})(?:\.(\d{1,2}))?'
+
+
+class TransactionBatch:
+    """
+        A list of transaction payloads from the bulk API, validated as columns instead of one serializer per item
+
+        - Every field is checked for the whole batch at once with pandas (like StatementParser does for uploads),
+          categories/uploads/transactions being pointed at are looked up with one query each
+        - partial: items are {id, ...fields to change} of existing transactions, missing fields keep their value
+        - errors: {index in the list: {field: [messages]}}, same messages as our serializers,
+          nothing is written unless there are none
+    """
+    def __init__(self, items, partial=False):
+        self.partial = partial
+        self.errors = {}
+        if not isinstance(items, list):
+            self.list_error = f'Expected a list of items but got type "{type(items).__name__}".'
+            return
+        if len(items) > settings.BULK_MAX_ITEMS:
+            self.list_error = f'Ensure this list has no more than {settings.BULK_MAX_ITEMS} items.'
+            return
+        self.list_error = None
+
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                self._error(index, 'non_field_errors', f'Expected an object but got type "{type(item).__name__}".')
+        self.objects = pd.Series([isinstance(item, dict) for item in items], dtype=bool)
+        items = [item if isinstance(item, dict) else {} for item in items]
+        self.fields = (['id'] if partial else []) + list(FIELDS)
+        # Object columns: raw JSON values, pandas doesn't get to turn ints into floats next to a missing one
+        self.values = pd.DataFrame({field: pd.Series([item.get(field) for item in items], dtype=object) for field in self.fields})
+        self.given = pd.DataFrame({field: [field in item for item in items] for field in self.fields}, dtype=bool)
+        self.validate()
+
+    def _error(self, index, field, message):
+        self.errors.setdefault(int(index), {}).setdefault(field, []).append(message)
+
+    def _flag(self, field, invalid, message):
+        # message can also be a function of the bad value
+        for index in invalid[invalid].index:
+            self._error(index, field, message(self.values.at[index, field]) if callable(message) else message)
+
+    def _present(self, field):
+        return self.given[field] & self.values[field].notna()
+
+    def validate(self):
+        for field in self.fields:
+            if field == 'id' or not self.partial:
+                self._flag(field, self.objects & ~self.given[field], 'This field is required.')
+            self._flag(field, self.given[field] & self.values[field].isna(), 'This field may not be null.')
+
+        self.vendor = self.values['vendor'].astype('string').str.strip()
+        self._flag('vendor', self._present('vendor') & self.vendor.eq('').fillna(False), 'This field may not be blank.')
+        self._flag(
+            'vendor',
+            self._present('vendor') & self.vendor.str.len().gt(VENDOR_MAX_LENGTH).fillna(False),
+            f'Ensure this field has no more than {VENDOR_MAX_LENGTH} characters.'
+        )
+
+        # Exact cents straight from the digits, no float rounding in between
+        parts = self.values['amount'].astype('string').str.strip().str.extract(f'^{AMOUNT_PATTERN}$')
+        whole = pd.to_numeric(parts[1], errors='coerce', dtype_backend='numpy_nullable')
+        fraction = pd.to_numeric(parts[2].fillna('').str.ljust(2, '0'), errors='coerce', dtype_backend='numpy_nullable')
+        self._flag('amount', self._present('amount') & whole.isna(), 'A valid number with at most 2 decimal places is required.')
+        cents = (whole * 100 + fraction).astype('Int64')
+        self.cents = cents.where(parts[0].ne('-').fillna(True), -cents)
+
+        self.dates = pd.to_datetime(self.values['date'].astype('string'), format='%Y-%m-%d', errors='coerce')
+        self._flag(
+            'date',
+            self._present('date') & self.dates.isna(),
+            'Date has wrong format. Use one of these formats instead: YYYY-MM-DD.'
+        )
+
+        self.categories = self._pks('category', Category.objects.all())
+        self.category_names = dict(Category.objects.filter(id__in=self.categories.dropna().unique().tolist()).values_list('id', 'category_name'))
+        self.uploads = self._pks('transaction_upload', TransactionUploads.objects.all())
+        if self.partial:
+            self.load_existing()
+
+    def _pks(self, field, queryset):
+        """
+            The field as ids (pd.NA where missing/invalid), flagging anything that isn't the id of a row in queryset
+        """
+        text = self.values[field].astype('string').str.strip()
+        integer = text.str.fullmatch(r'\d+').fillna(False)
+        self._flag(field, self._present(field) & ~integer, lambda value: f'Incorrect type. Expected pk value, received {type(value).__name__}.')
+        pks = pd.to_numeric(text.where(integer), errors='coerce').astype('Int64')
+        found = set(queryset.filter(id__in=pks.dropna().unique().tolist()).values_list('id', flat=True))
+        self._flag(field, pks.notna() & ~pks.isin(found), lambda value: f'Invalid pk "{value}" - object does not exist.')
+        return pks
+
+    def load_existing(self):
+        """
+            The transactions being patched as they are now: what they count for before the change (TransactionRows)
+            + the value of every field the item leaves out
+        """
+        ids = self._pks('id', Transactions.objects.all())
+        self._flag('id', ids.notna() & ids.duplicated(keep=False), 'Duplicate id in this batch.')
+        existing = pd.DataFrame(
+            list(
+                Transactions.objects.filter(id__in=ids.dropna().unique().tolist())
+                .values_list('id', 'transaction_upload_id', 'category_id', 'category__category_name', 'vendor_id', 'vendor__name', 'amount', 'date')
+            ),
+            columns=['id', 'upload_id', 'category_id', 'category_name', 'vendor_id', 'vendor', 'amount', 'date']
+        ).set_index('id')
+        self.category_names.update(zip(existing['category_id'].tolist(), existing['category_name'].tolist()))
+        existing['date'] = pd.to_datetime(existing['date'])
+        old = existing.reindex(ids)
+        old.index = self.values.index
+        self.ids = ids
+        self.old = old
+
+        # Whatever wasn't sent stays as it was
+        self.vendor = self.vendor.where(self.given['vendor'], old['vendor'])
+        old_cents = pd.array([None if pd.isna(amount) else _cents(amount) for amount in old['amount'].tolist()], dtype='Int64')
+        self.cents = self.cents.where(self.given['amount'], pd.Series(old_cents, index=old.index))
+        self.dates = self.dates.where(self.given['date'], old['date'])
+        self.categories = self.categories.where(self.given['category'], old['category_id'].astype('Int64'))
+        self.uploads = self.uploads.where(self.given['transaction_upload'], old['upload_id'].astype('Int64'))
+
+    def error_report(self):
+        if self.list_error:
+            return {'non_field_errors': [self.list_error]}
+        return {'errors': [{'index': index, 'errors': errors} for index, errors in sorted(self.errors.items())]}
+
+    def rows(self):
+        """
+            TransactionRow of every item (once there are no errors) as it'll be stored
+
+            Vendors we've never seen are created here, call it inside the atomic block of the write
+        """
+        vendor_ids = resolve_vendor_ids(self.vendor.unique().tolist())
+        return [
+            TransactionRow(upload_id, category_id, self.category_names[category_id], vendor_ids[vendor], vendor, cents, day)
+            for upload_id, category_id, vendor, cents, day in zip(
+                self.uploads.tolist(), self.categories.tolist(), self.vendor.tolist(), self.cents.tolist(), self.dates.dt.date.tolist()
+            )
+        ]
+
+    def old_rows(self):
+        old = self.old
+        return [
+            TransactionRow(upload_id, category_id, category_name, vendor_id, vendor, _cents(amount), day)
+            for upload_id, category_id, category_name, vendor_id, vendor, amount, day in zip(
+                old['upload_id'].tolist(), old['category_id'].tolist(), old['category_name'].tolist(),
+                old['vendor_id'].tolist(), old['vendor'].tolist(), old['amount'].tolist(), old['date'].dt.date.tolist()
+            )
+        ]
+
+    def create(self):
+        """
+            Inserts every item with bulk_create, returns their ids
+        """
+        with transaction.atomic():
+            rows = self.rows()
+            transactions = [_transaction(row) for row in rows]
+            Transactions.objects.bulk_create(transactions, batch_size=BULK_BATCH_SIZE)
+            transactions_changed(added=rows)
+        return [instance.id for instance in transactions]
+
+    def update(self):
+        """
+            Writes every item with one bulk_update (only the fields any item sent), returns how many were updated
+
+            Run the validation and this in the same atomic block so the rows we take back out of the
+            summaries/rollups are still the rows in the database
+        """
+        fields = [FIELDS[field] for field in FIELDS if self.given[field].any()]
+        with transaction.atomic():
+            rows = self.rows()
+            transactions = [_transaction(row, id=id) for row, id in zip(rows, self.ids.tolist())]
+            if fields:
+                Transactions.objects.bulk_update(transactions, fields, batch_size=BULK_BATCH_SIZE)
+                transactions_changed(added=rows, removed=self.old_rows())
+        return len(transactions)
+
+
+def _cents(amount):
+    return int(amount.scaleb(2))
+
+
+def _transaction(row, **kwargs):
+    return Transactions(
+        vendor_id=row.vendor_id,
+        amount=Decimal(row.cents).scaleb(-2),
+        date=row.date,
+        category_id=row.category_id,
+        transaction_upload_id=row.upload_id,
+        **kwargs
+    )
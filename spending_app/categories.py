@@ -0,0 +1,22 @@
+from .dimensions import NameResolver
+from .models import Category
+from .responsecache import bump_versions
+
+# category_name -> id for every category this process has already looked up or created
+# - Process-local: CategoryViewSet clears it on every write (see clear_category_cache)
+# - Categories created by an upload show up in the cached category list, so it's bumped once they're committed
+_categories = NameResolver(Category, 'category_name', on_create=lambda: bump_versions(categories=True))
+
+
+def clear_category_cache():
+    """
+        Forget every cached name -> id (a category was created, renamed or deleted)
+    """
+    _categories.clear()
+
+
+def resolve_category_ids(category_names):
+    """
+        Maps every category name to its Category id, creating the ones that don't exist yet (see NameResolver)
+    """
+    return _categories.resolve(category_names)
@@ -0,0 +1,94 @@
+from collections import namedtuple
+from django.db import transaction
+from . import rollups
+from .reports import invalidate_reports
+from .responsecache import bump_versions
+from .snapshots import mark_stale, remove_snapshots
+from .summaries import apply_transaction_changes, rebuild_summaries, to_cents
+
+# What a single Transaction contributes to the precomputed tables (UploadSummary + daily rollups)
+# (the names are what summaries are keyed by, the ids what the rollups are)
+TransactionRow = namedtuple('TransactionRow', ['upload_id', 'category_id', 'category_name', 'vendor_id', 'vendor', 'cents', 'date'])
+
+
+def transaction_row(instance):
+    """
+        Grab this before saving an edit/delete so we know what to take back out
+    """
+    return TransactionRow(
+        instance.transaction_upload_id,
+        instance.category_id,
+        instance.category.category_name,
+        instance.vendor_id,
+        instance.vendor.name,
+        to_cents(instance.amount),
+        instance.date
+    )
+
+
+def transactions_changed(added=(), removed=()):
+    """
+        Keeps every precomputed table in sync after Transactions were created, edited or deleted
+
+        added/removed: TransactionRows, an edit is the old row removed + the new row added
+        Call this inside the same atomic block as the write
+    """
+    with transaction.atomic():
+        apply_transaction_changes(added=added, removed=removed)
+        rollups.apply_rows(added=added, removed=removed)
+        upload_ids = {row.upload_id for row in (*added, *removed)}
+        mark_stale(upload_ids)
+        bump_versions(upload_ids=upload_ids, category_ids={row.category_id for row in (*added, *removed)})
+        # Cached PDFs of these uploads are out of date (only once the write actually committed)
+        transaction.on_commit(lambda: invalidate_reports(upload_ids))
+
+
+def delete_category(category):
+    """
+        Deleting a Category cascades to its Transactions, so everything built from them has to follow
+    """
+    with transaction.atomic():
+        upload_ids = set(category.transactions.values_list('transaction_upload_id', flat=True).distinct())
+        # Category rollups go away with the cascade, vendor rollups have to be taken back out
+        rollups.remove_transactions(category.transactions.all())
+        slug = category.slug
+        category.delete()
+        mark_stale(upload_ids)
+        bump_versions(upload_ids=upload_ids, category_slugs=[slug], categories=True)
+        rebuild_summaries(upload_ids)
+        transaction.on_commit(lambda: invalidate_reports(upload_ids))
+
+
+def delete_transactions(queryset):
+    """
+        Deletes a filtered set of Transactions with one DELETE, everything built from them follows
+
+        Like delete_category: rollups are taken back out grouped in SQL and summaries are rebuilt,
+        no rows are ever loaded into Python. Returns how many were deleted
+    """
+    queryset = queryset.order_by()
+    with transaction.atomic():
+        upload_ids = set(queryset.values_list('transaction_upload_id', flat=True).distinct())
+        category_ids = set(queryset.values_list('category_id', flat=True).distinct())
+        rollups.remove_transactions(queryset)
+        deleted, _ = queryset.delete()
+        mark_stale(upload_ids)
+        bump_versions(upload_ids=upload_ids, category_ids=category_ids)
+        rebuild_summaries(upload_ids)
+        transaction.on_commit(lambda: invalidate_reports(upload_ids))
+    return deleted
+
+
+def delete_upload(upload):
+    """
+        Removes an upload with all of its Transactions (the summary cascades with it)
+    """
+    with transaction.atomic():
+        upload_id = upload.id
+        # Every category page listing one of its transactions changes too
+        category_ids = list(upload.transactions.values_list('category_id', flat=True).distinct())
+        bump_versions(upload_ids=[upload_id], category_ids=category_ids)
+        rollups.delete_upload_transactions(upload)
+        upload.delete()
+        transaction.on_commit(lambda: invalidate_reports([upload_id]))
+        transaction.on_commit(lambda: remove_snapshots(upload_id))
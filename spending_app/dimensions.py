@@ -0,0 +1,92 @@
+from django.db import IntegrityError, transaction
+import threading
+
+# Names per lookup query, well under SQLite's limit on query parameters
+LOOKUP_BATCH_SIZE = 5000
+
+
+class NameResolver:
+    """
+        name -> id of a dimension table (Category, Vendor: a unique name + slug) for every name this process
+        has already looked up or created
+
+        - Upload jobs run in threads, hence the lock
+        - Process-local: whoever renames or deletes rows has to clear() it
+        - on_create() runs once a transaction that inserted new rows commits (cached lists of them are out of date)
+    """
+    def __init__(self, model, name_field, on_create=None):
+        self.model = model
+        self.name_field = name_field
+        self.on_create = on_create
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """
+            Forget every cached name -> id (a row was created, renamed or deleted)
+        """
+        with self._lock:
+            self._ids.clear()
+
+    def _cache(self, ids):
+        with self._lock:
+            self._ids.update(ids)
+
+    def _lookup(self, names):
+        names = list(names)
+        found = {}
+        for start in range(0, len(names), LOOKUP_BATCH_SIZE):
+            batch = names[start:start + LOOKUP_BATCH_SIZE]
+            found.update(self.model.objects.filter(**{f'{self.name_field}__in': batch}).values_list(self.name_field, 'id'))
+        return found
+
+    def _create(self, names):
+        """
+            Inserts every name in one bulk INSERT (slugs are picked with one or two queries, see UniqueSlugMixin)
+        """
+        slugs = self.model.generate_slugs(names)
+        rows = self.model.objects.bulk_create([
+            self.model(**{self.name_field: name, 'slug': slugs[name]}) for name in names
+        ])
+        created = {getattr(row, self.name_field): row.id for row in rows}
+        if None in created.values():
+            # Backend can't hand back ids from a bulk insert, look them up instead
+            created = self._lookup(names)
+        if self.on_create:
+            # Registered inside the savepoint, a collision that rolls the INSERT back drops it too
+            transaction.on_commit(self.on_create)
+        return created
+
+    def resolve(self, names):
+        """
+            Maps every name to its id, creating the ones that don't exist yet
+
+            - Names we've seen before come straight from the cache (no query)
+            - One query for the names we haven't, one bulk INSERT for the ones that are brand new
+            - Another upload may create the same name at the same time: the unique name makes our
+              INSERT fail, so we clear the cache and look everything up again
+        """
+        names = set(names)
+        with self._lock:
+            ids = {name: self._ids[name] for name in names if name in self._ids}
+        missing = names - ids.keys()
+        if not missing:
+            return ids
+
+        for attempt in range(2):
+            found = self._lookup(missing)
+            new_names = missing - found.keys()
+            try:
+                # Savepoint, so a collision doesn't break the caller's atomic block
+                with transaction.atomic():
+                    found.update(self._create(new_names) if new_names else {})
+                break
+            except IntegrityError:
+                if attempt:
+                    raise
+                self.clear()
+
+        # Only cache once it's committed, a rolled back chunk would leave us with ids that don't exist
+        transaction.on_commit(lambda: self._cache(found))
+        ids.update(found)
+        return ids
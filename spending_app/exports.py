@@ -0,0 +1,126 @@
+from asgiref.sync import sync_to_async
+from io import StringIO
+from itertools import islice
+import csv
+import json
+
+# Rows are sent to the client in pieces of roughly this many characters instead of one write per row
+STREAM_BUFFER_SIZE = 64 * 1024
+# How many rows the database cursor hands us at a time
+ITERATOR_CHUNK_SIZE = 2000
+
+# Same layout as the upload CSV, so an export can be uploaded again as-is
+CSV_HEADER = ['Date', 'Vendor', 'Category', 'Amount']
+
+
+def export_rows(queryset):
+    """
+        Plain tuples straight from the database cursor, nothing is cached on the queryset
+    """
+    return queryset.order_by('date', 'id').values_list(
+        'id', 'transaction_upload_id', 'date', 'vendor__name', 'category__category_name', 'amount'
+    )
+
+
+def csv_writer(buffer):
+    """
+        Writes the header, returns write_row(row) for the rows of export_rows: Date,Vendor,Category,Amount
+    """
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+
+    def write_row(row):
+        _, _, day, vendor, category, amount = row
+        writer.writerow([day.isoformat(), vendor, category, amount])
+    return write_row
+
+
+def ndjson_writer(buffer):
+    """
+        write_row(row) for the rows of export_rows: newline delimited JSON, one object per line
+    """
+    def write_row(row):
+        pk, upload_id, day, vendor, category, amount = row
+        buffer.write(json.dumps({
+            'id': pk,
+            'upload_id': upload_id,
+            'date': day.isoformat(),
+            'vendor': vendor,
+            'category': category,
+            'amount': str(amount)
+        }))
+        buffer.write('\n')
+    return write_row
+
+
+class StreamBuffer(StringIO):
+    """
+        What was written since the last take(), handed out every STREAM_BUFFER_SIZE characters
+
+        The very first piece goes out right away so the client gets its first byte quickly
+    """
+    first = True
+
+    def take(self, flush=False):
+        if not self.tell() or not (flush or self.first or self.tell() >= STREAM_BUFFER_SIZE):
+            return None
+        piece = self.getvalue()
+        self.seek(0)
+        self.truncate()
+        self.first = False
+        return piece
+
+
+def stream_rows(queryset, writer):
+    """
+        Yields the transactions formatted by writer (csv_writer/ndjson_writer), for WSGI
+    """
+    buffer = StreamBuffer()
+    write_row = writer(buffer)
+    for row in export_rows(queryset).iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+        write_row(row)
+        piece = buffer.take()
+        if piece:
+            yield piece
+    piece = buffer.take(flush=True)
+    if piece:
+        yield piece
+
+
+async def astream_rows(queryset, writer):
+    """
+        Same as stream_rows as an async generator, for ASGI
+
+        Django would have to turn a sync iterator into a list before sending the first byte under ASGI,
+        this one is consumed on the event loop one cursor chunk at a time
+        (what aiterator() does, except values_list().aiterator() opens its cursor on the event loop and fails)
+    """
+    buffer = StreamBuffer()
+    write_row = writer(buffer)
+    rows = await sync_to_async(lambda: export_rows(queryset).iterator(chunk_size=ITERATOR_CHUNK_SIZE))()
+    next_rows = sync_to_async(lambda: list(islice(rows, ITERATOR_CHUNK_SIZE)))
+    while chunk := await next_rows():
+        for row in chunk:
+            write_row(row)
+            piece = buffer.take()
+            if piece:
+                yield piece
+    piece = buffer.take(flush=True)
+    if piece:
+        yield piece
+
+
+def stream_csv(queryset):
+    return stream_rows(queryset, csv_writer)
+
+
+def stream_ndjson(queryset):
+    return stream_rows(queryset, ndjson_writer)
+
+
+def astream_csv(queryset):
+    return astream_rows(queryset, csv_writer)
+
+
+def astream_ndjson(queryset):
+    return astream_rows(queryset, ndjson_writer)
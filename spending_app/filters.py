@@ -0,0 +1,37 @@
+from .models import Vendor
+from .vendors import search_vendors
+
+# Above every vendor name starting with a prefix when compared byte by byte (the highest code point there is)
+PREFIX_END = '\U0010ffff'
+
+
+def filter_transactions(queryset, filters):
+    """
+        Narrows down a Transactions queryset with validated TransactionFilterSerializer data
+
+        Every filter lands on an index: upload/category/vendor (each with date, the order we list in), date, amount
+        - Vendor filters find the matching Vendor ids first (a few thousand names instead of every transaction),
+          then the transactions through the (vendor, date) index
+        - vendor_prefix is a range on the unique name index, SQLite's LIKE is case-insensitive and can't use it
+        - vendor_search finds the matching names with the trigram index (see vendors.py)
+    """
+    if filters.get('upload'):
+        queryset = queryset.filter(transaction_upload_id=filters['upload'])
+    if filters.get('category'):
+        queryset = queryset.filter(category__slug=filters['category'])
+    if filters.get('start'):
+        queryset = queryset.filter(date__gte=filters['start'])
+    if filters.get('end'):
+        queryset = queryset.filter(date__lte=filters['end'])
+    if filters.get('min_amount') is not None:
+        queryset = queryset.filter(amount__gte=filters['min_amount'])
+    if filters.get('max_amount') is not None:
+        queryset = queryset.filter(amount__lte=filters['max_amount'])
+    if filters.get('vendor'):
+        queryset = queryset.filter(vendor__in=Vendor.objects.filter(name=filters['vendor']))
+    if filters.get('vendor_prefix'):
+        prefix = filters['vendor_prefix']
+        queryset = queryset.filter(vendor__in=Vendor.objects.filter(name__range=(prefix, prefix + PREFIX_END)))
+    if filters.get('vendor_search'):
+        queryset = queryset.filter(vendor__in=search_vendors(filters['vendor_search']))
+    return queryset
@@ -0,0 +1,70 @@
+from collections import Counter
+from django.db import connection
+from hashlib import blake2b
+from .models import Transactions
+
+
+def row_fingerprint(key, occurrence):
+    """
+        Fingerprint of the n-th (occurrence) row of a file with this date|vendor|cents|category key
+
+        The occurrence keeps two identical coffees on the same day apart, uploading the same rows again
+        gives the same occurrences and so the same fingerprints
+    """
+    # 64 bits stored as a plain integer: a small index and cheap comparisons
+    return int.from_bytes(blake2b(f'{key}#{occurrence}'.encode(), digest_size=8).digest(), 'big', signed=True)
+
+
+class FingerprintCounter:
+    """
+        Fingerprints the rows of one upload chunk by chunk
+
+        Counts how often every (date, vendor, amount, category) showed up in earlier chunks, but only for the dates
+        of the last chunk: statements come in date order (either way), a date that isn't in a chunk has passed
+        - Memory depends on the chunk size + the number of days, not on the size of the file
+        - For date ordered files a row's occurrence number is the same whether the file was read in one chunk or in fifty
+        - A date coming back later (file not in date order) continues after every row that date already had,
+          so two rows of the same file never end up with the same fingerprint
+    """
+    def __init__(self):
+        # key -> rows with it, for the dates still open
+        self.seen = Counter()
+        # date -> rows that date had when it was opened again (0 the first time)
+        self.base = {}
+        # date -> rows that date had so far, one entry per day
+        self.totals = Counter()
+
+    def fingerprints(self, df):
+        """
+            df: parsed chunk (Date, Vendor, Category, Cents), returns one fingerprint per row
+        """
+        dates = df['Date'].astype(str)
+        keys = dates + '|' + df['Vendor'] + '|' + df['Cents'].astype(str) + '|' + df['Category']
+        chunk_dates = set(dates.unique().tolist())
+        self.base = {day: self.base.get(day, self.totals[day]) for day in chunk_dates}
+
+        occurrences = (
+            keys.groupby(keys).cumcount()
+            + keys.map(self.seen).fillna(0).astype('int64')
+            + dates.map(self.base).astype('int64')
+        )
+        self.totals.update(dates.value_counts().to_dict())
+        self.seen.update(keys.value_counts().to_dict())
+        # Dates this chunk didn't have are done
+        self.seen = Counter({key: count for key, count in self.seen.items() if key.split('|', 1)[0] in chunk_dates})
+        return [row_fingerprint(key, occurrence) for key, occurrence in zip(keys.tolist(), occurrences.tolist())]
+
+
+def existing_fingerprints(fingerprints):
+    """
+        Which of these fingerprints are already in the database (anti-join on the fingerprint index)
+
+        As few IN (...) lookups as the backend's parameter limit allows, never one per row
+    """
+    batch_size = connection.features.max_query_params or len(fingerprints) or 1
+    existing = set()
+    for start in range(0, len(fingerprints), batch_size):
+        existing.update(
+            Transactions.objects.filter(fingerprint__in=fingerprints[start:start + batch_size]).values_list('fingerprint', flat=True)
+        )
+    return existing
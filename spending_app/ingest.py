@@ -0,0 +1,184 @@
+from django.conf import settings
+from django.db import transaction
+import threading
+from .categories import resolve_category_ids
+from .fingerprints import FingerprintCounter, existing_fingerprints
+from .metrics import span
+from .models import Transactions
+from .parsepool import parse_in_pool, read_spool, remove_spool
+from .parsing import StatementParser, read_chunks
+from .responsecache import bump_versions
+from .snapshots import SnapshotWriter
+from .summaries import SummaryBuilder
+from .vendors import resolve_vendor_ids
+from . import rollups
+
+# How many Transactions we hand to the database per INSERT
+# - Django will shrink this further if the backend has a lower parameter limit (SQLite)
+BULK_BATCH_SIZE = 5000
+
+# SQLite has a single writer: upload jobs of this process take turns per chunk instead of piling up
+# on the database lock (parsing, the slow part, happens outside of it)
+_write_lock = threading.Lock()
+
+
+def write_chunk(df, rejected, upload, batch_size=BULK_BATCH_SIZE):
+    """
+        Inserts one parsed + fingerprinted chunk (see ingest_chunks), the database half of ingesting it
+
+        - Rows we already have (same fingerprint, see fingerprints.py) are skipped, so overlapping
+          statements don't count the same purchase twice
+
+        Returns the number of rows inserted, rejected, skipped + the valid rows that were inserted
+    """
+    # One set based lookup for the whole chunk instead of checking row by row
+    duplicates = df['fingerprint'].isin(existing_fingerprints(df['fingerprint'].tolist()))
+    skipped = int(duplicates.sum())
+    if skipped:
+        df = df[~duplicates]
+
+    # Cached name -> id, usually only the first chunk of an upload actually queries categories/vendors
+    category_ids = resolve_category_ids(df['Category'].unique())
+    vendor_ids = resolve_vendor_ids(df['Vendor'].unique())
+    # Map names -> ids for the whole column at once instead of looking them up row by row
+    df = df.assign(category_id=df['Category'].map(category_ids), vendor_id=df['Vendor'].map(vendor_ids))
+
+    transactions = [
+        Transactions(
+            vendor_id=vendor_id,
+            amount=amount,
+            date=date,
+            category_id=category_id,
+            fingerprint=fingerprint,
+            transaction_upload=upload
+        )
+        for vendor_id, amount, date, category_id, fingerprint in zip(
+            df['vendor_id'].tolist(),
+            df['Amount'].tolist(),
+            df['Date'].tolist(),
+            df['category_id'].tolist(),
+            df['fingerprint'].tolist()
+        )
+    ]
+    Transactions.objects.bulk_create(transactions, batch_size=batch_size)
+    # Daily calendar rollups are kept up to date in the same transaction
+    rollups.add_frame(df)
+    return len(transactions), rejected, skipped, df
+
+
+def ingest_chunks(chunks, upload, batch_size=BULK_BATCH_SIZE, on_progress=None, parser=None):
+    """
+        Parses + inserts every raw DataFrame chunk, one atomic block per chunk (see ingest_parsed)
+
+        Returns the number of Transactions created, rejected, skipped, why rows were rejected + spending per category
+    """
+    parser = parser or StatementParser()
+    fingerprints = FingerprintCounter()
+
+    def parsed():
+        for chunk in chunks:
+            with span('dataframe'):
+                df, rejected = parser.parse(chunk)
+                df = df.assign(fingerprint=fingerprints.fingerprints(df))
+            yield df, rejected
+
+    result = ingest_parsed(parsed(), upload, batch_size=batch_size, on_progress=on_progress)
+    # Lines the CSV reader couldn't split into the header's fields are in the report but not in rows_rejected
+    return {**result, 'rejections': parser.report.as_dict()}
+
+
+def ingest_parsed(parsed, upload, batch_size=BULK_BATCH_SIZE, on_progress=None):
+    """
+        Inserts (parsed + fingerprinted chunk, rows rejected) pairs, one atomic block per chunk
+
+        - Only one chunk lives in memory at a time, the upload's summary (UploadSummary) is added up as we go
+          and its columnar snapshot (snapshots.py) is written as we go
+        - Committing per chunk keeps the database write lock short and lets on_progress(created, rejected, skipped)
+          report progress that other connections can actually see
+        - If anything fails we remove whatever chunks already made it in, so we never keep half a file
+
+        Returns the number of Transactions created, rejected, skipped + spending per category
+    """
+    transactions_created = 0
+    rows_rejected = 0
+    rows_skipped = 0
+    summary = SummaryBuilder()
+    snapshot = SnapshotWriter(upload, upload.snapshot_version)
+    # Categories that got transactions, their cached pages have to go (again) if we end up failing
+    category_ids = set()
+
+    try:
+        for df, rejected in parsed:
+            with _write_lock, transaction.atomic():
+                created, rejected, skipped, inserted = write_chunk(df, rejected, upload, batch_size=batch_size)
+                chunk_categories = set(inserted['category_id'].unique().tolist())
+                bump_versions(upload_ids=[upload.id], category_ids=chunk_categories)
+                category_ids |= chunk_categories
+                if on_progress:
+                    on_progress(created, rejected, skipped)
+            transactions_created += created
+            rows_rejected += rejected
+            rows_skipped += skipped
+            summary.add(inserted)
+            snapshot.add(inserted)
+        summary.save(upload)
+        snapshot.save()
+    except Exception:
+        snapshot.discard()
+        with _write_lock, transaction.atomic():
+            rollups.delete_upload_transactions(upload)
+            bump_versions(upload_ids=[upload.id], category_ids=category_ids)
+        raise
+
+    return {
+        'transactions_created': transactions_created,
+        'rows_rejected': rows_rejected,
+        'rows_skipped': rows_skipped,
+        'spending_summary': summary.spending_per_category()
+    }
+
+
+def ingest_dataframe(df, upload, batch_size=BULK_BATCH_SIZE):
+    """
+        Ingests a DataFrame that is already fully loaded (one single chunk, columns as strings like read_chunks gives)
+    """
+    return ingest_chunks([df], upload, batch_size=batch_size)
+
+
+def ingest_csv(file, upload, chunk_size=None, batch_size=BULK_BATCH_SIZE, on_progress=None):
+    """
+        Streams a CSV (path or file object) through the parser in fixed-size chunks
+
+        Peak memory depends on chunk_size (settings.INGEST_CHUNK_SIZE) rather than on the size of the file
+    """
+    parser = StatementParser()
+    chunks = read_chunks(file, chunk_size or settings.INGEST_CHUNK_SIZE, report=parser.report)
+    return ingest_chunks(chunks, upload, batch_size=batch_size, on_progress=on_progress, parser=parser)
+
+
+def ingest_upload(upload, chunk_size=None, batch_size=BULK_BATCH_SIZE, on_progress=None):
+    """
+        Reads the uploaded CSV file straight from storage and ingests it chunk by chunk
+
+        With PARSE_WORKERS the whole file is parsed in a parse process first (parsepool.py) and this
+        thread only does the writes, jobs of several files parse at the same time
+        - on_progress(0, 0, 0) is our heartbeat while we wait for the parse, nothing was written yet
+        - The parsed chunks' spool goes once we're done with it, whether the writes worked out or not
+        Storages without local paths are parsed right here, like PARSE_WORKERS = 0
+    """
+    chunk_size = chunk_size or settings.INGEST_CHUNK_SIZE
+    if settings.PARSE_WORKERS:
+        try:
+            path = upload.file.path
+        except NotImplementedError:
+            path = None
+        if path:
+            heartbeat = (lambda: on_progress(0, 0, 0)) if on_progress else None
+            spool_path, rejections = parse_in_pool(path, chunk_size, heartbeat=heartbeat)
+            try:
+                result = ingest_parsed(read_spool(spool_path), upload, batch_size=batch_size, on_progress=on_progress)
+            finally:
+                remove_spool(spool_path)
+            return {**result, 'rejections': rejections}
+    with upload.file.open('rb') as file:
+        return ingest_csv(file, upload, chunk_size=chunk_size, batch_size=batch_size, on_progress=on_progress)
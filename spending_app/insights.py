@@ -0,0 +1,193 @@
+from django.conf import settings
+import numpy as np
+import pandas as pd
+from .models import Category, TransactionUploads, Vendor
+from .snapshots import _as_date, get_snapshot
+
+# Billing periods we recognize: name -> (days, how far off an interval may be and still count, calendar step)
+# (the step is what the next charge is expected after, monthly bills stick to their day of the month)
+PERIODS = {
+    'weekly': (7, 1, pd.DateOffset(weeks=1)),
+    'biweekly': (14, 2, pd.DateOffset(weeks=2)),
+    'monthly': (30.44, 3, pd.DateOffset(months=1)),
+    'quarterly': (91.31, 7, pd.DateOffset(months=3)),
+    'yearly': (365.25, 10, pd.DateOffset(years=1)),
+}
+
+# A category that always costs the same has no spread, this much of its average stands in for it
+# (otherwise a single cent more would be an anomaly)
+MIN_SPREAD = 0.1
+
+
+def _dollars(cents):
+    return round(float(cents) / 100, 2)
+
+
+class SpendingColumns:
+    """
+        date (days since 1970-01-01), cents + category/vendor ids of any number of snapshots as flat numpy arrays
+
+        Snapshot codes are per upload, so they're turned into ids first and into codes shared by every
+        upload after (pd.factorize, one hash pass)
+    """
+    def __init__(self, snapshots):
+        snapshots = list(snapshots)
+        self.date = np.concatenate([np.asarray(s.date, dtype='int64') for s in snapshots] or [np.empty(0, 'int64')])
+        self.cents = np.concatenate([np.asarray(s.cents, dtype='int64') for s in snapshots] or [np.empty(0, 'int64')])
+        self.category, self.category_ids = pd.factorize(np.concatenate(
+            [np.asarray(s.category_ids, dtype='int64')[s.category] for s in snapshots] or [np.empty(0, 'int64')]
+        ))
+        self.vendor, self.vendor_ids = pd.factorize(np.concatenate(
+            [np.asarray(s.vendor_ids, dtype='int64')[s.vendor] for s in snapshots] or [np.empty(0, 'int64')]
+        ))
+
+    def __len__(self):
+        return len(self.cents)
+
+
+def find_recurring(columns):
+    """
+        Vendors that charge about the same amount at a regular interval (subscriptions, rent, ...)
+
+        - Rows are sorted by (vendor, date) once, the intervals are the date differences inside a vendor
+        - A vendor's period is its median interval, if that's close to one of PERIODS
+        - regularity: share of the intervals that are on that period, amount_variation: median distance
+          of the amounts from the median amount, relative to it
+        Everything past the sort is a grouped numpy/pandas reduction, O(n log n) overall
+        Returns DataFrame (vendor code, period, interval_days, occurrences, amount cents, amount_variation,
+        regularity, first/last date) of every vendor that qualifies, biggest yearly cost first
+    """
+    order = np.lexsort((columns.date, columns.vendor))
+    vendor, date, cents = columns.vendor[order], columns.date[order], columns.cents[order]
+
+    # Interval between every row and the one before it, as long as it's the same vendor
+    same_vendor = vendor[1:] == vendor[:-1]
+    intervals = pd.DataFrame({'vendor': vendor[1:][same_vendor], 'interval': np.diff(date)[same_vendor]})
+    rows = pd.DataFrame({'vendor': vendor, 'date': date, 'cents': cents})
+
+    per_vendor = rows.groupby('vendor').agg(
+        occurrences=('cents', 'size'), amount=('cents', 'median'), first_date=('date', 'min'), last_date=('date', 'max')
+    )
+    per_vendor = per_vendor[per_vendor['occurrences'] >= settings.RECURRING_MIN_OCCURRENCES]
+    per_vendor = per_vendor.assign(interval_days=intervals.groupby('vendor')['interval'].median())
+
+    # Closest billing period + how far off it may be
+    names = list(PERIODS)
+    days = np.array([PERIODS[name][0] for name in names])
+    tolerances = np.array([PERIODS[name][1] for name in names])
+    closest = np.abs(per_vendor['interval_days'].to_numpy()[:, None] - days).argmin(axis=1)
+    per_vendor = per_vendor.assign(
+        period=np.array(names, dtype=object)[closest], period_days=days[closest], tolerance=tolerances[closest]
+    )
+    per_vendor = per_vendor[np.abs(per_vendor['interval_days'] - per_vendor['period_days']) <= per_vendor['tolerance']]
+
+    periodic = intervals[intervals['vendor'].isin(per_vendor.index)]
+    off_period = np.abs(periodic['interval'] - periodic['vendor'].map(per_vendor['period_days']))
+    on_period = off_period <= periodic['vendor'].map(per_vendor['tolerance'])
+    charges = rows[rows['vendor'].isin(per_vendor.index)]
+    spread = np.abs(charges['cents'] - charges['vendor'].map(per_vendor['amount'])).groupby(charges['vendor']).median()
+    per_vendor = per_vendor.assign(
+        regularity=on_period.groupby(periodic['vendor']).mean(),
+        amount_variation=spread / per_vendor['amount'].abs().where(per_vendor['amount'] != 0),
+        yearly_cents=per_vendor['amount'] * 365.25 / per_vendor['period_days']
+    )
+
+    per_vendor = per_vendor[
+        (per_vendor['regularity'] >= settings.RECURRING_MIN_REGULARITY)
+        & (per_vendor['amount_variation'] <= settings.RECURRING_MAX_AMOUNT_VARIATION)
+    ]
+    return per_vendor.sort_values('yearly_cents', ascending=False, kind='stable')
+
+
+def find_anomalies(columns):
+    """
+        Rows that cost far more than their category usually does (rolling z-score per category)
+
+        - Rows are sorted by (category, date) once
+        - Every row is compared to the ANOMALY_WINDOW rows of its category right before it (itself left out),
+          as soon as there are ANOMALY_MIN_HISTORY of them
+        - Rolling mean/std come from pandas' windowed aggregations, one pass per category instead of a window per row
+        Returns (row positions in columns, z-scores, rolling averages in cents) of the ANALYTICS_MAX_ANOMALIES
+        highest z-scores at or over ANOMALY_Z_SCORE + how many rows were over it
+    """
+    order = np.lexsort((columns.date, columns.category))
+    category = columns.category[order]
+    cents = pd.Series(columns.cents[order], dtype='float64')
+
+    history = cents.groupby(category).shift(1)
+    window = history.groupby(category).rolling(settings.ANOMALY_WINDOW, min_periods=settings.ANOMALY_MIN_HISTORY)
+    # Grouped rolling hands back (category, row) ordered by category, which is how the rows are already sorted
+    mean = window.mean().to_numpy()
+    std = window.std().to_numpy()
+
+    spread = np.fmax(std, MIN_SPREAD * np.abs(mean))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z_scores = (cents.to_numpy() - mean) / spread
+    flagged = np.flatnonzero(z_scores >= settings.ANOMALY_Z_SCORE)
+    top = flagged[np.argsort(-z_scores[flagged], kind='stable')[:settings.ANALYTICS_MAX_ANOMALIES]]
+    return order[top], z_scores[top], mean[top], len(flagged)
+
+
+def _names(model, ids, field):
+    names = model.objects.in_bulk(ids)
+    return {key: getattr(instance, field) for key, instance in names.items()}
+
+
+def spending_insights(columns):
+    """
+        Recurring charges + anomalies of a set of SpendingColumns, as the analytics endpoints return them
+    """
+    if not len(columns):
+        return {'transactions': 0, 'recurring': [], 'anomalies': [], 'anomaly_count': 0}
+
+    recurring = find_recurring(columns)
+    rows, z_scores, means, anomaly_count = find_anomalies(columns)
+
+    # Names of only what we're about to show, one query per dimension
+    vendor_ids = columns.vendor_ids[np.concatenate([recurring.index.to_numpy(dtype='int64'), columns.vendor[rows]])]
+    vendors = _names(Vendor, vendor_ids.tolist(), 'name')
+    categories = _names(Category, columns.category_ids[columns.category[rows]].tolist(), 'category_name')
+
+    return {
+        'transactions': len(columns),
+        'recurring': [
+            {
+                'vendor': vendors[int(columns.vendor_ids[entry.Index])],
+                'period': entry.period,
+                'interval_days': float(entry.interval_days),
+                'occurrences': int(entry.occurrences),
+                'amount': _dollars(entry.amount),
+                'amount_variation': round(float(entry.amount_variation), 4),
+                'regularity': round(float(entry.regularity), 4),
+                'yearly_cost': _dollars(entry.yearly_cents),
+                'first_date': _as_date(entry.first_date),
+                'last_date': _as_date(entry.last_date),
+                'next_date': (pd.Timestamp(_as_date(entry.last_date)) + PERIODS[entry.period][2]).date()
+            }
+            for entry in recurring.itertuples()
+        ],
+        'anomalies': [
+            {
+                'date': _as_date(columns.date[row]),
+                'vendor': vendors[int(columns.vendor_ids[columns.vendor[row]])],
+                'category': categories[int(columns.category_ids[columns.category[row]])],
+                'amount': _dollars(columns.cents[row]),
+                'typical_amount': _dollars(typical),
+                'z_score': round(float(z_score), 2)
+            }
+            for row, z_score, typical in zip(rows, z_scores, means)
+        ],
+        'anomaly_count': anomaly_count
+    }
+
+
+def upload_insights(upload):
+    return spending_insights(SpendingColumns([get_snapshot(upload)]))
+
+
+def all_insights():
+    """
+        Same as upload_insights over every finished upload at once (vendors + categories are shared across uploads)
+    """
+    uploads = TransactionUploads.objects.filter(status=TransactionUploads.Status.DONE).order_by('id')
+    return spending_insights(SpendingColumns(get_snapshot(upload) for upload in uploads))
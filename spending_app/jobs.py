@@ -0,0 +1,194 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .ingest import ingest_upload
+from .metrics import collect, registry
+from .models import TransactionUploads
+from .responsecache import bump_versions
+from . import rollups
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# One pool per process, created the first time someone uploads a file
+_executor = None
+_executor_lock = threading.Lock()
+
+# Uploads a job is (supposed to be) working on
+IN_FLIGHT = [TransactionUploads.Status.PENDING, TransactionUploads.Status.PROCESSING]
+
+
+class UploadSwept(Exception):
+    """
+        The upload was marked failed by recover_stale_uploads while its job was still running
+    """
+
+
+def get_executor():
+    """
+        Local background worker pool for upload jobs (no broker needed)
+
+        - Threads are enough here: pandas + SQLite release the GIL for most of the heavy lifting
+        - Jobs live in this process, an upload that was in flight when the server stopped is left pending/processing
+          until recover_stale_uploads (python manage.py recover_uploads) marks it failed
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.UPLOAD_WORKERS,
+                thread_name_prefix='upload-job'
+            )
+    return _executor
+
+
+def enqueue_upload(upload_id):
+    """
+        Schedules the background ingestion of an upload
+
+        We wait for the upload row to be committed before a worker goes looking for it
+        UPLOAD_JOBS_EAGER runs the job right away in the current thread (handy for tests + scripts)
+    """
+    if settings.UPLOAD_JOBS_EAGER:
+        run_upload_job(upload_id)
+        return
+    transaction.on_commit(lambda: get_executor().submit(run_upload_job, upload_id))
+
+
+def run_upload_job(upload_id):
+    """
+        Parses + inserts an uploaded file, its timings end up in /metrics under the upload_job view
+    """
+    if not settings.METRICS_ENABLED:
+        return process_upload(upload_id)
+    with collect() as metrics:
+        start = time.perf_counter()
+        upload_status = process_upload(upload_id)
+        registry.observe('upload_job', 'JOB', upload_status, time.perf_counter() - start, metrics)
+    return upload_status
+
+
+def process_upload(upload_id):
+    """
+        Parses + inserts an uploaded file while keeping its status/progress up to date, returns the final status
+    """
+    uploads = TransactionUploads.objects.filter(id=upload_id)
+    processing = uploads.filter(status=TransactionUploads.Status.PROCESSING)
+
+    def on_progress(created, rejected, skipped):
+        # Runs inside the chunk's transaction so the counters always match what was committed
+        updated = processing.update(
+            rows_processed=F('rows_processed') + created,
+            rows_rejected=F('rows_rejected') + rejected,
+            rows_skipped=F('rows_skipped') + skipped,
+            heartbeat_at=timezone.now()
+        )
+        if not updated:
+            # Swept as stale while we were parsing, this chunk is rolled back and we stop here
+            raise UploadSwept('The upload was marked failed while it was being processed.')
+
+    if not settings.UPLOAD_JOBS_EAGER:
+        close_old_connections()
+    try:
+        now = timezone.now()
+        if not uploads.filter(status=TransactionUploads.Status.PENDING).update(
+            status=TransactionUploads.Status.PROCESSING, started_at=now, heartbeat_at=now
+        ):
+            # Swept (or deleted) before a worker got to it
+            return TransactionUploads.Status.FAILED
+        upload = uploads.get()
+        result = ingest_upload(upload, on_progress=on_progress)
+        with transaction.atomic():
+            if not processing.update(status=TransactionUploads.Status.DONE, finished_at=timezone.now(), rejections=result['rejections']):
+                raise UploadSwept('The upload was marked failed while it was being processed.')
+            # The summary goes from 409 to the real thing
+            bump_versions(upload_ids=[upload_id])
+        return TransactionUploads.Status.DONE
+    except UploadSwept:
+        # recover_stale_uploads already failed it and cleaned up after us
+        logger.warning('Upload %s was marked failed while it was being processed', upload_id)
+        return TransactionUploads.Status.FAILED
+    except Exception as e:
+        logger.exception('Upload %s failed', upload_id)
+        _fail_upload(upload_id, IN_FLIGHT, str(e))
+        return TransactionUploads.Status.FAILED
+    finally:
+        # Worker threads get their own connection, don't leave it hanging around
+        if not settings.UPLOAD_JOBS_EAGER:
+            connection.close()
+
+
+def _fail_upload(upload_id, statuses, error):
+    """
+        Marks an upload failed if it's still in one of statuses, and takes the chunks its job already
+        committed back out (transactions, rollups, cached responses), returns whether it did
+
+        Counters go back to 0 so they match what's left of it: nothing
+    """
+    with transaction.atomic():
+        failed = TransactionUploads.objects.filter(id=upload_id, status__in=statuses).update(
+            status=TransactionUploads.Status.FAILED,
+            finished_at=timezone.now(),
+            rows_processed=0,
+            rows_rejected=0,
+            rows_skipped=0,
+            error=error
+        )
+        if not failed:
+            return False
+        upload = TransactionUploads(id=upload_id)
+        category_ids = list(upload.transactions.values_list('category_id', flat=True).distinct())
+        rollups.delete_upload_transactions(upload)
+        bump_versions(upload_ids=[upload_id], category_ids=category_ids)
+    return True
+
+
+def _cutoff(timeout=None):
+    return timezone.now() - timedelta(seconds=settings.UPLOAD_JOB_TIMEOUT if timeout is None else timeout)
+
+
+def _with_last_seen(uploads):
+    # Pending uploads haven't been picked up yet, they count from when they were uploaded
+    return uploads.annotate(last_seen=Coalesce('heartbeat_at', 'uploaded_at'))
+
+
+def current_uploads():
+    """
+        Done uploads + the ones whose job is still alive (failed + stale ones can be uploaded again)
+    """
+    return _with_last_seen(TransactionUploads.objects.all()).filter(
+        Q(status=TransactionUploads.Status.DONE) | Q(status__in=IN_FLIGHT, last_seen__gte=_cutoff())
+    )
+
+
+def stale_uploads(timeout=None):
+    """
+        Pending/processing uploads whose job hasn't shown a sign of life for timeout seconds (UPLOAD_JOB_TIMEOUT)
+
+        The process running it went away (restart, crash, deploy): nobody is ever going to finish them
+    """
+    return _with_last_seen(TransactionUploads.objects.filter(status__in=IN_FLIGHT)).filter(last_seen__lt=_cutoff(timeout))
+
+
+def recover_stale_uploads(timeout=None, content_hash=None):
+    """
+        Marks every stale upload (only those of one file, given its content_hash) failed and takes the chunks
+        its job already committed back out (transactions, rollups, cached responses), returns their ids
+
+        A job that was only quiet (not gone) notices at its next chunk and stops (UploadSwept)
+    """
+    error = 'The upload job stopped before it finished, please upload the file again.'
+    uploads = stale_uploads(timeout)
+    if content_hash is not None:
+        uploads = uploads.filter(content_hash=content_hash)
+    # The job may have finished (or another sweep got there) since we looked
+    return [
+        upload.id for upload in uploads.order_by('id')
+        if _fail_upload(upload.id, [upload.status], error)
+    ]
@@ -0,0 +1,180 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+# Worker processes are spawned fresh, so nothing in this module may touch models at import time
+
+
+def _worker(kind, job, ready, start, results):
+    """
+        One simulated web worker: its own process + its own database connection, like a gunicorn worker
+
+        kind 'upload' ingests job['path'], kind 'read' makes job['reads'] API calls
+    """
+    import django
+    django.setup()
+    from django.db import connection
+    from django.test import Client
+
+    ready.put(os.getpid())
+    start.wait()
+    try:
+        if kind == 'upload':
+            results.put(_upload(job))
+        else:
+            results.put(_read(job, Client(HTTP_HOST=job['host'])))
+    finally:
+        connection.close()
+
+
+def _upload(job):
+    from spending_app.ingest import ingest_csv
+    from spending_app.models import TransactionUploads
+
+    begin = time.perf_counter()
+    upload_id = None
+    try:
+        upload = TransactionUploads.objects.create(file=job['file'], status=TransactionUploads.Status.DONE)
+        upload_id = upload.id
+        rows = ingest_csv(job['path'], upload)['transactions_created']
+        return {'kind': 'upload', 'upload_id': upload_id, 'rows': rows, 'seconds': time.perf_counter() - begin, 'errors': []}
+    except Exception as e:
+        # "database is locked" is exactly what we're here to count
+        return {'kind': 'upload', 'upload_id': upload_id, 'rows': 0, 'seconds': time.perf_counter() - begin, 'errors': [str(e)]}
+
+
+def _read(job, client):
+    timings, errors = [], []
+    urls = ['/transactions/?page_size=100', '/analytics/timeseries/?granularity=month']
+    if job['summary_url']:
+        urls.append(job['summary_url'])
+    for i in range(job['reads']):
+        url = urls[i % len(urls)]
+        begin = time.perf_counter()
+        try:
+            response = client.get(url)
+            if response.status_code != 200:
+                errors.append(f'GET {url} answered {response.status_code}')
+        except Exception as e:
+            errors.append(str(e))
+        timings.append(time.perf_counter() - begin)
+    return {'kind': 'read', 'timings': timings, 'errors': errors}
+
+
+class Command(BaseCommand):
+    """
+        Upload + read throughput as the number of concurrent workers grows
+
+        - Every worker is its own process with its own connection to the real database file, like gunicorn workers
+        - upload: N workers ingest a synthetic statement at the same time (rows/sec across all of them)
+        - read: N workers hit the transaction list, time series + summary (requests/sec, latency)
+        - mixed: half upload while the other half reads (where a plain SQLite file starts answering "database is locked")
+        - Uploads made by the benchmark are deleted again at the end
+
+        DATABASE_PROFILE=concurrent python manage.py benchmark_concurrency --workers 1 2 4 8
+    """
+    help = 'Measures upload/read throughput with 1..N concurrent worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+        parser.add_argument('--rows', type=int, default=20000, help='Rows per uploaded statement')
+        parser.add_argument('--reads', type=int, default=50, help='Requests per reading worker')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default=None, help='Also write the results as JSON')
+
+    def handle(self, *args, **options):
+        from spending_app.synthetic import write_statement
+
+        self.options = options
+        self.context = multiprocessing.get_context('spawn')
+        self.upload_ids = []
+        self.host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost')
+        results = []
+
+        self.stdout.write(f"Database profile: {settings.DATABASE_PROFILE}, chunk size {settings.INGEST_CHUNK_SIZE}")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            statements = iter(range(options['seed'], options['seed'] + 10 ** 6))
+
+            def upload_job():
+                # A new statement every time (generated before the clock starts), the same one twice would
+                # only be skipped as duplicates
+                seed = next(statements)
+                path = write_statement(os.path.join(tmp_dir, f'statement-{seed}.csv'), options['rows'], seed=seed)
+                return 'upload', {'path': path, 'file': f'transaction_uploads/benchmark-concurrency-{seed}.csv'}
+
+            try:
+                for workers in options['workers']:
+                    results.append(self.run_phase('upload', [upload_job() for _ in range(workers)]))
+                    results.append(self.run_phase('read', [self.read_job() for _ in range(workers)]))
+                    if workers > 1:
+                        uploaders = workers // 2
+                        jobs = [upload_job() for _ in range(uploaders)] + [self.read_job() for _ in range(workers - uploaders)]
+                        results.append(self.run_phase('mixed', jobs))
+            finally:
+                self.cleanup()
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump({'profile': settings.DATABASE_PROFILE, 'options': options, 'results': results}, file, indent=2, default=str)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def read_job(self):
+        from spending_app.models import TransactionUploads
+
+        upload = TransactionUploads.objects.filter(status=TransactionUploads.Status.DONE).order_by('-id').first()
+        return 'read', {
+            'host': self.host,
+            'reads': self.options['reads'],
+            'summary_url': f'/uploads/{upload.id}/summary/' if upload else None
+        }
+
+    def run_phase(self, phase, jobs):
+        ready, results = self.context.Queue(), self.context.Queue()
+        start = self.context.Event()
+        processes = [self.context.Process(target=_worker, args=(kind, job, ready, start, results)) for kind, job in jobs]
+        for process in processes:
+            process.start()
+        # Django boots in every process first, the clock only starts once all of them are ready
+        for _ in processes:
+            ready.get()
+        begin = time.perf_counter()
+        start.set()
+        outcomes = [results.get() for _ in processes]
+        elapsed = time.perf_counter() - begin
+        for process in processes:
+            process.join()
+
+        uploads = [outcome for outcome in outcomes if outcome['kind'] == 'upload']
+        reads = [outcome for outcome in outcomes if outcome['kind'] == 'read']
+        self.upload_ids += [outcome['upload_id'] for outcome in uploads if outcome['upload_id']]
+        timings = sorted(timing for outcome in reads for timing in outcome['timings'])
+        errors = [error for outcome in outcomes for error in outcome['errors']]
+
+        result = {'phase': phase, 'workers': len(jobs), 'seconds': round(elapsed, 3), 'errors': len(errors)}
+        message = f"{phase:>6} x{len(jobs)}: {elapsed:.2f}s"
+        if uploads:
+            rows = sum(outcome['rows'] for outcome in uploads)
+            result['upload_rows_per_sec'] = round(rows / elapsed)
+            message += f", {result['upload_rows_per_sec']:,} rows/sec"
+        if timings:
+            result['reads_per_sec'] = round(len(timings) / elapsed, 1)
+            result['read_p50_ms'] = round(timings[len(timings) // 2] * 1000, 1)
+            result['read_p95_ms'] = round(timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000, 1)
+            message += f", {result['reads_per_sec']} reads/sec (p50 {result['read_p50_ms']}ms, p95 {result['read_p95_ms']}ms)"
+        message += f", {len(errors)} errors"
+        if errors:
+            result['first_error'] = errors[0]
+            message += f" ({errors[0]})"
+        self.stdout.write(message)
+        return result
+
+    def cleanup(self):
+        from spending_app.changes import delete_upload
+        from spending_app.models import TransactionUploads
+
+        for upload in TransactionUploads.objects.filter(id__in=self.upload_ids):
+            delete_upload(upload)
@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.conf import settings
+from spending_app.ingest import ingest_csv
+from spending_app.models import TransactionUploads
+from spending_app.snapshots import remove_snapshots
+import pandas as pd
+import os
+import tempfile
+import time
+import tracemalloc
+
+
+class Command(BaseCommand):
+    """
+        Rows-per-second benchmark for our CSV ingestion
+
+        - Repeats a CSV in our upload format (Date,Vendor,Category,Amount) until we hit --rows
+        - The rows go through the same streaming path as a real upload (read_csv in chunks)
+        - Everything is rolled back afterwards so the database is left untouched
+
+        python manage.py benchmark_ingest --rows 200000 --chunk-size 50000 --trace-memory
+    """
+    help = 'Measures how many CSV rows per second the upload ingestion can insert'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--csv', default=os.path.join(settings.BASE_DIR, 'sample_transactions.csv'))
+        parser.add_argument('--rows', type=int, default=200000)
+        parser.add_argument('--repeat', type=int, default=1)
+        parser.add_argument('--chunk-size', type=int, default=settings.INGEST_CHUNK_SIZE)
+        # tracemalloc slows everything down so only turn it on when we care about memory
+        parser.add_argument('--trace-memory', action='store_true')
+
+    def handle(self, *args, **options):
+        sample = pd.read_csv(options['csv'])
+        copies = -(-options['rows'] // len(sample))     # Ceiling division
+
+        with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as tmp:
+            csv_path = tmp.name
+        try:
+            pd.concat([sample] * copies, ignore_index=True).head(options['rows']).to_csv(csv_path, index=False)
+
+            for run in range(1, options['repeat'] + 1):
+                self.run_once(run, csv_path, options)
+        finally:
+            os.remove(csv_path)
+
+    def run_once(self, run, csv_path, options):
+        if options['trace_memory']:
+            tracemalloc.start()
+
+        with transaction.atomic():
+            upload = TransactionUploads.objects.create(file='transaction_uploads/benchmark.csv')
+            start = time.perf_counter()
+            result = ingest_csv(csv_path, upload, chunk_size=options['chunk_size'])
+            elapsed = time.perf_counter() - start
+            # Throw away everything we just inserted
+            transaction.set_rollback(True)
+        # The rows are rolled back, the snapshot files ingest wrote aren't
+        remove_snapshots(upload.id)
+
+        rows = result['transactions_created']
+        message = f"Run {run}: {rows} rows in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/sec)"
+        if options['trace_memory']:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            message += f", peak memory {peak / 1024 / 1024:.1f} MiB"
+        self.stdout.write(message)
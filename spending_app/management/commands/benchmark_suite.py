@@ -0,0 +1,235 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from spending_app.ingest import ingest_csv
+from spending_app.models import Category, TransactionUploads
+from spending_app.reports import render_report, report_context
+from spending_app.responsecache import bump_versions
+from spending_app.snapshots import remove_snapshots
+from spending_app.summaries import get_upload_summary
+from spending_app.synthetic import write_statement
+import django
+import json
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from urllib.parse import urlencode
+
+
+def percentiles(timings):
+    # Milliseconds, nearest rank
+    ordered = sorted(timings)
+
+    def rank(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000, 3)
+
+    return {
+        'min': round(ordered[0] * 1000, 3),
+        'p50': rank(50),
+        'p95': rank(95),
+        'p99': rank(99),
+        'max': round(ordered[-1] * 1000, 3),
+        'mean': round(sum(ordered) / len(ordered) * 1000, 3)
+    }
+
+
+def peak_rss_mib():
+    # High water mark of the whole process (Linux reports KiB)
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+class Command(BaseCommand):
+    """
+        Benchmarks the main entry points against seeded synthetic statements (spending_app/synthetic.py)
+
+        - ingest: rows/sec for every --sizes statement
+        - summary, transaction list, category retrieve, PDF render: latency percentiles over --iterations
+        - Endpoints behind the response cache are measured twice: cold (their versions are bumped before
+          every request, so every one builds its response) and warm (every request is a cache hit)
+        - Every result has its query count + peak memory, all of it goes into a JSON file (--output)
+          so runs can be diffed against each other
+        - Everything runs inside one transaction that is rolled back at the end (unless --keep)
+
+        python manage.py benchmark_suite --sizes 1000 100000 --iterations 20
+    """
+    help = 'Times uploads, summaries, listing, category retrieve + PDF rendering on synthetic data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--vendors', type=int, default=2000)
+        parser.add_argument('--pages', type=int, default=10, help='How many pages of /transactions/ to walk per iteration')
+        parser.add_argument('--output', default=None)
+        parser.add_argument('--keep', action='store_true', help="Keep the synthetic uploads instead of rolling back")
+        # tracemalloc slows everything down so only turn it on when we care about Python allocations
+        parser.add_argument('--trace-memory', action='store_true')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.results = []
+        self.upload_ids = []
+        # The test client talks to our URLs in process, same connection so it sees the uncommitted data
+        host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost')
+        self.client = Client(HTTP_HOST=host)
+        started_at = timezone.now()
+
+        with tempfile.TemporaryDirectory() as tmp_dir, transaction.atomic():
+            upload = None
+            for i, rows in enumerate(options['sizes']):
+                # Different seed per size, otherwise later statements would partly be duplicates of earlier ones
+                upload = self.bench_ingest(rows, tmp_dir, options['seed'] + i)
+            if upload is not None:
+                self.bench_endpoints(upload)
+            if not options['keep']:
+                transaction.set_rollback(True)
+        if not options['keep']:
+            # The rows are rolled back, the snapshot files ingest wrote aren't
+            for upload_id in self.upload_ids:
+                remove_snapshots(upload_id)
+
+        report = {
+            'started_at': started_at.isoformat(),
+            'environment': self.environment(),
+            'options': {key: options[key] for key in ('sizes', 'iterations', 'seed', 'vendors', 'pages', 'trace_memory')},
+            'results': self.results
+        }
+        output = options['output'] or os.path.join(
+            settings.BASE_DIR, 'data', 'benchmarks', f"benchmark-{started_at.strftime('%Y%m%d-%H%M%S')}.json"
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as file:
+            json.dump(report, file, indent=2, default=str)
+        self.stdout.write(self.style.SUCCESS(f'Results written to {output}'))
+
+    def environment(self):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'commit': commit,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'cpu_count': os.cpu_count(),
+            'ingest_chunk_size': settings.INGEST_CHUNK_SIZE,
+            'ingest_csv_engine': settings.INGEST_CSV_ENGINE
+        }
+
+    def record(self, name, timings, queries, rows=None, peak_memory=None, **extra):
+        result = {
+            'name': name,
+            'iterations': len(timings),
+            'latency_ms': percentiles(timings),
+            'queries': queries,
+            'peak_rss_mib': peak_rss_mib(),
+            **extra
+        }
+        if rows is not None:
+            result['rows'] = rows
+            result['rows_per_sec'] = round(rows / sum(timings) * len(timings)) if sum(timings) else None
+        if peak_memory is not None:
+            result['peak_traced_mib'] = round(peak_memory / 1024 / 1024, 1)
+        self.results.append(result)
+
+        message = f"{name}: p50 {result['latency_ms']['p50']:.1f}ms, p95 {result['latency_ms']['p95']:.1f}ms, {queries} queries"
+        if rows is not None:
+            message += f", {result['rows_per_sec']:,} rows/sec"
+        self.stdout.write(message)
+
+    def measure(self, name, func, iterations=None, rows=None, setup=None, **extra):
+        """
+            Runs func iterations times, queries + traced memory are taken from the last run
+
+            setup() runs before every iteration, it isn't timed or counted
+        """
+        timings = []
+        iterations = iterations or self.options['iterations']
+        for i in range(iterations):
+            last = i == iterations - 1
+            if setup:
+                setup()
+            if last and self.options['trace_memory']:
+                tracemalloc.start()
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                func()
+                timings.append(time.perf_counter() - start)
+            peak = None
+            if last and self.options['trace_memory']:
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+        self.record(name, timings, len(queries), rows=rows, peak_memory=peak, **extra)
+
+    def bench_ingest(self, rows, tmp_dir, seed):
+        csv_path = write_statement(
+            os.path.join(tmp_dir, f'statement-{rows}.csv'), rows, seed=seed, vendors=self.options['vendors']
+        )
+        upload = TransactionUploads.objects.create(
+            file=f'transaction_uploads/benchmark-{rows}.csv', status=TransactionUploads.Status.DONE
+        )
+        self.upload_ids.append(upload.id)
+        # One run per size: a second run would only find duplicates of the first one
+        self.measure(f'ingest[{rows}]', lambda: ingest_csv(csv_path, upload), iterations=1, rows=rows)
+        return upload
+
+    def get(self, url):
+        response = self.client.get(url)
+        # A fast error page would make for a great looking benchmark
+        if response.status_code != 200:
+            raise CommandError(f'GET {url} answered {response.status_code}')
+        return response
+
+    def measure_cached(self, name, url, **versions):
+        """
+            Times GET url cold and warm, versions are the bump_versions arguments of what the response depends on
+        """
+        self.measure(f'{name}:cold', lambda: self.get(url), setup=lambda: bump_versions(**versions), cache='cold')
+        self.get(url)
+        self.measure(f'{name}:warm', lambda: self.get(url), cache='warm')
+
+    def bench_endpoints(self, upload):
+        rows = upload.transactions.count()
+        self.measure(f'get_summary[{rows}]', upload.get_summary)
+        self.measure_cached(f'summary_endpoint[{rows}]', f'/uploads/{upload.id}/summary/', upload_ids=[upload.id])
+
+        def walk_transactions():
+            url = '/transactions/?page_size=100'
+            for _ in range(self.options['pages']):
+                response = self.get(url)
+                url = response.json()['next']
+                if not url:
+                    break
+        self.measure(f'transaction_list[{self.options["pages"]} pages]', walk_transactions)
+
+        vendor = upload.transactions.values_list('vendor__name', flat=True).first()
+        if vendor:
+            for name, params in (
+                ('vendor_search', {'vendor_search': vendor[1:5].lower()}),
+                ('vendor_prefix', {'vendor_prefix': vendor[:3]}),
+                ('amount_range', {'min_amount': '10.00', 'max_amount': '20.00'}),
+            ):
+                url = f'/transactions/?page_size=100&{urlencode(params)}'
+                self.measure(f'transaction_filter[{name}]', lambda url=url: self.get(url))
+
+        category = Category.objects.filter(transactions__transaction_upload=upload).order_by('id').first()
+        if category:
+            self.measure_cached('category_retrieve', f'/categories/{category.slug}/', category_slugs=[category.slug])
+
+        context = report_context(upload, get_upload_summary(upload).as_dict())
+        try:
+            self.measure('pdf_render', lambda: render_report(context, settings.BASE_DIR))
+        except (ImportError, OSError) as e:
+            # WeasyPrint needs pango/cairo from the system
+            self.results.append({'name': 'pdf_render', 'skipped': str(e)})
+            self.stdout.write(f'pdf_render: skipped ({e})')
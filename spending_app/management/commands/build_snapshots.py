@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from spending_app.models import TransactionUploads
+from spending_app.snapshots import build_snapshot, load_snapshot
+import time
+
+
+class Command(BaseCommand):
+    """
+        Builds the columnar snapshot of every done upload that doesn't have an up to date one
+        (uploads from before snapshots existed, or edited since)
+
+        python manage.py build_snapshots [--force]
+    """
+    help = 'Builds missing or stale columnar snapshots of uploads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rebuild every snapshot, even up to date ones')
+
+    def handle(self, *args, **options):
+        built = 0
+        for upload in TransactionUploads.objects.filter(status=TransactionUploads.Status.DONE).order_by('id'):
+            if not options['force'] and load_snapshot(upload) is not None:
+                continue
+            start = time.perf_counter()
+            snapshot = build_snapshot(upload)
+            built += 1
+            self.stdout.write(f'Upload {upload.id}: {len(snapshot):,} rows in {time.perf_counter() - start:.2f}s')
+        self.stdout.write(self.style.SUCCESS(f'Built {built} snapshot(s)'))
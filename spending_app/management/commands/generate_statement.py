@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from spending_app.synthetic import write_statement
+import time
+
+
+class Command(BaseCommand):
+    """
+        Writes a seeded synthetic statement in our upload format (Date,Vendor,Category,Amount)
+
+        python manage.py generate_statement statement.csv --rows 1000000 --seed 42
+    """
+    help = 'Generates a synthetic transaction CSV for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output')
+        parser.add_argument('--rows', type=int, default=100000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--vendors', type=int, default=2000)
+        parser.add_argument('--days', type=int, default=730)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        write_statement(options['output'], options['rows'], seed=options['seed'], vendors=options['vendors'], days=options['days'])
+        self.stdout.write(f"Wrote {options['rows']:,} rows to {options['output']} in {time.perf_counter() - start:.2f}s")
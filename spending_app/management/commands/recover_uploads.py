@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from spending_app.jobs import recover_stale_uploads
+
+
+class Command(BaseCommand):
+    """
+        Marks uploads whose background job went away (restart, crash) failed and removes the rows
+        it already inserted, so the same file can be uploaded again
+
+        python manage.py recover_uploads [--all]
+        --all doesn't wait for UPLOAD_JOB_TIMEOUT: only run it while no server process is up (before it starts)
+    """
+    help = 'Fails uploads whose background job stopped before it finished'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Every pending/processing upload, not only the stale ones')
+
+    def handle(self, *args, **options):
+        recovered = recover_stale_uploads(timeout=0 if options['all'] else None)
+        for upload_id in recovered:
+            self.stdout.write(f'Upload {upload_id}: marked failed')
+        self.stdout.write(self.style.SUCCESS(f'Recovered {len(recovered)} upload(s)'))
@@ -0,0 +1,212 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import Http404, HttpResponse
+from time import perf_counter
+import threading
+
+# Timings of the request (or background job) we're in, None when nobody is collecting
+# A ContextVar so it follows the request into sync_to_async threads
+_current = ContextVar('request_metrics', default=None)
+
+# Seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+
+class RequestMetrics:
+    """
+        Where one request spent its time: named spans + how many queries and how long the database took
+    """
+    __slots__ = ('spans', 'queries', 'db_time')
+
+    def __init__(self):
+        self.spans = {}
+        self.queries = 0
+        self.db_time = 0.0
+
+    def add(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def server_timing(self, total):
+        # https://developer.mozilla.org/docs/Web/HTTP/Headers/Server-Timing
+        entries = [f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"']
+        entries += [f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.spans.items()]
+        entries.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(entries)
+
+
+@contextmanager
+def span(name):
+    """
+        Times a block into the current request's metrics (a no-op when nobody is collecting)
+
+        with span('pdf'): ...   or   @span('summary')
+    """
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add(name, perf_counter() - start)
+
+
+@contextmanager
+def collect():
+    """
+        Collects spans + queries for everything that runs inside, yields the RequestMetrics
+    """
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+        Database execute wrapper (installed on every connection when METRICS_ENABLED, see apps.py)
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_time += perf_counter() - start
+
+
+def install_query_timer(sender, connection, **kwargs):
+    # connection_created handler
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        # labels -> [count per bucket..., sum, count]
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self, label_names):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for labels, series in sorted(self.series.items()):
+            base = ','.join(f'{name}="{value}"' for name, value in zip(label_names, labels))
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {series[-1]}')
+            lines.append(f'{self.name}_sum{{{base}}} {series[-2]:.6f}')
+            lines.append(f'{self.name}_count{{{base}}} {series[-1]}')
+        return lines
+
+
+class MetricsRegistry:
+    """
+        Per process aggregates in the Prometheus text format
+
+        Every gunicorn worker keeps its own numbers, scrape each worker (or run one per pod) to see all of them
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.duration = Histogram('spending_request_duration_seconds', 'Time spent handling a request per view', DURATION_BUCKETS)
+        self.spans = Histogram('spending_request_span_seconds', 'Time spent in db/dataframe/template/pdf per view', DURATION_BUCKETS)
+        self.queries = Histogram('spending_request_queries', 'Database queries per request per view', QUERY_BUCKETS)
+
+    def observe(self, view, method, status_code, total, metrics):
+        with self.lock:
+            key = (view, method, str(status_code))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.duration.observe((view, method), total)
+            self.queries.observe((view,), metrics.queries)
+            self.spans.observe((view, 'db'), metrics.db_time)
+            for name, seconds in metrics.spans.items():
+                self.spans.observe((view, name), seconds)
+
+    def render(self):
+        with self.lock:
+            lines = ['# HELP spending_requests_total Requests handled per view', '# TYPE spending_requests_total counter']
+            lines += [
+                f'spending_requests_total{{view="{view}",method="{method}",status="{status_code}"}} {count}'
+                for (view, method, status_code), count in sorted(self.requests.items())
+            ]
+            lines += self.duration.render(('view', 'method'))
+            lines += self.spans.render(('view', 'span'))
+            lines += self.queries.render(('view',))
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class MetricsMiddleware:
+    """
+        Times every request: total, database (queries + time) and the span()s the view went through
+
+        - Answers with a Server-Timing header so the browser's dev tools show the breakdown
+        - Aggregated per view into histograms for /metrics
+        - METRICS_ENABLED = False takes the middleware out of the stack entirely
+        Streaming responses are timed up until the response object is handed back, not until the last byte
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with collect() as metrics:
+            start = perf_counter()
+            response = self.get_response(request)
+            return self.finish(request, response, perf_counter() - start, metrics)
+
+    async def __acall__(self, request):
+        with collect() as metrics:
+            start = perf_counter()
+            response = await self.get_response(request)
+            return self.finish(request, response, perf_counter() - start, metrics)
+
+    def finish(self, request, response, total, metrics):
+        match = request.resolver_match
+        # Route name rather than the path, ids in paths would give every upload its own series
+        view = match.view_name if match else 'unmatched'
+        if view != 'metrics':
+            registry.observe(view, request.method, response.status_code, total, metrics)
+        response['Server-Timing'] = metrics.server_timing(total)
+        return response
+
+
+def metrics_view(request):
+    """
+        Prometheus scrape endpoint
+    """
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:31
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def mark_existing_uploads_done(apps, schema_editor):
+    # Every upload before this migration was ingested inside the request, so they're already done
+    TransactionUploads = apps.get_model('spending_app', 'TransactionUploads')
+    for upload in TransactionUploads.objects.annotate(transaction_count=Count('transactions')):
+        upload.status = 'done'
+        upload.rows_processed = upload.transaction_count
+        upload.save(update_fields=['status', 'rows_processed'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spending_app', '0005_fk_transactions_uploads'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transactionuploads',
+            name='error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='transactionuploads',
+            name='finished_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='transactionuploads',
+            name='rows_processed',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='transactionuploads',
+            name='rows_rejected',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='transactionuploads',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='transactionuploads',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+        migrations.RunPython(mark_existing_uploads_done, migrations.RunPython.noop),
+    ]
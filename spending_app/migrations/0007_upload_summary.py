@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spending_app', '0006_upload_processing_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSummary',
+            fields=[
+                ('transaction_upload', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='spending_app.transactionuploads')),
+                ('total_cents', models.BigIntegerField(default=0)),
+                ('total_transactions', models.PositiveIntegerField(default=0)),
+                ('spending_per_category', models.JSONField(default=dict)),
+                ('spending_per_vendor', models.JSONField(default=dict)),
+                ('begin_date', models.DateField(blank=True, null=True)),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_daily_rollups(apps, schema_editor):
+    # Roll up every transaction that was uploaded before the rollup tables existed (grouped in SQL)
+    Transactions = apps.get_model('spending_app', 'Transactions')
+    DailyCategorySpend = apps.get_model('spending_app', 'DailyCategorySpend')
+    DailyVendorSpend = apps.get_model('spending_app', 'DailyVendorSpend')
+
+    transactions = Transactions.objects.order_by()
+    DailyCategorySpend.objects.bulk_create([
+        DailyCategorySpend(date=row['date'], category_id=row['category_id'], total_cents=int(round(row['total'] * 100)), transaction_count=row['transaction_count'])
+        for row in transactions.values('date', 'category_id').annotate(total=Sum('amount'), transaction_count=Count('id'))
+    ], batch_size=5000)
+    DailyVendorSpend.objects.bulk_create([
+        DailyVendorSpend(date=row['date'], vendor=row['vendor'], total_cents=int(round(row['total'] * 100)), transaction_count=row['transaction_count'])
+        for row in transactions.values('date', 'vendor').annotate(total=Sum('amount'), transaction_count=Count('id'))
+    ], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spending_app', '0007_upload_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCategorySpend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('total_cents', models.BigIntegerField(default=0)),
+                ('transaction_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyVendorSpend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('vendor', models.CharField(max_length=155)),
+                ('total_cents', models.BigIntegerField(default=0)),
+                ('transaction_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='transactions',
+            index=models.Index(fields=['date'], name='transactions_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transactions',
+            index=models.Index(fields=['category', 'date'], name='transactions_category_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='dailycategoryspend',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_spending', to='spending_app.category'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyvendorspend',
+            constraint=models.UniqueConstraint(fields=('date', 'vendor'), name='unique_daily_vendor_spend'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailycategoryspend',
+            constraint=models.UniqueConstraint(fields=('date', 'category'), name='unique_daily_category_spend'),
+        ),
+        migrations.RunPython(backfill_daily_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spending_app', '0008_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='transactions',
+            name='transactions_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='transactions',
+            index=models.Index(fields=['date', 'id'], name='transactions_date_id_idx'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:46
+
+from collections import Counter
+from django.db import migrations, models
+from hashlib import blake2b, sha256
+
+
+def backfill_fingerprints(apps, schema_editor):
+    # Same fingerprint ingest gives every row (spending_app/fingerprints.py), counted per upload in file order
+    Transactions = apps.get_model('spending_app', 'Transactions')
+    seen, current_upload, batch = Counter(), None, []
+    rows = Transactions.objects.order_by('transaction_upload_id', 'id').values_list(
+        'id', 'transaction_upload_id', 'date', 'vendor', 'amount', 'category__category_name'
+    )
+    for pk, upload_id, day, vendor, amount, category_name in rows.iterator(chunk_size=5000):
+        if upload_id != current_upload:
+            seen, current_upload = Counter(), upload_id
+        key = f'{day.isoformat()}|{vendor}|{int(round(amount * 100))}|{category_name}'
+        fingerprint = int.from_bytes(blake2b(f'{key}#{seen[key]}'.encode(), digest_size=8).digest(), 'big', signed=True)
+        seen[key] += 1
+        batch.append(Transactions(id=pk, fingerprint=fingerprint))
+        if len(batch) >= 5000:
+            Transactions.objects.bulk_update(batch, ['fingerprint'])
+            batch = []
+    Transactions.objects.bulk_update(batch, ['fingerprint'])
+
+
+def backfill_content_hashes(apps, schema_editor):
+    # Files that are still around get hashed so uploading them again is recognized
+    TransactionUploads = apps.get_model('spending_app', 'TransactionUploads')
+    for upload in TransactionUploads.objects.all():
+        hasher = sha256()
+        try:
+            with upload.file.open('rb') as file:
+                for chunk in file.chunks():
+                    hasher.update(chunk)
+        except (FileNotFoundError, OSError):
+            continue
+        upload.content_hash = hasher.hexdigest()
+        upload.save(update_fields=['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spending_app', '0009_transactions_date_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transactions',
+            name='fingerprint',
+            field=models.BigIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='transactionuploads',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='transactionuploads',
+            name='rows_skipped',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_fingerprints, migrations.RunPython.noop),
+        migrations.RunPython(backfill_content_hashes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spending_app', '0010_upload_dedupe'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transactionuploads',
+            name='rejections',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
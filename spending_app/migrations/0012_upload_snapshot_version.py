@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spending_app', '0011_upload_rejections'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transactionuploads',
+            name='snapshot_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
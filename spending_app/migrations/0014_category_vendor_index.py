@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spending_app', '0013_cache_versions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transactions',
+            index=models.Index(fields=['category', 'vendor', 'amount'], name='transactions_cat_vendor_idx'),
+        ),
+    ]
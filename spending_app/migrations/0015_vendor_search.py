@@ -0,0 +1,68 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:20
+
+from django.db import migrations, models
+
+# Trigram full-text index over Vendor.name: MATCH '"bucks"' finds "Starbucks" without scanning anything
+# External content (the names live in spending_app_vendor only), the triggers keep the index in sync
+CREATE_SEARCH = [
+    """
+    CREATE VIRTUAL TABLE spending_app_vendor_search USING fts5(
+        name, content='spending_app_vendor', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER spending_app_vendor_search_insert AFTER INSERT ON spending_app_vendor BEGIN
+        INSERT INTO spending_app_vendor_search(rowid, name) VALUES (new.id, new.name);
+    END
+    """,
+    """
+    CREATE TRIGGER spending_app_vendor_search_delete AFTER DELETE ON spending_app_vendor BEGIN
+        INSERT INTO spending_app_vendor_search(spending_app_vendor_search, rowid, name) VALUES ('delete', old.id, old.name);
+    END
+    """,
+    """
+    CREATE TRIGGER spending_app_vendor_search_update AFTER UPDATE ON spending_app_vendor BEGIN
+        INSERT INTO spending_app_vendor_search(spending_app_vendor_search, rowid, name) VALUES ('delete', old.id, old.name);
+        INSERT INTO spending_app_vendor_search(rowid, name) VALUES (new.id, new.name);
+    END
+    """,
+]
+DROP_SEARCH = [
+    'DROP TRIGGER spending_app_vendor_search_update',
+    'DROP TRIGGER spending_app_vendor_search_delete',
+    'DROP TRIGGER spending_app_vendor_search_insert',
+    'DROP TABLE spending_app_vendor_search',
+]
+# Vendors of the transactions we already have, the insert trigger indexes them
+BACKFILL_VENDORS = 'INSERT OR IGNORE INTO spending_app_vendor (name) SELECT DISTINCT vendor FROM spending_app_transactions'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spending_app', '0014_category_vendor_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Vendor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=155, unique=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='transactions',
+            index=models.Index(fields=['transaction_upload', 'date'], name='transactions_upload_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transactions',
+            index=models.Index(fields=['vendor', 'date'], name='transactions_vendor_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transactions',
+            index=models.Index(fields=['amount', 'date'], name='transactions_amount_date_idx'),
+        ),
+        migrations.RunSQL(CREATE_SEARCH, DROP_SEARCH),
+        migrations.RunSQL(BACKFILL_VENDORS, migrations.RunSQL.noop),
+    ]
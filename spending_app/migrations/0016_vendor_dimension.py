@@ -0,0 +1,170 @@
+# Generated by Django 5.2.4 on 2026-10-18 19:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils.text import slugify
+
+# Every name the rows point at has to be a Vendor before they can point at it by id
+# (0015 already copied them over, this catches anything written without one since)
+BACKFILL_NAMES = [
+    'INSERT OR IGNORE INTO spending_app_vendor (name) SELECT DISTINCT vendor FROM spending_app_transactions',
+    'INSERT OR IGNORE INTO spending_app_vendor (name) SELECT DISTINCT vendor FROM spending_app_dailyvendorspend',
+]
+# Name -> id through the unique name index, one pass over each table (and back when unapplied)
+BACKFILL_IDS = [
+    'UPDATE spending_app_transactions SET vendor_ref_id = '
+    '(SELECT id FROM spending_app_vendor WHERE name = spending_app_transactions.vendor)',
+    'UPDATE spending_app_dailyvendorspend SET vendor_ref_id = '
+    '(SELECT id FROM spending_app_vendor WHERE name = spending_app_dailyvendorspend.vendor)',
+]
+RESTORE_NAMES = [
+    'UPDATE spending_app_transactions SET vendor = '
+    '(SELECT name FROM spending_app_vendor WHERE id = spending_app_transactions.vendor_ref_id)',
+    'UPDATE spending_app_dailyvendorspend SET vendor = '
+    '(SELECT name FROM spending_app_vendor WHERE id = spending_app_dailyvendorspend.vendor_ref_id)',
+]
+# Adding the slug rebuilds spending_app_vendor (SQLite can't add a unique column in place, or drop an indexed
+# one when unapplying), which drops the triggers that keep the vendor search index in sync (see 0015)
+# They come off before and go back on right after, the names themselves don't change in between
+SEARCH_TRIGGERS = [
+    """
+    CREATE TRIGGER spending_app_vendor_search_insert AFTER INSERT ON spending_app_vendor BEGIN
+        INSERT INTO spending_app_vendor_search(rowid, name) VALUES (new.id, new.name);
+    END
+    """,
+    """
+    CREATE TRIGGER spending_app_vendor_search_delete AFTER DELETE ON spending_app_vendor BEGIN
+        INSERT INTO spending_app_vendor_search(spending_app_vendor_search, rowid, name) VALUES ('delete', old.id, old.name);
+    END
+    """,
+    """
+    CREATE TRIGGER spending_app_vendor_search_update AFTER UPDATE ON spending_app_vendor BEGIN
+        INSERT INTO spending_app_vendor_search(spending_app_vendor_search, rowid, name) VALUES ('delete', old.id, old.name);
+        INSERT INTO spending_app_vendor_search(rowid, name) VALUES (new.id, new.name);
+    END
+    """,
+]
+DROP_SEARCH_TRIGGERS = [
+    'DROP TRIGGER spending_app_vendor_search_update',
+    'DROP TRIGGER spending_app_vendor_search_delete',
+    'DROP TRIGGER spending_app_vendor_search_insert',
+]
+# Snapshots keep vendors by name, the ones on disk are rebuilt (keyed by id) on their next read
+STALE_SNAPSHOTS = 'UPDATE spending_app_transactionuploads SET snapshot_version = snapshot_version + 1'
+
+
+def backfill_vendor_slugs(apps, schema_editor):
+    # Same slugs Vendor.generate_slugs picks, in the order the vendors were first seen
+    Vendor = apps.get_model('spending_app', 'Vendor')
+    vendors = list(Vendor.objects.order_by('id'))
+    taken = set()
+    for vendor in vendors:
+        base_slug = slugify(vendor.name)
+        gen_slug = base_slug
+        cnt = 1
+        while gen_slug in taken:
+            gen_slug = f'{base_slug}-{cnt}'
+            cnt += 1
+        taken.add(gen_slug)
+        vendor.slug = gen_slug
+    Vendor.objects.bulk_update(vendors, ['slug'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spending_app', '0015_vendor_search'),
+    ]
+
+    operations = [
+        # Both indexes are on the name column that's about to go, they come back on the id below
+        migrations.RemoveIndex(
+            model_name='transactions',
+            name='transactions_cat_vendor_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='transactions',
+            name='transactions_vendor_date_idx',
+        ),
+        migrations.RemoveConstraint(
+            model_name='dailyvendorspend',
+            name='unique_daily_vendor_spend',
+        ),
+        migrations.RunSQL(BACKFILL_NAMES, migrations.RunSQL.noop),
+        migrations.RunSQL(DROP_SEARCH_TRIGGERS, SEARCH_TRIGGERS),
+        migrations.AddField(
+            model_name='vendor',
+            name='slug',
+            field=models.SlugField(max_length=170, null=True),
+        ),
+        migrations.RunPython(backfill_vendor_slugs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='vendor',
+            name='slug',
+            field=models.SlugField(max_length=170, unique=True),
+        ),
+        migrations.RunSQL(SEARCH_TRIGGERS, DROP_SEARCH_TRIGGERS),
+        # Nullable first so unapplying can add the names back before they're required again
+        migrations.AlterField(
+            model_name='transactions',
+            name='vendor',
+            field=models.CharField(max_length=155, null=True),
+        ),
+        migrations.AlterField(
+            model_name='dailyvendorspend',
+            name='vendor',
+            field=models.CharField(max_length=155, null=True),
+        ),
+        migrations.AddField(
+            model_name='transactions',
+            name='vendor_ref',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='transactions', to='spending_app.vendor'),
+        ),
+        migrations.AddField(
+            model_name='dailyvendorspend',
+            name='vendor_ref',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='daily_spending', to='spending_app.vendor'),
+        ),
+        migrations.RunSQL(BACKFILL_IDS, RESTORE_NAMES),
+        migrations.RemoveField(
+            model_name='transactions',
+            name='vendor',
+        ),
+        migrations.RemoveField(
+            model_name='dailyvendorspend',
+            name='vendor',
+        ),
+        migrations.RenameField(
+            model_name='transactions',
+            old_name='vendor_ref',
+            new_name='vendor',
+        ),
+        migrations.RenameField(
+            model_name='dailyvendorspend',
+            old_name='vendor_ref',
+            new_name='vendor',
+        ),
+        migrations.AlterField(
+            model_name='transactions',
+            name='vendor',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='transactions', to='spending_app.vendor'),
+        ),
+        migrations.AlterField(
+            model_name='dailyvendorspend',
+            name='vendor',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='daily_spending', to='spending_app.vendor'),
+        ),
+        migrations.AddIndex(
+            model_name='transactions',
+            index=models.Index(fields=['category', 'vendor', 'amount'], name='transactions_cat_vendor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transactions',
+            index=models.Index(fields=['vendor', 'date'], name='transactions_vendor_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyvendorspend',
+            constraint=models.UniqueConstraint(fields=('date', 'vendor'), name='unique_daily_vendor_spend'),
+        ),
+        migrations.RunSQL(STALE_SNAPSHOTS, STALE_SNAPSHOTS),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spending_app', '0016_vendor_dimension'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transactionuploads',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+def forget_duplicate_hashes(apps, schema_editor):
+    # Files uploaded twice before the constraint: the first live upload keeps the hash, the others stop counting as that file
+    TransactionUploads = apps.get_model('spending_app', 'TransactionUploads')
+    seen = set()
+    live = TransactionUploads.objects.filter(status__in=['pending', 'processing', 'done']).exclude(content_hash='')
+    for upload_id, content_hash in live.order_by('id').values_list('id', 'content_hash'):
+        if content_hash in seen:
+            TransactionUploads.objects.filter(id=upload_id).update(content_hash='')
+        seen.add(content_hash)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spending_app', '0017_upload_heartbeat'),
+    ]
+
+    operations = [
+        migrations.RunPython(forget_duplicate_hashes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='transactionuploads',
+            constraint=models.UniqueConstraint(
+                condition=models.Q(('status__in', ['pending', 'processing', 'done']), models.Q(('content_hash', ''), _negated=True)),
+                fields=('content_hash',),
+                name='unique_live_upload_content',
+            ),
+        ),
+    ]
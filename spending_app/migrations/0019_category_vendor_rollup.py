@@ -0,0 +1,56 @@
+# Generated by Django 5.2.4 on 2026-10-18 19:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_category_vendor_rollup(apps, schema_editor):
+    # Roll up the transactions we already have (grouped in SQL, on the index that's dropped right after)
+    Transactions = apps.get_model('spending_app', 'Transactions')
+    DailyCategoryVendorSpend = apps.get_model('spending_app', 'DailyCategoryVendorSpend')
+    DailyCategoryVendorSpend.objects.bulk_create([
+        DailyCategoryVendorSpend(
+            date=row['date'], category_id=row['category_id'], vendor_id=row['vendor_id'],
+            total_cents=int(round(row['total'] * 100)), transaction_count=row['transaction_count']
+        )
+        for row in Transactions.objects.order_by().values('date', 'category_id', 'vendor_id').annotate(total=Sum('amount'), transaction_count=Count('id'))
+    ], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spending_app', '0018_unique_live_upload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCategoryVendorSpend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('total_cents', models.BigIntegerField(default=0)),
+                ('transaction_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='dailycategoryvendorspend',
+            name='category',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='daily_vendor_spending', to='spending_app.category'),
+        ),
+        migrations.AddField(
+            model_name='dailycategoryvendorspend',
+            name='vendor',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='daily_category_spending', to='spending_app.vendor'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailycategoryvendorspend',
+            constraint=models.UniqueConstraint(fields=('category', 'vendor', 'date'), name='unique_daily_category_vendor_spend'),
+        ),
+        migrations.RunPython(backfill_category_vendor_rollup, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='transactions',
+            name='transactions_cat_vendor_idx',
+        ),
+    ]
@@ -1,11 +1,52 @@
 from django.db import models
 from django.utils.text import slugify
-import pandas as pd
+from django.utils import timezone
 import os
+import re
+from .metrics import span
 
 # Create your models here.
 
-class Category(models.Model):
+class UniqueSlugMixin:
+    """
+        generate_slugs for models with a unique slug next to their name (Category, Vendor)
+    """
+    @classmethod
+    def generate_slugs(cls, names):
+        """
+            Picks a free slug for every name: slugify(name), then name-1, name-2, ... if it's taken
+
+            - One query grabs the slugs that are already taken as is, a second one (only if any collide)
+              grabs every numbered slug of those, so the regex never runs for names that don't collide
+            - Names that slugify to the same thing (Food/food!) get different slugs too
+        """
+        base_slugs = {name: slugify(name) for name in names}
+        if not base_slugs:
+            return {}
+        taken = set(cls.objects.filter(slug__in=set(base_slugs.values())).values_list('slug', flat=True))
+        seen = set()
+        colliding = set()
+        for base_slug in base_slugs.values():
+            if base_slug in taken or base_slug in seen:
+                colliding.add(base_slug)
+            seen.add(base_slug)
+        if colliding:
+            pattern = '^(%s)-[0-9]+$' % '|'.join(re.escape(base) for base in colliding)
+            taken |= set(cls.objects.filter(slug__regex=pattern).values_list('slug', flat=True))
+
+        slugs = {}
+        for name, base_slug in base_slugs.items():
+            gen_slug = base_slug
+            cnt = 1
+            while gen_slug in taken:
+                gen_slug = f'{base_slug}-{cnt}'
+                cnt += 1
+            taken.add(gen_slug)
+            slugs[name] = gen_slug
+        return slugs
+
+
+class Category(UniqueSlugMixin, models.Model):
     """
         Each Transaction should be tied to a specific category
 
@@ -17,62 +58,178 @@ class Category(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.slug:
-            base_slug = slugify(self.category_name)
-            gen_slug = base_slug
-            cnt = 1
-
-            while Category.objects.filter(slug=gen_slug).exists():
-                gen_slug = f'{base_slug}-{cnt}'
-                cnt += 1
-            
-            self.slug = gen_slug
+            self.slug = Category.generate_slugs([self.category_name])[self.category_name]
         
         # Regardless we need to super save 
         super().save(*args, **kwargs)
 
+    def get_stats(self, top_vendors=5):
+        """
+            Aggregates over every transaction in the category, all done by the database
+
+            - Count, total, mean + date range come from the daily rollup (one row per day, not per transaction)
+            - Top vendors add up the (date, category, vendor) rollup, so it costs days x vendors of the category
+              however many transactions there are, their names are one more lookup of just those few vendors
+        """
+        overall = DailyCategorySpend.objects.filter(category=self).aggregate(
+            total_cents=models.Sum('total_cents'),
+            count=models.Sum('transaction_count'),
+            first_date=models.Min('date'),
+            last_date=models.Max('date')
+        )
+        vendors = list(
+            DailyCategoryVendorSpend.objects.filter(category=self).values_list('vendor_id')
+            .annotate(total_cents=models.Sum('total_cents'))
+            .order_by('-total_cents')[:top_vendors]
+        )
+        names = Vendor.objects.in_bulk([vendor_id for vendor_id, _ in vendors])
+        count, total_cents = overall['count'] or 0, overall['total_cents'] or 0
+        return {
+            'total_spent': round(total_cents / 100, 2),
+            'total_transactions': count,
+            'average_amount': round(total_cents / count / 100, 2) if count else None,
+            'first_date': overall['first_date'],
+            'last_date': overall['last_date'],
+            # Most spent first
+            'top_vendors': {names[vendor_id].name: round(cents / 100, 2) for vendor_id, cents in vendors}
+        }
+
     def __str__(self):
         return self.category_name
 
 
+class Vendor(UniqueSlugMixin, models.Model):
+    """
+        Every vendor name we've seen, once: Transactions and the vendor rollup point at it by id (see vendors.py)
+
+        name: The vendor's name as it shows up on the statements
+        slug: Identifier for the vendor
+
+        Vendor search runs on a trigram full-text index over these names (SQLite FTS5, kept in sync by
+        triggers, see migration 0015) instead of a LIKE '%...%' over every transaction
+        Names stay once their last transaction is gone, searching them just finds nothing
+    """
+    name = models.CharField(max_length=155, unique=True)
+    slug = models.SlugField(max_length=170, unique=True)
+
+    def save(self, *args, **kwargs):
+        if not self.slug:
+            self.slug = Vendor.generate_slugs([self.name])[self.name]
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return self.name
+
+
 class TransactionUploads(models.Model):
+    """
+        Each uploaded CSV file, parsed in the background by our upload worker pool (see jobs.py)
+
+        status: Where the background job is at
+        rows_processed: How many rows were inserted as Transactions so far
+        rows_rejected: How many rows were skipped because they couldn't be parsed
+        rows_skipped: How many rows were skipped because we already had them (overlapping statements)
+        content_hash: sha256 of the file, the same file uploaded twice is answered with the first upload
+        rejections: Why rows were rejected, counts per reason + the first few rows (see parsing.RejectionReport)
+        snapshot_version: Bumped whenever its transactions change, columnar snapshots of older versions are stale (see snapshots.py)
+        started_at/finished_at: When the background job picked up/finished the file
+        heartbeat_at: Last sign of life of the job (start + every chunk), jobs that went quiet are swept (jobs.py)
+        error: Why the job failed (if it did)
+    """
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        PROCESSING = 'processing', 'Processing'
+        DONE = 'done', 'Done'
+        FAILED = 'failed', 'Failed'
+
     file = models.FileField(upload_to='transaction_uploads/')
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    rows_processed = models.PositiveIntegerField(default=0)
+    rows_rejected = models.PositiveIntegerField(default=0)
+    rows_skipped = models.PositiveIntegerField(default=0)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    rejections = models.JSONField(default=dict, blank=True)
+    snapshot_version = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            # One live upload per file: of two requests racing with the same file only one gets to insert (batchuploads.py)
+            models.UniqueConstraint(
+                fields=['content_hash'],
+                condition=models.Q(status__in=['pending', 'processing', 'done']) & ~models.Q(content_hash=''),
+                name='unique_live_upload_content',
+            ),
+        ]
 
     def get_file_name(self):
         return os.path.basename(self.file.name)
+
+    def get_elapsed_seconds(self):
+        # Still running? Then we measure up until now
+        if not self.started_at:
+            return None
+        end = self.finished_at or timezone.now()
+        return round((end - self.started_at).total_seconds(), 2)
     
-    def get_summary(self, prefetched_transactions=None):
-        # By grabbing the prefetched_transactions, we don't have to open the database again -> prefetch_related
-        related_transactions = prefetched_transactions or self.transactions.all()
-        # Rebuilding Data for Dataframe 
-        data = [{
-            'vendor': t.vendor,
-            'amount': float(t.amount),
-            'date': t.date,
-            'category': t.category.category_name
-        } for t in related_transactions]
-
-        df = pd.DataFrame(data)
-
-        # Meaningful Insights
-        total_spent = round(df['amount'].sum(),2)
-        total_transactions = len(related_transactions)
-        spending_per_category = df.groupby('category')['amount'].sum().sort_values(ascending=False).to_dict()
-        spending_per_vendor = df.groupby('vendor')['amount'].sum().sort_values(ascending=False).to_dict()
-        # We could use head(n) to grab n rows (Since its already sorted the top will be the most spent)
-        top_vendors = df.groupby('vendor')['amount'].sum().sort_values(ascending=False).head(5).to_dict()
-        vendor_count = len(df.groupby('vendor'))
+    def get_spending_totals(self):
+        """
+            Lets the database do the adding up instead of pulling every transaction into Python
+
+            - Always 4 queries: overall totals, per category, per vendor (sorted by the most spent) + the vendors' names
+            - Amounts stay Decimal so the caller decides how to round
+            - With an up to date columnar snapshot (snapshots.py) it's numpy over the mapped arrays instead
+        """
+        from .snapshots import load_snapshot
+
+        snapshot = load_snapshot(self)
+        if snapshot is not None:
+            return snapshot.spending_totals()
+        transactions = Transactions.objects.filter(transaction_upload=self)
+        overall = transactions.aggregate(
+            total=models.Sum('amount'),
+            count=models.Count('id'),
+            begin_date=models.Min('date'),
+            end_date=models.Max('date')
+        )
+        per_category = list(
+            transactions.values_list('category__category_name')
+            .annotate(total=models.Sum('amount'), count=models.Count('id'))
+            .order_by('-total')
+        )
+        # Grouped by the integer key, the names of the vendors that made it are one lookup afterwards
+        per_vendor = list(
+            transactions.values_list('vendor_id')
+            .annotate(total=models.Sum('amount'), count=models.Count('id'))
+            .order_by('-total')
+        )
+        names = Vendor.objects.in_bulk([vendor_id for vendor_id, _, _ in per_vendor])
+        per_vendor = [(names[vendor_id].name, total, count) for vendor_id, total, count in per_vendor]
+        return overall, per_category, per_vendor
+
+    def get_summary(self):
+        overall, per_category, per_vendor = self.get_spending_totals()
+
+        with span('summary'):
+            # Meaningful Insights
+            spending_per_category = {name: float(total) for name, total, _ in per_category}
+            spending_per_vendor = {vendor: float(total) for vendor, total, _ in per_vendor}
 
         return {
-                'total_spent': total_spent,
-                'total_transactions': total_transactions,
+                'total_spent': round(float(overall['total'] or 0), 2),
+                'total_transactions': overall['count'],
                 'unique_categories': len(spending_per_category),
                 'spending_per_category': spending_per_category,
                 'spending_per_vendor': spending_per_vendor,
-                'top_vendors': top_vendors,
-                'unique_vendors': vendor_count,
-                'begin_date': df['date'].min(),
-                'end_date': df['date'].max()
+                # Already sorted so the first 5 are the most spent
+                'top_vendors': dict(list(spending_per_vendor.items())[:5]),
+                'unique_vendors': len(spending_per_vendor),
+                'begin_date': overall['begin_date'],
+                'end_date': overall['end_date']
         }
 
 
@@ -81,15 +238,145 @@ class Transactions(models.Model):
         Each Transaction instance is within the CSV 
 
         date: Date of the transaction
-        vendor: Name of who was paid 
+        vendor: Who was paid (the Vendor row, transactions only store its id)
         amount: How much we paid the vendor 
         category: Grouping the payment  
+        fingerprint: Hash of (date, vendor, amount, category, nth time in the file) for uploaded rows (see fingerprints.py)
     """
-    vendor = models.CharField(max_length=155)
+    # No index of its own, the (vendor, date) index below starts with it
+    vendor = models.ForeignKey(Vendor, on_delete=models.PROTECT, related_name='transactions', db_index=False)
     amount = models.DecimalField(max_digits=19, decimal_places=2)
     date = models.DateField()
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='transactions')
     transaction_upload = models.ForeignKey(TransactionUploads, on_delete=models.CASCADE, related_name='transactions')
+    fingerprint = models.BigIntegerField(blank=True, null=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Date range scans across every upload + keyset pagination (ORDER BY date, id)
+            models.Index(fields=['date', 'id'], name='transactions_date_id_idx'),
+            # Per category over time + the category detail's recent transactions
+            models.Index(fields=['category', 'date'], name='transactions_category_date_idx'),
+            # Transaction list filters, each with the date so the page's ids come out of the index alone
+            models.Index(fields=['transaction_upload', 'date'], name='transactions_upload_date_idx'),
+            models.Index(fields=['vendor', 'date'], name='transactions_vendor_date_idx'),
+            models.Index(fields=['amount', 'date'], name='transactions_amount_date_idx'),
+        ]
 
     def __str__(self):
-        return f'{self.vendor}[{self.category.category_name}]: ${self.amount}'    
+        return f'{self.vendor.name}[{self.category.category_name}]: ${self.amount}'    
+
+
+class UploadSummary(models.Model):
+    """
+        Precomputed summary for each upload so /uploads/<id>/summary/ is a single lookup
+
+        Built once at ingest and kept up to date as Transactions are created, edited or deleted (see summaries.py)
+        Money is kept in integer cents so adding/removing transactions never drifts like floats would
+
+        total_cents: Sum of every transaction
+        total_transactions: Number of transactions
+        spending_per_category: {category_name: [cents, count]}
+        spending_per_vendor: {vendor: [cents, count]}
+        begin_date/end_date: Date range of the transactions
+    """
+    transaction_upload = models.OneToOneField(TransactionUploads, on_delete=models.CASCADE, primary_key=True, related_name='summary')
+    total_cents = models.BigIntegerField(default=0)
+    total_transactions = models.PositiveIntegerField(default=0)
+    spending_per_category = models.JSONField(default=dict)
+    spending_per_vendor = models.JSONField(default=dict)
+    begin_date = models.DateField(blank=True, null=True)
+    end_date = models.DateField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @staticmethod
+    def _sorted_totals(totals):
+        # {name: [cents, count]} -> {name: dollars} sorted by the most spent
+        spending = {name: cents / 100 for name, (cents, _) in totals.items()}
+        return dict(sorted(spending.items(), key=lambda item: item[1], reverse=True))
+
+    def as_dict(self):
+        """
+            Same response shape as TransactionUploads.get_summary
+        """
+        spending_per_category = self._sorted_totals(self.spending_per_category)
+        spending_per_vendor = self._sorted_totals(self.spending_per_vendor)
+        return {
+            'total_spent': round(self.total_cents / 100, 2),
+            'total_transactions': self.total_transactions,
+            'unique_categories': len(spending_per_category),
+            'spending_per_category': spending_per_category,
+            'spending_per_vendor': spending_per_vendor,
+            # Already sorted so the first 5 are the most spent
+            'top_vendors': dict(list(spending_per_vendor.items())[:5]),
+            'unique_vendors': len(spending_per_vendor),
+            'begin_date': self.begin_date,
+            'end_date': self.end_date
+        }
+
+
+class DailyCategorySpend(models.Model):
+    """
+        Calendar rollup: how much was spent per (date, category) across every upload
+
+        Maintained at ingest and on every transaction write (see rollups.py) so time series
+        only read one row per day/category instead of every raw transaction
+    """
+    date = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='daily_spending')
+    total_cents = models.BigIntegerField(default=0)
+    transaction_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Also the index our date range queries use
+            models.UniqueConstraint(fields=['date', 'category'], name='unique_daily_category_spend'),
+        ]
+
+
+class DailyVendorSpend(models.Model):
+    """
+        Calendar rollup: how much was spent per (date, vendor) across every upload
+    """
+    date = models.DateField()
+    # Covered by the (date, vendor) constraint, we never look rows up by vendor alone
+    vendor = models.ForeignKey(Vendor, on_delete=models.PROTECT, related_name='daily_spending', db_index=False)
+    total_cents = models.BigIntegerField(default=0)
+    transaction_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'vendor'], name='unique_daily_vendor_spend'),
+        ]
+
+
+class DailyCategoryVendorSpend(models.Model):
+    """
+        Calendar rollup: how much was spent per (date, category, vendor) across every upload
+
+        A category's top vendors add up its rows here instead of grouping its transactions (Category.get_stats)
+    """
+    date = models.DateField()
+    # Both covered by the (category, vendor, date) constraint
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='daily_vendor_spending', db_index=False)
+    vendor = models.ForeignKey(Vendor, on_delete=models.PROTECT, related_name='daily_category_spending', db_index=False)
+    total_cents = models.BigIntegerField(default=0)
+    transaction_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Category first: get_stats reads one category's rows grouped by vendor
+            models.UniqueConstraint(fields=['category', 'vendor', 'date'], name='unique_daily_category_vendor_spend'),
+        ]
+
+
+class CacheVersion(models.Model):
+    """
+        Current version of something our API responses are cached by (see responsecache.py)
+
+        key: 'upload:<id>', 'category:<slug>' or 'categories' (the category list)
+        version: Random token, replaced in the same transaction as every write that changes what the
+                 responses show, so cached responses (and ETags) of the old version simply stop matching
+    """
+    key = models.CharField(max_length=200, primary_key=True)
+    version = models.CharField(max_length=32)
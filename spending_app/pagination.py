@@ -0,0 +1,136 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import date
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class TransactionKeysetPagination(BasePagination):
+    """
+        Keyset (cursor) pagination over Transactions, newest first: ORDER BY date DESC, id DESC
+
+        - The cursor is the (date, id) of the last/first row we handed out, the next page is a
+          WHERE (date, id) < cursor on the (date, id) index, so page 10,000 costs the same as page 1
+        - Written as date <= day AND (date < day OR id < pk): the plain date bound is what lets SQLite start
+          the index walk at the cursor (an OR alone has it scan from the newest row, or sort every match)
+        - DRF's CursorPagination only keys on the first ordering field and falls back to an OFFSET for
+          ties, which gets slow when thousands of transactions share a date
+        - No COUNT(*), one query per page
+    """
+    page_size = 100
+    max_page_size = 1000
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    results_key = 'all_transactions'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def encode_cursor(self, direction, transaction):
+        position = f'{direction}:{transaction.date.isoformat()}:{transaction.id}'
+        cursor = urlsafe_b64encode(position.encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            direction, day, pk = urlsafe_b64decode(cursor.encode()).decode().split(':')
+            if direction not in ('n', 'p'):
+                raise ValueError
+            return direction, date.fromisoformat(day), int(pk)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def page_queryset(self, queryset, request):
+        """
+            The query for the requested page, page_size + 1 rows so we know if there's another one
+        """
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+
+        ordering = ('-date', '-id')
+        page = queryset
+        if self.cursor and self.cursor[0] == 'p':
+            # Going back: walk the index the other way and flip the page around
+            _, day, pk = self.cursor
+            ordering = ('date', 'id')
+            page = queryset.filter(Q(date__gt=day) | Q(id__gt=pk), date__gte=day)
+        elif self.cursor:
+            _, day, pk = self.cursor
+            page = queryset.filter(Q(date__lt=day) | Q(id__lt=pk), date__lte=day)
+        page_ids = page.order_by(*ordering).values('pk')[:self.page_size + 1]
+        return self.load_rows(queryset, page_ids).order_by(*ordering)
+
+    @staticmethod
+    def load_rows(queryset, page_ids):
+        """
+            The page's rows (+ the queryset's select_related) by primary key, still one query
+
+            The filtered query only hands out ids, so SQLite picks them off the indexes and joins nothing
+            but the page: with the join in there it joins every match before it can sort and cut the page
+        """
+        rows = queryset.model._default_manager.filter(pk__in=page_ids)
+        related = queryset.query.select_related
+        if isinstance(related, dict):
+            rows = rows.select_related(*related)
+        elif related:
+            rows = rows.select_related()
+        return rows
+
+    def set_page(self, page):
+        if self.cursor and self.cursor[0] == 'p':
+            self.has_previous, self.has_next = len(page) > self.page_size, True
+            page = page[:self.page_size][::-1]
+        else:
+            self.has_previous, self.has_next = self.cursor is not None, len(page) > self.page_size
+            page = page[:self.page_size]
+        self.page = page
+        return page
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        # Same page through the async ORM
+        return self.set_page([transaction async for transaction in self.page_queryset(queryset, request)])
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor('n', self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor('p', self.page[0])
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            self.results_key: data
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+
+class CategoryTransactionPagination(TransactionKeysetPagination):
+    """
+        The window of recent transactions on a category's detail, walked on the (category, date) index
+    """
+    page_size = 20
+    max_page_size = 100
+    results_key = 'recent_transactions'
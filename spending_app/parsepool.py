@@ -0,0 +1,134 @@
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+import multiprocessing
+import os
+import pickle
+import tempfile
+import threading
+
+# One pool of parse processes per web worker, started the first time a job needs it
+_pool = None
+_pool_lock = threading.Lock()
+
+# How often (seconds) a job waiting on its file's parse shows a sign of life, well within UPLOAD_JOB_TIMEOUT
+HEARTBEAT_INTERVAL = 60
+
+
+def _init_worker():
+    # Runs once in every parse process, the parsers read their settings (INGEST_CSV_ENGINE, ...) from Django
+    import django
+    django.setup()
+
+
+def parse_file(path, chunk_size):
+    """
+        Runs in a parse process: reads, parses + fingerprints a whole CSV one chunk at a time
+
+        Every finished chunk is pickled into a spool file right away, so neither this process nor the job
+        reading it back ever holds more than a chunk
+        Returns the spool file's path + the rejection report
+    """
+    from .fingerprints import FingerprintCounter
+    from .parsing import StatementParser, read_chunks
+
+    parser = StatementParser()
+    fingerprints = FingerprintCounter()
+    fd, spool_path = tempfile.mkstemp(prefix='parsed-', suffix='.pickle')
+    try:
+        with os.fdopen(fd, 'wb') as spool, open(path, 'rb') as file:
+            for raw in read_chunks(file, chunk_size, report=parser.report):
+                df, rejected = parser.parse(raw)
+                df = df.assign(fingerprint=fingerprints.fingerprints(df))
+                pickle.dump((df, rejected), spool, protocol=pickle.HIGHEST_PROTOCOL)
+    except BaseException:
+        os.remove(spool_path)
+        raise
+    return spool_path, parser.report.as_dict()
+
+
+def read_spool(spool_path):
+    """
+        The (parsed chunk, rows rejected) pairs parse_file wrote, one at a time
+
+        Removing the file is up to the caller (see remove_spool), also when it's never read to the end
+    """
+    with open(spool_path, 'rb') as spool:
+        while True:
+            try:
+                yield pickle.load(spool)
+            except EOFError:
+                return
+
+
+def remove_spool(spool_path):
+    try:
+        os.remove(spool_path)
+    except FileNotFoundError:
+        pass
+
+
+def _remove_finished_spool(future):
+    # Nobody's waiting for this parse anymore, its spool goes as soon as it's written
+    if not future.cancelled() and future.exception() is None:
+        remove_spool(future.result()[0])
+
+
+def get_parse_pool():
+    """
+        Bounded pool of PARSE_WORKERS processes, pandas/fingerprinting of several files at once uses every core
+
+        spawn (not fork): the web process has threads running (upload jobs) that a fork would copy mid-flight
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.PARSE_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker
+            )
+    return _pool
+
+
+def _drop_parse_pool(pool):
+    """
+        A parse process died (killed, out of memory), the pool refuses any more work: the next job gets a new one
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def _wait_for_parse(future, heartbeat, interval):
+    try:
+        while True:
+            try:
+                return future.result(timeout=interval or HEARTBEAT_INTERVAL)
+            except FutureTimeoutError:
+                if heartbeat:
+                    heartbeat()
+    except BaseException:
+        future.add_done_callback(_remove_finished_spool)
+        raise
+
+
+def parse_in_pool(path, chunk_size, heartbeat=None, interval=None):
+    """
+        parse_file in one of the parse processes, blocks the calling (job) thread until it's done
+
+        - heartbeat() is called every interval (HEARTBEAT_INTERVAL) seconds while we wait, a big file can take
+          a while to parse and its job must not look gone meanwhile (jobs.stale_uploads)
+        - If we stop waiting (heartbeat raised, ...) the spool is removed once the parse process is done with it
+        - A broken pool is replaced and the file parsed once more, if the new one breaks too the job fails
+    """
+    for attempt in range(2):
+        pool = get_parse_pool()
+        try:
+            return _wait_for_parse(pool.submit(parse_file, path, chunk_size), heartbeat, interval)
+        except BrokenProcessPool:
+            _drop_parse_pool(pool)
+            if attempt:
+                raise
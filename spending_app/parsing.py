@@ -0,0 +1,279 @@
+from collections import Counter
+from contextlib import contextmanager
+from decimal import Decimal
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+import csv
+import io
+import numpy as np
+import os
+import pandas as pd
+
+try:
+    # Optional: multithreaded CSV reader, several times faster than the csv module
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+except ImportError:
+    pa = None
+
+# Columns we expect in every upload, anything else in the file is never loaded
+CSV_COLUMNS = ['Date', 'Vendor', 'Category', 'Amount']
+
+# Date layouts we've seen in bank exports, tried in this order (US month-first before day-first)
+DATE_FORMATS = [
+    '%b-%d-%Y',     # Nov-08-2024 (sample_transactions.csv)
+    '%Y-%m-%d',
+    '%m/%d/%Y',
+    '%d/%m/%Y',
+    '%m-%d-%Y',
+    '%d-%m-%Y',
+    '%Y/%m/%d',
+    '%d-%b-%Y',
+    '%b %d %Y',
+    '%b %d, %Y',
+    '%d %b %Y',
+    '%B %d, %Y',
+    '%m/%d/%y',
+]
+# How many dates of the first chunk we look at to pick the format
+DATE_SAMPLE_SIZE = 1000
+
+# Amounts go through float64, whole cents are only exact below 2^53 (~90 trillion dollars), bigger is an invalid amount
+MAX_CENTS = 2 ** 53
+
+# How many rejected rows we keep (with their values) in the report, the counts cover all of them
+REJECTION_SAMPLE_SIZE = 100
+
+
+def detect_date_format(values):
+    """
+        Picks the DATE_FORMATS entry that parses the most of these dates (once per file)
+
+        pd.to_datetime without a format guesses the layout of every single value, with a format
+        it's one vectorized strptime over the column
+        Returns None if nothing fits, we then fall back to guessing per value
+    """
+    sample = values.dropna().str.strip().head(DATE_SAMPLE_SIZE)
+    if sample.empty:
+        return None
+    best_format, best_parsed = None, 0
+    for date_format in DATE_FORMATS:
+        parsed = int(pd.to_datetime(sample, format=date_format, errors='coerce').notna().sum())
+        if parsed > best_parsed:
+            best_format, best_parsed = date_format, parsed
+            if parsed == len(sample):
+                break
+    return best_format
+
+
+class RejectionReport:
+    """
+        Why rows were rejected: a count per reason + the first REJECTION_SAMPLE_SIZE rows with their line numbers
+    """
+    def __init__(self):
+        self.counts = Counter()
+        self.samples = []
+
+    def add(self, raw, reasons):
+        """
+            raw: the chunk as it came out of the file, reasons: a reason (or None) for each of its rows
+        """
+        rejected = reasons.dropna()
+        if rejected.empty:
+            return
+        self.counts.update(rejected.value_counts().to_dict())
+        room = REJECTION_SAMPLE_SIZE - len(self.samples)
+        if room > 0:
+            sample = rejected.head(room)
+            rows = raw.loc[sample.index, CSV_COLUMNS]
+            rows = rows.astype(object).where(rows.notna(), None)
+            for index, reason, values in zip(sample.index, sample.tolist(), rows.to_dict('records')):
+                # +2: the header is line 1 and the index starts at 0
+                self.samples.append({'line': int(index) + 2, 'reason': reason, 'row': values})
+
+    def add_malformed(self, line, text):
+        # A line the CSV reader couldn't split into our columns at all (line is None if the reader doesn't say)
+        self.counts['malformed line'] += 1
+        if len(self.samples) < REJECTION_SAMPLE_SIZE:
+            self.samples.append({'line': line, 'reason': 'malformed line', 'row': text})
+
+    def total(self):
+        return sum(self.counts.values())
+
+    def as_dict(self):
+        return {'counts': dict(self.counts), 'rows': self.samples}
+
+
+class StatementParser:
+    """
+        Turns raw upload chunks (every column still a string) into clean typed rows
+
+        - The date format is detected on the first chunk and reused for the rest of the file
+        - Date ends up as datetime.date and Amount as int64 Cents (+ the Decimal Amount for the ORM),
+          nothing goes back through strings
+        - Bad rows are flagged with column operations and collected in self.report, never raised
+    """
+    def __init__(self, date_format=None):
+        self.date_format = date_format
+        self.report = RejectionReport()
+
+    def parse_dates(self, values):
+        if self.date_format is None:
+            self.date_format = detect_date_format(values) or 'mixed'
+        return pd.to_datetime(values.str.strip(), format=self.date_format, errors='coerce').dt.date
+
+    @staticmethod
+    def parse_cents(values):
+        # $1,234.50 -> 123450, anything that isn't a number -> NaN
+        amounts = pd.to_numeric(values, errors='coerce')
+        # Only the amounts that didn't parse as plain numbers go through the (slower) clean up
+        retry = amounts.isna() & values.notna()
+        if retry.any():
+            amounts[retry] = pd.to_numeric(values[retry].str.replace(r'[$,\s]', '', regex=True), errors='coerce')
+        cents = (amounts * 100).round()
+        # inf/-inf parse as numbers too, they'd blow up the int64 cast of the whole chunk
+        return cents.where(np.isfinite(cents) & (cents.abs() < MAX_CENTS))
+
+    def parse(self, raw):
+        """
+            Returns the valid rows (Date, Vendor, Category, Cents, Amount) + how many rows we rejected
+        """
+        vendor = raw['Vendor'].str.strip()
+        category = raw['Category'].str.strip().str.lower()     # Lower because we'll be adding them into Category model
+        dates = self.parse_dates(raw['Date'])
+        cents = self.parse_cents(raw['Amount'])
+
+        # First problem found wins, the order here is the order we report them in
+        reasons = pd.Series(None, index=raw.index, dtype=object)
+        for reason, invalid in (
+            ('invalid date', dates.isna()),
+            ('invalid amount', cents.isna()),
+            ('missing vendor', vendor.fillna('').eq('')),
+            ('missing category', category.fillna('').eq('')),
+        ):
+            reasons = reasons.mask(reasons.isna() & invalid, reason)
+        self.report.add(raw, reasons)
+
+        valid = reasons.isna()
+        df = pd.DataFrame({
+            'Date': dates[valid],
+            'Vendor': vendor[valid],
+            'Category': category[valid],
+            'Cents': cents[valid].astype('int64'),
+        })
+        df['Amount'] = [Decimal(value).scaleb(-2) for value in df['Cents'].tolist()]
+        return df, int((~valid).sum())
+
+
+def csv_engine():
+    engine = settings.INGEST_CSV_ENGINE
+    if engine == 'auto':
+        return 'pyarrow' if pa is not None else 'c'
+    return engine
+
+
+@contextmanager
+def _text_lines(file):
+    """
+        Any of what uploads hand us (path, binary or text file) as text for the csv module, a BOM is dropped
+    """
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, encoding='utf-8-sig', newline='') as text:
+            yield text
+    elif isinstance(file, io.TextIOBase):
+        yield file
+    else:
+        text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+        try:
+            yield text
+        finally:
+            # Closing the file is up to whoever opened it
+            text.detach()
+
+
+def _lines_frame(rows, lines, header):
+    df = pd.DataFrame(rows, columns=header, index=pd.Index(lines) - 2)[CSV_COLUMNS]
+    # Empty fields are missing values, like na_values=[''] in pandas' readers
+    return df.mask(df.eq(''))
+
+
+def _csv_chunks(file, chunk_size, report):
+    """
+        Python's csv module (C code) splits the lines, every chunk_size rows become a DataFrame
+
+        - Not pandas' own parsers: they quietly cut a line with too many fields down to the header (or turn its
+          first field into the index at the start of a chunk) instead of telling us about it
+        - A line with more fields than the header goes to the report as a malformed line, shorter ones are
+          padded with missing values (their rows are rejected by the parser)
+        - The index is the line number - 2 (header is line 1, the index starts at 0), also after malformed lines
+    """
+    with _text_lines(file) as text:
+        reader = csv.reader(text)
+        header = [name.lstrip('\ufeff') for name in next(reader, [])]
+        missing = [column for column in CSV_COLUMNS if column not in header]
+        if missing:
+            raise ValueError(f'The file is missing the column(s): {", ".join(missing)}')
+
+        rows, lines = [], []
+        for row in reader:
+            if len(row) > len(header):
+                report.add_malformed(reader.line_num, ','.join(row))
+            elif row:
+                rows.append(row)
+                lines.append(reader.line_num)
+                if len(rows) == chunk_size:
+                    yield _lines_frame(rows, lines, header)
+                    rows, lines = [], []
+        if rows:
+            yield _lines_frame(rows, lines, header)
+
+
+def _arrow_chunks(file, chunk_size, report):
+    """
+        pyarrow's streaming reader, record batches are gathered into chunk_size rows before going to pandas
+    """
+    def invalid_row(row):
+        report.add_malformed(row.number, row.text)
+        return 'skip'
+
+    reader = pa_csv.open_csv(
+        file,
+        parse_options=pa_csv.ParseOptions(invalid_row_handler=invalid_row),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=CSV_COLUMNS,
+            strings_can_be_null=True,
+            column_types={column: pa.string() for column in CSV_COLUMNS}
+        )
+    )
+    batches, rows, start = [], 0, 0
+    for batch in reader:
+        batches.append(batch)
+        rows += batch.num_rows
+        if rows >= chunk_size:
+            yield _arrow_frame(batches, start)
+            batches, start, rows = [], start + rows, 0
+    if rows:
+        yield _arrow_frame(batches, start)
+
+
+def _arrow_frame(batches, start):
+    df = pa.Table.from_batches(batches).to_pandas()
+    # Running index (line number - 2) like _csv_chunks, so line numbers in the report line up
+    # (rows after a malformed line are off by the lines pyarrow skipped, it doesn't tell us where good rows came from)
+    df.index = pd.RangeIndex(start, start + len(df))
+    return df
+
+
+def read_chunks(file, chunk_size, report=None, engine=None):
+    """
+        Streams the CSV in DataFrames of about chunk_size rows, every column as strings
+
+        Uses pyarrow when it's installed (settings.INGEST_CSV_ENGINE), the csv module otherwise
+        Lines with more fields than the header are left out and counted in the report as 'malformed line'
+    """
+    engine = engine or csv_engine()
+    if engine == 'pyarrow':
+        if pa is None:
+            raise ImproperlyConfigured("INGEST_CSV_ENGINE is 'pyarrow' but pyarrow isn't installed")
+        return _arrow_chunks(file, chunk_size, report if report is not None else RejectionReport())
+    return _csv_chunks(file, chunk_size, report if report is not None else RejectionReport())
@@ -0,0 +1,171 @@
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from .reports import TEMPLATE_NAME, render_report, store_report
+import multiprocessing
+import threading
+import time
+
+# One pool of render processes per web worker, started on first use (or by warm_report_pool)
+_pool = None
+# Re-entrant: a render that finishes before its callback is added runs the callback under the lock
+_pool_lock = threading.RLock()
+# Renders currently running, so two downloads of the same report share one render
+_pending = {}
+
+# Loaded once per render process by _init_worker
+_worker = {}
+
+
+def _init_worker():
+    """
+        Runs once in every render process: Django, the template, Bootstrap + fonts are loaded up front
+        so each render only has to lay out the page
+    """
+    import django
+    django.setup()
+    from django.contrib.staticfiles import finders
+    from django.template.loader import get_template
+    from weasyprint import CSS, HTML, default_url_fetcher
+    from weasyprint.text.fonts import FontConfiguration
+
+    font_config = FontConfiguration()
+    stylesheets = {}
+    for static_path in settings.REPORT_STYLESHEETS:
+        stylesheets[settings.STATIC_URL + static_path] = CSS(filename=finders.find(static_path), font_config=font_config)
+
+    def url_fetcher(url, *args, **kwargs):
+        # The template still <link>s its stylesheets, they're already parsed so hand WeasyPrint an empty one
+        if any(url.endswith(static_url) for static_url in stylesheets):
+            return {'string': '', 'mime_type': 'text/css'}
+        return default_url_fetcher(url, *args, **kwargs)
+
+    _worker.update(
+        HTML=HTML,
+        template=get_template(TEMPLATE_NAME),
+        stylesheets=list(stylesheets.values()),
+        font_config=font_config,
+        url_fetcher=url_fetcher
+    )
+    # Warm up pango/fontconfig with a throwaway page
+    HTML(string='<p>warm up</p>').write_pdf(font_config=font_config)
+
+
+def _render_in_worker(context, base_url):
+    html_str = _worker['template'].render(context)
+    return _worker['HTML'](string=html_str, base_url=base_url, url_fetcher=_worker['url_fetcher']).write_pdf(
+        stylesheets=_worker['stylesheets'],
+        font_config=_worker['font_config']
+    )
+
+
+def _store_rendered(key, rendered, future, pool):
+    # Runs in the web worker once the render is done: the cache is wherever *its* settings point
+    # (the render processes load their settings from scratch, overrides never make it over there)
+    # Whoever waits on future only wakes up once the PDF is stored and the render isn't pending anymore,
+    # so asking again after a failure starts a new render instead of joining the failed one
+    pdf, error = None, None
+    try:
+        pdf = rendered.result()
+        store_report(key, pdf)
+    except Exception as e:
+        error = e
+    with _pool_lock:
+        _pending.pop(key, None)
+        if isinstance(error, BrokenProcessPool):
+            _drop_report_pool(pool)
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(pdf)
+
+
+def _warm_up():
+    # Keeps a worker busy for a moment so the pool starts a new process for every warm up task
+    time.sleep(0.2)
+
+
+def get_report_pool():
+    """
+        Bounded pool of REPORT_RENDER_WORKERS processes, WeasyPrint never runs in the web worker itself
+
+        spawn (not fork): the web process has threads running (upload jobs) that a fork would copy mid-flight
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.REPORT_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker
+            )
+    return _pool
+
+
+def _drop_report_pool(pool):
+    """
+        A render process died (killed, out of memory), the pool refuses any more work: the next render gets a new one
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def warm_report_pool():
+    """
+        Starts every render process now so the first download doesn't pay for the start up
+    """
+    if settings.REPORT_RENDER_WORKERS:
+        pool = get_report_pool()
+        for _ in range(settings.REPORT_RENDER_WORKERS):
+            pool.submit(_warm_up)
+
+
+def submit_report(key, context, base_url):
+    """
+        Starts rendering a report in the background (or joins the render already running for it)
+
+        Returns a Future with the PDF bytes, the PDF also lands in the report cache (written by this process)
+        - A pool that's already broken is replaced right away, one that breaks mid-render fails that render
+          and is replaced for the next one
+        REPORT_RENDER_WORKERS = 0 renders right here instead (tests + scripts)
+    """
+    if not settings.REPORT_RENDER_WORKERS:
+        future = Future()
+        try:
+            pdf = render_report(context, base_url)
+            store_report(key, pdf)
+            future.set_result(pdf)
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    for attempt in range(2):
+        pool = get_report_pool()
+        with _pool_lock:
+            future = _pending.get(key)
+            if future is not None:
+                return future
+            try:
+                rendered = pool.submit(_render_in_worker, context, base_url)
+            except BrokenProcessPool:
+                _drop_report_pool(pool)
+                if attempt:
+                    raise
+                continue
+            future = _pending[key] = Future()
+            rendered.add_done_callback(lambda rendered: _store_rendered(key, rendered, future, pool))
+            return future
+
+
+def shutdown_report_pool():
+    """
+        Stops the render processes (the next render starts a new pool)
+    """
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
@@ -0,0 +1,142 @@
+from django.conf import settings
+from django.template.loader import get_template, render_to_string
+from functools import lru_cache
+from hashlib import sha256
+import json
+import os
+import tempfile
+from .metrics import span
+
+TEMPLATE_NAME = 'reports/summary_report.html'
+
+
+@lru_cache(maxsize=8)
+def _file_hash(path, mtime):
+    with open(path, 'rb') as template_file:
+        return sha256(template_file.read()).hexdigest()[:16]
+
+
+def template_version():
+    """
+        Hash of the report template, editing the template automatically retires every cached PDF
+    """
+    path = get_template(TEMPLATE_NAME).origin.name
+    return _file_hash(path, os.path.getmtime(path))
+
+
+def report_key(upload, summary):
+    """
+        Content address of a report: upload + what's printed on it + the template that prints it
+
+        Prefixed with the upload id so we can drop every report of an upload at once
+    """
+    fingerprint = json.dumps({'file_name': upload.get_file_name(), 'summary': summary}, sort_keys=True, default=str)
+    digest = sha256(f'{fingerprint}:{template_version()}'.encode()).hexdigest()[:32]
+    return f'{upload.id}-{digest}'
+
+
+def cache_path(key):
+    return os.path.join(settings.REPORT_CACHE_DIR, f'{key}.pdf')
+
+
+def open_cached_report(key):
+    """
+        Opens the cached PDF (or None), bumps its mtime so LRU eviction knows it was just used
+
+        An open file keeps working even if eviction removes it while we're still sending it
+    """
+    path = cache_path(key)
+    try:
+        report = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+    return report
+
+
+def store_report(key, pdf):
+    """
+        Writes the PDF into the cache then evicts the least recently used ones if we're over the size limit
+    """
+    os.makedirs(settings.REPORT_CACHE_DIR, exist_ok=True)
+    # Write to a temp file first then rename, so nobody ever reads half a PDF
+    fd, tmp_path = tempfile.mkstemp(dir=settings.REPORT_CACHE_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as tmp:
+        tmp.write(pdf)
+    os.replace(tmp_path, cache_path(key))
+    evict_reports()
+
+
+def _cached_files():
+    try:
+        entries = list(os.scandir(settings.REPORT_CACHE_DIR))
+    except FileNotFoundError:
+        return []
+    return [entry for entry in entries if entry.name.endswith('.pdf')]
+
+
+def evict_reports(max_bytes=None):
+    """
+        Size bounded LRU: drops the least recently used PDFs until the cache fits REPORT_CACHE_MAX_BYTES
+    """
+    max_bytes = settings.REPORT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    files = []
+    for entry in _cached_files():
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def invalidate_reports(upload_ids):
+    """
+        Removes every cached PDF of these uploads (their transactions changed)
+    """
+    prefixes = tuple(f'{upload_id}-' for upload_id in upload_ids)
+    if not prefixes:
+        return
+    for entry in _cached_files():
+        if entry.name.startswith(prefixes):
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+def report_context(upload, summary):
+    """
+        Everything the template needs (plain data, so it could be sent over to a render worker)
+    """
+    return {
+        'file_name': upload.get_file_name(),
+        'summary': summary
+    }
+
+
+def render_report(context, base_url):
+    """
+        Renders the summary template then runs it through WeasyPrint (right here, no render pool)
+    """
+    # WeasyPrint pulls in pango/cairo, only load it once we actually have to render
+    from weasyprint import HTML
+
+    with span('template'):
+        # By passing context we could now use this context in our HTML template
+        html_str = render_to_string(TEMPLATE_NAME, context)
+    with span('pdf'):
+        # Must provide base_url because of static files
+        return HTML(string=html_str, base_url=base_url).write_pdf()
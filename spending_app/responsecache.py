@@ -0,0 +1,133 @@
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.http import parse_etags, quote_etag
+from functools import wraps
+from hashlib import sha256
+import json
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+from uuid import uuid4
+from .models import CacheVersion, Category
+
+CATEGORIES = 'categories'
+# Anything shown across every upload at once, bumped along with any upload
+UPLOADS = 'uploads'
+# Version of a key that has no CacheVersion row yet
+INITIAL_VERSION = '0'
+
+
+def upload_key(upload_id):
+    return f'upload:{upload_id}'
+
+
+def category_key(slug):
+    return f'category:{slug}'
+
+
+def _new_version():
+    return uuid4().hex
+
+
+def current_versions(keys):
+    """
+        The version of every key, one SELECT and no writes (a GET never takes the write lock)
+
+        Keys nobody has bumped yet are at version 0: every write bumps what it changes, so a response cached
+        under 0 can only have been built from rows that were never written to since
+        Bumps are random (instead of counting up from 0) so an id SQLite hands out again after a rollback
+        never finds the responses cached for the rolled back rows
+    """
+    versions = dict(CacheVersion.objects.filter(key__in=keys).values_list('key', 'version'))
+    return [versions.get(key, INITIAL_VERSION) for key in keys]
+
+
+def bump_versions(upload_ids=(), category_ids=(), category_slugs=(), categories=False):
+    """
+        Retires every cached response of these uploads/categories (+ the category list if categories)
+
+        Any upload also retires the responses across every upload (UPLOADS)
+        Call this inside the same atomic block as the write
+    """
+    keys = [upload_key(upload_id) for upload_id in upload_ids]
+    if keys:
+        keys.append(UPLOADS)
+    keys += [category_key(slug) for slug in category_slugs]
+    if category_ids:
+        # Category responses are looked up by slug
+        keys += [category_key(slug) for slug in Category.objects.filter(id__in=category_ids).values_list('slug', flat=True)]
+    if categories:
+        keys.append(CATEGORIES)
+    if keys:
+        CacheVersion.objects.bulk_create(
+            [CacheVersion(key=key, version=_new_version()) for key in set(keys)],
+            update_conflicts=True,
+            unique_fields=['key'],
+            update_fields=['version']
+        )
+
+
+def _lookup(request, keys):
+    """
+        ETag of the response + the cached response (or None): one query for the versions, nothing else
+    """
+    # Same url (host, query string) + same representation (json/browsable api) + same versions
+    fingerprint = '|'.join([request.build_absolute_uri(), request.accepted_renderer.format, *current_versions(keys)])
+    key = sha256(fingerprint.encode()).hexdigest()[:32]
+    etag = quote_etag(key)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        return key, etag, Response(status=status.HTTP_304_NOT_MODIFIED)
+    data = caches[settings.RESPONSE_CACHE].get(f'response:{key}')
+    return key, etag, None if data is None else Response(data)
+
+
+def _plain(data):
+    # What the JSON renderer would send, as plain dicts/lists/strings: hyperlinks pickle the model instance
+    # they point to (+ str() it, one query per row for a transaction), dates and decimals render the same
+    return json.loads(json.dumps(data, cls=JSONEncoder))
+
+
+def _finish(key, etag, response, cached):
+    if response.status_code not in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+        return response
+    if not cached:
+        caches[settings.RESPONSE_CACHE].set(f'response:{key}', _plain(response.data), settings.RESPONSE_CACHE_TIMEOUT)
+    response['ETag'] = etag
+    # Clients may keep it but have to ask (If-None-Match) before using it again
+    response['Cache-Control'] = 'private, no-cache'
+    response['Access-Control-Expose-Headers'] = 'ETag'
+    return response
+
+
+def cache_response(keys):
+    """
+        Read-through cache + strong ETags for a DRF handler (sync or async) and its 200 responses
+
+        keys(view, **kwargs): the version keys (upload_key/category_key/CATEGORIES/UPLOADS) the response depends on
+        - If-None-Match with the current ETag: 304, the handler doesn't run
+        - Cached: the stored response data is rendered again, the handler doesn't run
+        - Otherwise the handler runs and its data is stored under the current versions
+        The versions are read before the handler reads anything, so a write landing in between can
+        only leave newer data under an old version, never old data under the new one
+    """
+    def decorator(handler):
+        if iscoroutinefunction(handler):
+            @wraps(handler)
+            async def async_wrapper(view, request, *args, **kwargs):
+                key, etag, response = await sync_to_async(_lookup)(request, keys(view, **kwargs))
+                cached = response is not None
+                if not cached:
+                    response = await handler(view, request, *args, **kwargs)
+                return await sync_to_async(_finish)(key, etag, response, cached)
+            return async_wrapper
+
+        @wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            key, etag, response = _lookup(request, keys(view, **kwargs))
+            cached = response is not None
+            if not cached:
+                response = handler(view, request, *args, **kwargs)
+            return _finish(key, etag, response, cached)
+        return wrapper
+    return decorator
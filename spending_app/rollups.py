@@ -0,0 +1,117 @@
+from django.db.models import Count, Sum
+from .models import DailyCategorySpend, DailyCategoryVendorSpend, DailyVendorSpend, Transactions
+from .summaries import to_cents
+
+
+def _apply_deltas(model, key_fields, deltas):
+    """
+        Adds {(date, *keys): [cents, count]} onto the rollup rows of model, keys being the values of key_fields
+
+        - One query loads (and locks) every row we're about to touch
+        - New days are bulk inserted, existing ones bulk updated, empty ones removed
+        Run this inside the same atomic block as the transaction writes
+    """
+    if not deltas:
+        return
+    dates = [day for day, *_ in deltas]
+    existing = {
+        (row.date, *(getattr(row, field) for field in key_fields)): row
+        for row in model.objects.select_for_update().filter(
+            date__range=(min(dates), max(dates)),
+            **{f'{field}__in': {keys[position] for _, *keys in deltas} for position, field in enumerate(key_fields)}
+        )
+    }
+
+    to_create, to_update, to_delete = [], [], []
+    for (day, *keys), (cents, count) in deltas.items():
+        row = existing.get((day, *keys))
+        if row is None:
+            if count > 0:
+                to_create.append(model(date=day, total_cents=cents, transaction_count=count, **dict(zip(key_fields, keys))))
+            continue
+        row.total_cents += cents
+        row.transaction_count += count
+        if row.transaction_count > 0:
+            to_update.append(row)
+        else:
+            # Nothing left on that day
+            to_delete.append(row.id)
+
+    model.objects.bulk_create(to_create)
+    model.objects.bulk_update(to_update, ['total_cents', 'transaction_count'])
+    if to_delete:
+        model.objects.filter(id__in=to_delete).delete()
+
+
+def apply_rollup_deltas(category_deltas, vendor_deltas, category_vendor_deltas):
+    _apply_deltas(DailyCategorySpend, ['category_id'], category_deltas)
+    _apply_deltas(DailyVendorSpend, ['vendor_id'], vendor_deltas)
+    _apply_deltas(DailyCategoryVendorSpend, ['category_id', 'vendor_id'], category_vendor_deltas)
+
+
+def _group(dates, keys, cents, sign):
+    # (date, *keys) -> [sum of cents, count] with one groupby
+    grouped = cents.groupby([dates, *keys]).agg(['sum', 'count'])
+    return {index: [sign * int(total), sign * int(count)] for index, (total, count) in zip(grouped.index, grouped.values)}
+
+
+def add_frame(df):
+    """
+        Rolls up a freshly inserted ingest chunk
+
+        df: parsed chunk with Date, Cents + category_id, vendor_id columns
+    """
+    if df.empty:
+        return
+    apply_rollup_deltas(
+        _group(df['Date'], [df['category_id']], df['Cents'], 1),
+        _group(df['Date'], [df['vendor_id']], df['Cents'], 1),
+        _group(df['Date'], [df['category_id'], df['vendor_id']], df['Cents'], 1)
+    )
+
+
+def apply_rows(added=(), removed=()):
+    """
+        Rolls up a handful of TransactionRows (single transaction create/edit/delete)
+    """
+    category_deltas, vendor_deltas, category_vendor_deltas = {}, {}, {}
+    for rows, sign in ((added, 1), (removed, -1)):
+        for row in rows:
+            for deltas, keys in (
+                (category_deltas, (row.category_id,)),
+                (vendor_deltas, (row.vendor_id,)),
+                (category_vendor_deltas, (row.category_id, row.vendor_id))
+            ):
+                delta = deltas.setdefault((row.date, *keys), [0, 0])
+                delta[0] += sign * row.cents
+                delta[1] += sign
+    apply_rollup_deltas(category_deltas, vendor_deltas, category_vendor_deltas)
+
+
+def _removed(queryset, key_fields):
+    return {
+        (day, *keys): [-to_cents(total), -count]
+        for day, *keys, total, count in queryset.order_by().values_list('date', *key_fields).annotate(Sum('amount'), Count('id'))
+    }
+
+
+def remove_transactions(queryset):
+    """
+        Takes a set of Transactions (about to be deleted) back out of the rollups
+
+        The grouping happens in SQL so this costs one query per rollup, not one per row
+    """
+    apply_rollup_deltas(
+        _removed(queryset, ['category_id']),
+        _removed(queryset, ['vendor_id']),
+        _removed(queryset, ['category_id', 'vendor_id'])
+    )
+
+
+def delete_upload_transactions(upload):
+    """
+        Deletes every Transaction of an upload and keeps the rollups in sync
+    """
+    transactions = Transactions.objects.filter(transaction_upload=upload)
+    remove_transactions(transactions)
+    transactions.delete()
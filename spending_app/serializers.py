@@ -1,10 +1,29 @@
 from rest_framework import serializers
-from .models import Category, Transactions, TransactionUploads
+from .models import Category, Transactions, TransactionUploads, Vendor
 from rest_framework.reverse import reverse
+from .vendors import resolve_vendor_ids
+from .batchuploads import validate_member
+
+
+class VendorNameField(serializers.CharField):
+    """
+        Transactions point at a Vendor, the API still reads and writes the vendor's name
+
+        Reading needs the vendor loaded with the transaction (select_related('vendor')), writing hands
+        the name on as is, TransactionWriteSerializer turns it into the Vendor
+    """
+    def __init__(self, **kwargs):
+        kwargs.setdefault('max_length', Vendor._meta.get_field('name').max_length)
+        super().__init__(**kwargs)
+
+    def to_representation(self, vendor):
+        return vendor.name
+
 
 
 # GET method
 class TransactionReadSerializer(serializers.HyperlinkedModelSerializer):
+    vendor = VendorNameField(read_only=True)
     category_name = serializers.SerializerMethodField()
     upload_id = serializers.SerializerMethodField()
 
@@ -12,7 +31,8 @@ class TransactionReadSerializer(serializers.HyperlinkedModelSerializer):
         return transaction.category.category_name
     
     def get_upload_id(self, transaction):
-        return transaction.transaction_upload.id
+        # The FK column already has the id, no need to load the upload
+        return transaction.transaction_upload_id
 
     class Meta: 
         model = Transactions
@@ -30,11 +50,14 @@ class TransactionReadSerializer(serializers.HyperlinkedModelSerializer):
         extra_kwargs = {
             # Slug Belongs to Category Model make sure the lookup_field belongs to the respective Model NOT THE CURRENT MODEL (Transactions)
             'category': {'view_name': 'category-detail', 'lookup_field': 'slug'},
-            'transaction_upload': {'view_name': 'transaction-uploads-detail', 'lookup_field': 'id'}
+            # Looking up by pk lets DRF build the link from transaction_upload_id without loading the upload
+            'transaction_upload': {'view_name': 'transaction-uploads-detail', 'lookup_field': 'pk', 'lookup_url_kwarg': 'id'}
         }
 
 class NestedTransactionSerializer(serializers.HyperlinkedModelSerializer):
     # Limiting the important information for Nested Transactions Serializer
+    vendor = VendorNameField(read_only=True)
+
     class Meta: 
         model = Transactions
         fields = (
@@ -47,13 +70,29 @@ class NestedTransactionSerializer(serializers.HyperlinkedModelSerializer):
 
 # Put, Patch, Post
 class TransactionWriteSerializer(serializers.ModelSerializer):
+    vendor = VendorNameField()
+
+    def _vendor(self, validated_data):
+        # Vendors we've never seen are created here, save() runs inside the view's atomic block
+        if 'vendor' in validated_data:
+            name = validated_data['vendor']
+            validated_data['vendor'] = Vendor(id=resolve_vendor_ids([name])[name], name=name)
+        return validated_data
+
+    def create(self, validated_data):
+        return super().create(self._vendor(validated_data))
+
+    def update(self, instance, validated_data):
+        return super().update(instance, self._vendor(validated_data))
+
     class Meta: 
         model = Transactions
         fields = (
             'vendor',
             'amount',
             'date',
-            'category'
+            'category',
+            'transaction_upload'
         )
 
 # GET method
@@ -70,17 +109,21 @@ class CategoryReadSerializer(serializers.HyperlinkedModelSerializer):
         }
 
 class CategoryRetrieveSerializer(serializers.HyperlinkedModelSerializer):
-    # Includes all of the transactions for when we view the individual Category
-    #
-    # Note: This follows the related_name in models
-    transactions = NestedTransactionSerializer(many=True, read_only=True)
+    # Aggregates over all of the transactions for when we view the individual Category (Category.get_stats)
+    # The transactions themselves come one page at a time next to it (CategoryTransactionPagination)
+    stats = serializers.SerializerMethodField()
+
+    def get_stats(self, category):
+        # Computed by the view beforehand, async views can't run queries in here
+        return self.context['stats']
+
     class Meta: 
         model = Category
         fields = (
             'category_name',
             'slug',
             'url',
-            'transactions'
+            'stats'
         )
         extra_kwargs = {
             'url': {'view_name': 'category-detail', 'lookup_field': 'slug'}
@@ -101,6 +144,13 @@ class TransactionUploadsSerializer(serializers.HyperlinkedModelSerializer):
     def get_file_name(self, upload):
         return upload.get_file_name()
 
+    def validate_file(self, file):
+        # Same rules as every file of a multi-file/ZIP upload
+        error = validate_member(file.name, file.size)
+        if error:
+            raise serializers.ValidationError(error)
+        return file
+
     class Meta:
         model = TransactionUploads
         fields = [
@@ -108,13 +158,43 @@ class TransactionUploadsSerializer(serializers.HyperlinkedModelSerializer):
             'file',
             'file_name',
             'uploaded_at',
+            'status',
             'url'
         ]
-        read_only_fields = ['id', 'uploaded_at', 'url']
+        read_only_fields = ['id', 'uploaded_at', 'status', 'url']
         extra_kwargs = {
             'url': {'view_name': 'transaction-uploads-detail', 'lookup_field': 'id'}
         }
 
+class TransactionUploadStatusSerializer(serializers.ModelSerializer):
+    # Progress of the background job that ingests the file
+    elapsed_seconds = serializers.SerializerMethodField()
+    summary_url = serializers.SerializerMethodField()
+
+    def get_elapsed_seconds(self, upload):
+        return upload.get_elapsed_seconds()
+
+    def get_summary_url(self, upload):
+        # Summary only makes sense once every row made it in
+        if upload.status != TransactionUploads.Status.DONE:
+            return None
+        request = self.context.get('request')
+        return reverse('summary-transaction-uploads', args=[upload.id], request=request, format=None)
+
+    class Meta:
+        model = TransactionUploads
+        fields = [
+            'id',
+            'status',
+            'rows_processed',
+            'rows_rejected',
+            'rows_skipped',
+            'rejections',
+            'elapsed_seconds',
+            'error',
+            'summary_url',
+        ]
+
 class TransactionDetailsSerializer(serializers.ModelSerializer):
     transactions = NestedTransactionSerializer(many=True, read_only=True)
     summary_url = serializers.SerializerMethodField()
@@ -133,4 +213,51 @@ class TransactionDetailsSerializer(serializers.ModelSerializer):
             'summary_url',
             'transactions',
         ]
-        
\ No newline at end of file
+        
+
+class TimeSeriesQuerySerializer(serializers.Serializer):
+    """
+        Query parameters of the spending time series (validation only, nothing is saved)
+    """
+    GRANULARITIES = ['day', 'week', 'month', 'year']
+    GROUP_BY = ['category', 'vendor', 'total']
+
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    granularity = serializers.ChoiceField(choices=GRANULARITIES, default='month')
+    group_by = serializers.ChoiceField(choices=GROUP_BY, default='category')
+
+    def validate(self, data):
+        if data.get('start') and data.get('end') and data['start'] > data['end']:
+            raise serializers.ValidationError('start must be on or before end')
+        return data
+
+
+class TransactionFilterSerializer(serializers.Serializer):
+    """
+        Query parameters used to narrow down transactions (see filters.py)
+    """
+    upload = serializers.IntegerField(required=False, min_value=1)
+    category = serializers.SlugField(required=False)
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    min_amount = serializers.DecimalField(required=False, max_digits=19, decimal_places=2)
+    max_amount = serializers.DecimalField(required=False, max_digits=19, decimal_places=2)
+    # Exact name, name starting with (both case-sensitive) + case-insensitive substring
+    vendor = serializers.CharField(required=False, max_length=155)
+    vendor_prefix = serializers.CharField(required=False, max_length=155)
+    vendor_search = serializers.CharField(required=False, max_length=155)
+
+    def validate(self, data):
+        if data.get('start') and data.get('end') and data['start'] > data['end']:
+            raise serializers.ValidationError('start must be on or before end')
+        if data.get('min_amount') is not None and data.get('max_amount') is not None and data['min_amount'] > data['max_amount']:
+            raise serializers.ValidationError('min_amount must be at most max_amount')
+        return data
+
+
+class TransactionExportQuerySerializer(TransactionFilterSerializer):
+    FILE_TYPES = ['csv', 'ndjson']
+
+    # Not called "format" because DRF already uses ?format= to pick a renderer
+    file_type = serializers.ChoiceField(choices=FILE_TYPES, default='csv')
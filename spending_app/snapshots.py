@@ -0,0 +1,242 @@
+from decimal import Decimal
+from django.conf import settings
+from django.db.models import F
+import json
+import numpy as np
+import os
+import pandas as pd
+import shutil
+import tempfile
+from .models import Category, Transactions, TransactionUploads, Vendor
+
+# Every column of a snapshot and how it's stored
+# date: days since 1970-01-01, category/vendor: codes into meta.json's category_ids/vendor_ids
+COLUMNS = {
+    'date': np.dtype('int32'),
+    'cents': np.dtype('int64'),
+    'category': np.dtype('int32'),
+    'vendor': np.dtype('int32'),
+}
+
+# Rows per query when a snapshot is rebuilt from the database
+REBUILD_CHUNK_SIZE = 50000
+
+
+def snapshot_name(upload, version):
+    # uploaded_at is in there because SQLite hands out the id of a rolled back upload again,
+    # its leftover snapshot must never be mistaken for the new upload's
+    return f'{upload.id}-{upload.uploaded_at:%Y%m%d%H%M%S%f}-v{version}'
+
+
+def snapshot_path(upload, version):
+    return os.path.join(settings.SNAPSHOT_DIR, snapshot_name(upload, version))
+
+
+def _as_date(days):
+    return np.datetime64(int(days), 'D').astype(object)
+
+
+def _totals(codes, cents, size):
+    # Per code: cents (bincount adds in float64, exact for anything under 2^53 cents) + count
+    totals = np.rint(np.bincount(codes, weights=cents, minlength=size)).astype('int64')
+    return totals, np.bincount(codes, minlength=size)
+
+
+class SnapshotWriter:
+    """
+        Streams an upload's rows into a new snapshot, one parsed DataFrame chunk at a time
+
+        - Columns are appended to raw files as we go, only one chunk is ever in memory
+        - save() puts the .npy headers in front and moves the finished directory into place in one rename,
+          nobody ever sees half a snapshot
+    """
+    def __init__(self, upload, version):
+        self.upload = upload
+        self.version = version
+        self.rows = 0
+        self.category_codes = {}
+        self.vendor_codes = {}
+        os.makedirs(settings.SNAPSHOT_DIR, exist_ok=True)
+        self.tmp_dir = tempfile.mkdtemp(dir=settings.SNAPSHOT_DIR, prefix='.tmp-')
+        self.files = {name: open(os.path.join(self.tmp_dir, f'{name}.raw'), 'wb') for name in COLUMNS}
+
+    @staticmethod
+    def _codes(values, codes):
+        # The first time we see a value it gets the next code
+        for value in pd.unique(values):
+            codes.setdefault(value, len(codes))
+        return values.map(codes).to_numpy(dtype='int32')
+
+    def add(self, df):
+        """
+            df: Date (datetime.date), Cents + category_id, vendor_id columns, like ingest's inserted rows
+        """
+        if df.empty:
+            return
+        columns = {
+            'date': pd.to_datetime(df['Date']).to_numpy().astype('datetime64[D]').astype('int32'),
+            'cents': df['Cents'].to_numpy(dtype='int64'),
+            'category': self._codes(df['category_id'], self.category_codes),
+            'vendor': self._codes(df['vendor_id'], self.vendor_codes),
+        }
+        for name, values in columns.items():
+            values.astype(COLUMNS[name], copy=False).tofile(self.files[name])
+        self.rows += len(df)
+
+    def save(self):
+        for name, dtype in COLUMNS.items():
+            self.files[name].close()
+            raw_path = os.path.join(self.tmp_dir, f'{name}.raw')
+            with open(os.path.join(self.tmp_dir, f'{name}.npy'), 'wb') as npy, open(raw_path, 'rb') as raw:
+                header = {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': (self.rows,)}
+                np.lib.format.write_array_header_1_0(npy, header)
+                shutil.copyfileobj(raw, npy)
+            os.remove(raw_path)
+        with open(os.path.join(self.tmp_dir, 'meta.json'), 'w') as meta:
+            json.dump({
+                'version': self.version,
+                'rows': self.rows,
+                'category_ids': [int(category_id) for category_id in self.category_codes],
+                'vendor_ids': [int(vendor_id) for vendor_id in self.vendor_codes]
+            }, meta)
+
+        try:
+            os.rename(self.tmp_dir, snapshot_path(self.upload, self.version))
+        except OSError:
+            # Someone else just built this exact version
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        remove_snapshots(self.upload.id, keep=snapshot_name(self.upload, self.version))
+
+    def discard(self):
+        for file in self.files.values():
+            file.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+class UploadSnapshot:
+    """
+        Read only columnar copy of an upload's transactions, memory-mapped straight from disk
+
+        Loading costs nothing (the OS pages the arrays in as numpy touches them) and every reduction is
+        a vectorized numpy pass, no Transactions or dicts are ever built
+    """
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json')) as meta:
+            meta = json.load(meta)
+        self.version = meta['version']
+        self.category_ids = meta['category_ids']
+        self.vendor_ids = meta['vendor_ids']
+        for name in COLUMNS:
+            setattr(self, name, np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r'))
+
+    def __len__(self):
+        return len(self.cents)
+
+    def category_names(self):
+        names = dict(Category.objects.filter(id__in=self.category_ids).values_list('id', 'category_name'))
+        return [names.get(category_id) for category_id in self.category_ids]
+
+    def vendor_names(self):
+        names = Vendor.objects.in_bulk(self.vendor_ids)
+        return [names[vendor_id].name for vendor_id in self.vendor_ids]
+
+    def dates(self):
+        return self.date.astype('datetime64[D]')
+
+    def spending_totals(self):
+        """
+            Same (overall, per_category, per_vendor) as TransactionUploads.get_spending_totals
+        """
+        if not len(self):
+            return {'total': None, 'count': 0, 'begin_date': None, 'end_date': None}, [], []
+        overall = {
+            'total': Decimal(int(self.cents.sum())).scaleb(-2),
+            'count': len(self),
+            'begin_date': _as_date(self.date.min()),
+            'end_date': _as_date(self.date.max())
+        }
+        return (
+            overall,
+            self._ranked(self.category_names(), *_totals(self.category, self.cents, len(self.category_ids))),
+            self._ranked(self.vendor_names(), *_totals(self.vendor, self.cents, len(self.vendor_ids)))
+        )
+
+    @staticmethod
+    def _ranked(names, totals, counts):
+        # Most spent first, codes nobody uses anymore are left out
+        order = np.argsort(-totals, kind='stable')
+        return [(names[i], Decimal(int(totals[i])).scaleb(-2), int(counts[i])) for i in order if counts[i]]
+
+
+def load_snapshot(upload):
+    """
+        The upload's snapshot if it's up to date with its transactions, None otherwise
+    """
+    path = snapshot_path(upload, upload.snapshot_version)
+    if not os.path.isdir(path):
+        return None
+    return UploadSnapshot(path)
+
+
+def build_snapshot(upload):
+    """
+        (Re)builds an upload's snapshot from the database
+
+        The version is read before the rows: an edit landing in between gives a snapshot that is
+        already stale (rebuilt again next time), never one that claims to be newer than its rows
+    """
+    version = TransactionUploads.objects.values_list('snapshot_version', flat=True).get(id=upload.id)
+    rows = Transactions.objects.filter(transaction_upload_id=upload.id).values_list('date', 'vendor_id', 'amount', 'category_id')
+    writer = SnapshotWriter(upload, version)
+    try:
+        chunk = []
+        for row in rows.iterator(chunk_size=REBUILD_CHUNK_SIZE):
+            chunk.append(row)
+            if len(chunk) == REBUILD_CHUNK_SIZE:
+                writer.add(_frame(chunk))
+                chunk = []
+        writer.add(_frame(chunk))
+        writer.save()
+    except Exception:
+        writer.discard()
+        raise
+    upload.snapshot_version = version
+    return UploadSnapshot(snapshot_path(upload, version))
+
+
+def _frame(rows):
+    df = pd.DataFrame(rows, columns=['Date', 'vendor_id', 'Amount', 'category_id'])
+    df['Cents'] = [int(amount.scaleb(2)) for amount in df['Amount'].tolist()]
+    return df
+
+
+def get_snapshot(upload):
+    """
+        The up to date snapshot of an upload, rebuilt first if its transactions changed since the last one
+    """
+    snapshot = load_snapshot(upload)
+    return snapshot if snapshot is not None else build_snapshot(upload)
+
+
+def mark_stale(upload_ids):
+    """
+        The transactions of these uploads changed: snapshots built before this are out of date
+
+        Call this inside the same atomic block as the write
+    """
+    TransactionUploads.objects.filter(id__in=upload_ids).update(snapshot_version=F('snapshot_version') + 1)
+
+
+def remove_snapshots(upload_id, keep=None):
+    """
+        Deletes the snapshot files of an upload (except the one named keep)
+
+        Readers that still have an older version mapped keep working, the file only goes once they let go
+    """
+    try:
+        entries = list(os.scandir(settings.SNAPSHOT_DIR))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if entry.name.startswith(f'{upload_id}-') and entry.name != keep:
+            shutil.rmtree(entry.path, ignore_errors=True)
@@ -0,0 +1,174 @@
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Max, Min
+import pandas as pd
+from .models import Transactions, UploadSummary
+
+
+def to_cents(amount):
+    # Decimal/float dollars -> integer cents
+    return int(round(amount * 100))
+
+
+class SummaryBuilder:
+    """
+        Adds up parsed DataFrame chunks (Date, Vendor, Category, Cents) into an UploadSummary
+
+        Only the grouped totals are kept around, so building a summary while streaming an upload
+        costs memory per category/vendor rather than per row
+    """
+    def __init__(self):
+        self.per_category = pd.DataFrame({'sum': pd.Series(dtype='int64'), 'count': pd.Series(dtype='int64')})
+        self.per_vendor = self.per_category.copy()
+        self.begin_date = None
+        self.end_date = None
+
+    def add(self, df):
+        if df.empty:
+            return
+        cents = df['Cents']
+        # One groupby per dimension, sum + count in the same pass
+        self.per_category = self.per_category.add(cents.groupby(df['Category']).agg(['sum', 'count']), fill_value=0)
+        self.per_vendor = self.per_vendor.add(cents.groupby(df['Vendor']).agg(['sum', 'count']), fill_value=0)
+
+        begin, end = df['Date'].min(), df['Date'].max()
+        self.begin_date = begin if self.begin_date is None else min(self.begin_date, begin)
+        self.end_date = end if self.end_date is None else max(self.end_date, end)
+
+    @staticmethod
+    def _as_json(totals):
+        return {name: [int(row['sum']), int(row['count'])] for name, row in totals.iterrows()}
+
+    def spending_per_category(self):
+        # Dollars per category sorted by the most spent (what the upload response shows)
+        return (self.per_category['sum'] / 100).sort_values(ascending=False).to_dict()
+
+    def save(self, upload):
+        return UploadSummary.objects.update_or_create(
+            transaction_upload=upload,
+            defaults={
+                'total_cents': int(self.per_category['sum'].sum()),
+                'total_transactions': int(self.per_category['count'].sum()),
+                'spending_per_category': self._as_json(self.per_category),
+                'spending_per_vendor': self._as_json(self.per_vendor),
+                'begin_date': self.begin_date,
+                'end_date': self.end_date
+            }
+        )[0]
+
+
+def build_upload_summary(upload):
+    """
+        Recomputes the summary of an upload from the database
+
+        The grouping happens in SQL (TransactionUploads.get_spending_totals) so no row is ever pulled into Python
+    """
+    overall, per_category, per_vendor = upload.get_spending_totals()
+    return UploadSummary.objects.update_or_create(
+        transaction_upload=upload,
+        defaults={
+            'total_cents': to_cents(overall['total'] or 0),
+            'total_transactions': overall['count'],
+            'spending_per_category': {name: [to_cents(total), count] for name, total, count in per_category},
+            'spending_per_vendor': {vendor: [to_cents(total), count] for vendor, total, count in per_vendor},
+            'begin_date': overall['begin_date'],
+            'end_date': overall['end_date']
+        }
+    )[0]
+
+
+def get_upload_summary(upload):
+    """
+        Precomputed summary of an upload, built on the spot for uploads that predate UploadSummary
+    """
+    try:
+        return upload.summary
+    except UploadSummary.DoesNotExist:
+        return build_upload_summary(upload)
+
+
+async def aget_upload_summary(upload):
+    """
+        get_upload_summary for async views, upload should come with select_related('summary')
+    """
+    try:
+        return upload.summary
+    except UploadSummary.DoesNotExist:
+        return await sync_to_async(build_upload_summary)(upload)
+
+
+def _apply_total(totals, name, cents, sign):
+    total, count = totals.get(name, [0, 0])
+    total, count = total + sign * cents, count + sign
+    if count > 0:
+        totals[name] = [total, count]
+    else:
+        # Last transaction for this category/vendor is gone
+        totals.pop(name, None)
+
+
+def apply_transaction_changes(added=(), removed=()):
+    """
+        Updates the precomputed summaries after Transactions were created, edited or deleted
+
+        added/removed: TransactionRows (see changes.py), an edit is the old row removed + the new row added
+        Call this inside the same atomic block as the write so the summary never disagrees with the rows
+    """
+    changes = [(row, 1) for row in added] + [(row, -1) for row in removed]
+    upload_ids = {row.upload_id for row, _ in changes}
+    # Uploads that may have lost their first/last transaction
+    stale_ranges = set()
+
+    with transaction.atomic():
+        # Lock the summaries we're about to touch so concurrent edits don't overwrite each other
+        # (uploads without a summary yet get one built from the already updated rows on the next read)
+        summaries = UploadSummary.objects.select_for_update().in_bulk(upload_ids)
+
+        for row, sign in changes:
+            summary = summaries.get(row.upload_id)
+            if summary is None:
+                continue
+            summary.total_cents += sign * row.cents
+            summary.total_transactions += sign
+            _apply_total(summary.spending_per_category, row.category_name, row.cents, sign)
+            _apply_total(summary.spending_per_vendor, row.vendor, row.cents, sign)
+
+            if sign > 0:
+                summary.begin_date = row.date if summary.begin_date is None else min(summary.begin_date, row.date)
+                summary.end_date = row.date if summary.end_date is None else max(summary.end_date, row.date)
+            elif row.date in (summary.begin_date, summary.end_date):
+                stale_ranges.add(row.upload_id)
+
+        for upload_id, summary in summaries.items():
+            if upload_id in stale_ranges:
+                # Ask the database for the new range (it already reflects every change above)
+                date_range = Transactions.objects.filter(transaction_upload_id=upload_id).aggregate(
+                    begin_date=Min('date'), end_date=Max('date')
+                )
+                summary.begin_date, summary.end_date = date_range['begin_date'], date_range['end_date']
+            summary.save()
+
+
+def rename_category(old_name, new_name):
+    """
+        Summaries are keyed by category name, so a renamed Category has to be renamed in them too
+
+        Returns the ids of the uploads whose summary changed
+    """
+    if old_name == new_name:
+        return []
+    upload_ids = []
+    with transaction.atomic():
+        for summary in UploadSummary.objects.select_for_update().filter(spending_per_category__has_key=old_name):
+            summary.spending_per_category[new_name] = summary.spending_per_category.pop(old_name)
+            summary.save(update_fields=['spending_per_category', 'updated_at'])
+            upload_ids.append(summary.transaction_upload_id)
+    return upload_ids
+
+
+def rebuild_summaries(upload_ids):
+    """
+        Recomputes the summaries of every upload in upload_ids (after a bulk change like deleting a Category)
+    """
+    for summary in UploadSummary.objects.filter(transaction_upload_id__in=upload_ids).select_related('transaction_upload'):
+        build_upload_summary(summary.transaction_upload)
@@ -0,0 +1,86 @@
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+
+# Category -> (a few vendors we actually see on statements, typical amount in dollars)
+# Vendors beyond these are store numbered branches (Starbucks #0412) like a real statement shows them
+CATEGORY_VENDORS = {
+    'Dining': (['Starbucks', 'Chipotle', 'McDonalds', 'Panera Bread', 'Dunkin', 'Subway', 'Chick-fil-A'], 18),
+    'Grocery': (['Walmart', 'Trader Joes', 'Whole Foods', 'Kroger', 'Costco', 'Aldi', 'Safeway'], 85),
+    'Shopping': (['Amazon', 'Target', 'Best Buy', 'Apple', 'IKEA', 'Home Depot', 'Etsy'], 60),
+    'Entertainment': (['Netflix', 'Spotify', 'AMC Theatres', 'Steam', 'Hulu', 'Disney Plus'], 25),
+    'Transportation': (['Uber', 'Lyft', 'Shell', 'Chevron', 'Exxon', 'MTA', 'Amtrak'], 35),
+    'Health': (['CVS', 'Walgreens', 'Rite Aid', 'Planet Fitness', 'Quest Diagnostics'], 40),
+    'Utilities': (['Con Edison', 'Verizon', 'Comcast', 'AT&T', 'T-Mobile', 'National Grid'], 120),
+    'Travel': (['Delta', 'United', 'Marriott', 'Airbnb', 'Expedia', 'Hilton'], 350),
+    'Education': (['Coursera', 'Udemy', 'Barnes & Noble', 'Chegg'], 55),
+    'Housing': (['Avalon Communities', 'Greystar', 'State Farm', 'Lemonade'], 1400),
+    'Personal Care': (['Sephora', 'Ulta', 'Great Clips', 'Supercuts'], 45),
+    'Gifts': (['Hallmark', '1-800-Flowers', 'Edible Arrangements'], 50),
+}
+
+# Same layout as sample_transactions.csv (Nov-08-2024)
+DATE_FORMAT = '%b-%d-%Y'
+
+
+def vendor_table(vendor_count, rng):
+    """
+        vendor_count vendors with their category, typical amount + how often they show up
+
+        Popularity follows a Zipf-like curve: a handful of vendors get most of the transactions and
+        there's a long tail we only see now and then (what a real statement looks like)
+    """
+    names, categories, amounts = [], [], []
+    category_names = list(CATEGORY_VENDORS)
+    for i in range(vendor_count):
+        category = category_names[i % len(category_names)]
+        brands, amount = CATEGORY_VENDORS[category]
+        brand = brands[(i // len(category_names)) % len(brands)]
+        branch = i // (len(category_names) * len(brands))
+        names.append(brand if branch == 0 else f'{brand} #{branch:04d}')
+        categories.append(category)
+        amounts.append(amount)
+
+    weights = 1 / np.arange(1, vendor_count + 1) ** 1.1
+    order = rng.permutation(vendor_count)
+    return (
+        np.array(names, dtype=object)[order],
+        np.array(categories, dtype=object)[order],
+        np.array(amounts, dtype='float64')[order],
+        weights / weights.sum()
+    )
+
+
+def generate_chunks(rows, seed=0, vendors=2000, start=date(2023, 1, 1), days=730, chunk_size=100000):
+    """
+        Yields DataFrames (Date, Vendor, Category, Amount) with rows transactions in total
+
+        - Seeded: the same arguments always give the exact same statement
+        - Everything is drawn per chunk with numpy, so 10M rows never sit in memory at once
+    """
+    rng = np.random.default_rng(seed)
+    names, categories, amounts, weights = vendor_table(vendors, rng)
+    # Formatting every date once up front is way cheaper than strftime on every row
+    day_strings = np.array([(start + timedelta(days=offset)).strftime(DATE_FORMAT) for offset in range(days)], dtype=object)
+
+    for begin in range(0, rows, chunk_size):
+        size = min(chunk_size, rows - begin)
+        picked = rng.choice(len(names), size=size, p=weights)
+        # Lognormal around the vendor's typical amount: mostly close to it, now and then a big one
+        spent = np.round(amounts[picked] * rng.lognormal(mean=0, sigma=0.6, size=size), 2).clip(min=0.5)
+        yield pd.DataFrame({
+            'Date': day_strings[rng.integers(0, days, size=size)],
+            'Vendor': names[picked],
+            'Category': categories[picked],
+            'Amount': spent
+        })
+
+
+def write_statement(path, rows, **kwargs):
+    """
+        Writes a synthetic statement in our upload CSV format (Date,Vendor,Category,Amount)
+    """
+    with open(path, 'w', newline='') as file:
+        for i, chunk in enumerate(generate_chunks(rows, **kwargs)):
+            chunk.to_csv(file, header=(i == 0), index=False, float_format='%.2f')
+    return path
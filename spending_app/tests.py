@@ -1,3 +1,1242 @@
-from django.test import TestCase
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.conf import settings
+from django.core.cache import caches
+from django.test import TestCase as DjangoTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from unittest import mock, skipUnless
+import importlib.util
+import io
+import json
+import os
+import runpy
+import tempfile
+import time
+import zipfile
+from datetime import date, timedelta
+from django.db import OperationalError, connection, transaction
+from django.db.utils import ConnectionHandler
+from django.db.models import Sum
+from django.utils import timezone
+from decimal import Decimal
+from hashlib import sha256
+import pandas as pd
+from .models import CacheVersion, Category, DailyVendorSpend, Transactions, TransactionUploads, Vendor
+from .summaries import build_upload_summary
+from .categories import clear_category_cache, resolve_category_ids
+from .parsing import RejectionReport, StatementParser, read_chunks
+from .ingest import ingest_csv, ingest_upload
+from .jobs import UploadSwept, process_upload, recover_stale_uploads
+from .parsepool import parse_file
+from . import parsepool
+from .changes import transaction_row
+from .fingerprints import FingerprintCounter
+from .responsecache import bump_versions
+from .rollups import apply_rows
+from .vendors import clear_vendor_cache, resolve_vendor_ids
+from .snapshots import get_snapshot, load_snapshot
+from .synthetic import generate_chunks
+from .rendering import shutdown_report_pool, submit_report, warm_report_pool
+from . import rendering
+
+
+def weasyprint_available():
+    try:
+        import weasyprint  # noqa: F401
+    except (ImportError, OSError):
+        return False
+    return True
 
 # Create your tests here.
+
+class TestCase(DjangoTestCase):
+    """
+        What every test here starts from + helpers for settings that point at directories
+
+        - Every test is rolled back and hands out the same ids again, responses cached during the last one must not be found
+        - temp_dir/override/use_temp_media: files the test writes go to a directory of its own, gone after the test
+    """
+    def setUp(self):
+        caches[settings.RESPONSE_CACHE].clear()
+
+    def temp_dir(self):
+        # Removed once the test is over
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        return directory.name
+
+    def override(self, **overrides):
+        # override_settings for the rest of the test
+        settings_override = override_settings(**overrides)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def use_temp_media(self, **overrides):
+        # Uploaded files + snapshots go to a temporary directory, upload jobs run inside the request
+        media_root = self.temp_dir()
+        self.override(
+            MEDIA_ROOT=media_root, SNAPSHOT_DIR=os.path.join(media_root, 'snapshots'), UPLOAD_JOBS_EAGER=True, **overrides
+        )
+
+
+def make_upload(rows):
+    """
+        Creates a done upload with one Transaction per (vendor, category_name, amount, date) row
+    """
+    upload = TransactionUploads.objects.create(file='transaction_uploads/test.csv', status=TransactionUploads.Status.DONE)
+    categories, vendors = {}, {}
+    for vendor, category_name, _, _ in rows:
+        if category_name not in categories:
+            categories[category_name] = Category.objects.get_or_create(category_name=category_name)[0]
+        if vendor not in vendors:
+            vendors[vendor] = Vendor.objects.get_or_create(name=vendor)[0]
+    Transactions.objects.bulk_create([
+        Transactions(vendor=vendors[vendor], category=categories[category_name], amount=Decimal(amount), date=day, transaction_upload=upload)
+        for vendor, category_name, amount, day in rows
+    ])
+    return upload
+
+
+class UploadSummaryTests(TestCase):
+    """
+        get_summary is aggregated by the database, so the number of queries can't grow with the upload
+    """
+    rows = [
+        ('Starbucks', 'dining', '4.50', date(2025, 6, 1)),
+        ('Starbucks', 'dining', '5.25', date(2025, 6, 3)),
+        ('Walmart', 'grocery', '124.56', date(2025, 6, 2)),
+        ('Netflix', 'entertainment', '15.99', date(2025, 6, 5)),
+        ('Amazon', 'shopping', '89.99', date(2025, 5, 30)),
+        ('Uber', 'transport', '25.00', date(2025, 6, 10)),
+    ]
+
+    def test_get_summary(self):
+        summary = make_upload(self.rows).get_summary()
+        self.assertEqual(summary['total_spent'], 265.29)
+        self.assertEqual(summary['total_transactions'], 6)
+        self.assertEqual(summary['unique_categories'], 5)
+        self.assertEqual(summary['unique_vendors'], 5)
+        self.assertEqual(list(summary['spending_per_category'])[0], 'grocery')
+        self.assertEqual(summary['spending_per_vendor']['Starbucks'], 9.75)
+        self.assertEqual(list(summary['top_vendors']), ['Walmart', 'Amazon', 'Uber', 'Netflix', 'Starbucks'])
+        self.assertEqual(summary['begin_date'], date(2025, 5, 30))
+        self.assertEqual(summary['end_date'], date(2025, 6, 10))
+
+    def test_get_summary_query_count_is_fixed(self):
+        small = make_upload(self.rows)
+        large = make_upload(self.rows * 50)
+
+        for upload in (small, large):
+            # Totals, per category, per vendor id + the names of those vendors
+            with self.assertNumQueries(4):
+                upload.get_summary()
+
+    def test_summary_follows_edits(self):
+        upload = make_upload(self.rows)
+        build_upload_summary(upload)
+        dining = Category.objects.get(category_name='dining')
+
+        self.client.post('/transactions/', {
+            'vendor': 'Starbucks', 'amount': '10.00', 'date': '2025-06-12', 'category': dining.id, 'transaction_upload': upload.id
+        })
+        walmart = upload.transactions.get(vendor__name='Walmart')
+        self.client.patch(
+            f'/transactions/{walmart.id}/', {'amount': '100.00', 'category': dining.id}, content_type='application/json'
+        )
+        # The earliest transaction, the date range has to be looked up again
+        self.client.delete(f'/transactions/{upload.transactions.get(vendor__name="Amazon").id}/')
+
+        summary = TransactionUploads.objects.get(id=upload.id).summary.as_dict()
+        self.assertEqual(summary['total_spent'], 160.74)
+        self.assertEqual(summary['spending_per_category']['dining'], 119.75)
+        self.assertNotIn('grocery', summary['spending_per_category'])
+        self.assertEqual((summary['begin_date'], summary['end_date']), (date(2025, 6, 1), date(2025, 6, 12)))
+        # Same as adding it all up again from scratch
+        self.assertEqual(summary, build_upload_summary(upload).as_dict())
+
+    def test_edits_read_the_row_under_the_lock(self):
+        upload = make_upload(self.rows)
+        build_upload_summary(upload)
+        walmart, amazon = (upload.transactions.get(vendor__name=name) for name in ('Walmart', 'Amazon'))
+
+        # Whether the row was read inside the write's atomic block (one savepoint deeper than the test's own)
+        depth = len(connection.savepoint_ids)
+        inside = []
+        def row(instance):
+            inside.append(len(connection.savepoint_ids) > depth)
+            return transaction_row(instance)
+        with mock.patch('spending_app.views.transaction_row', side_effect=row):
+            self.client.patch(f'/transactions/{walmart.id}/', {'amount': '100.00'}, content_type='application/json')
+            self.client.delete(f'/transactions/{amazon.id}/')
+        self.assertEqual(inside, [True, True, True])
+
+    def test_summary_endpoint_is_one_lookup(self):
+        upload = make_upload(self.rows * 50)
+        build_upload_summary(upload)
+
+        # Its response cache version (nothing is written, it was never bumped) + the upload with its summary
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/uploads/{upload.id}/summary/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_transactions'], 300)
+        # Straight from the response cache, only the version is read
+        with self.assertNumQueries(1):
+            again = self.client.get(f'/uploads/{upload.id}/summary/')
+        self.assertEqual(again.json(), response.json())
+
+
+class CategoryResolverTests(TestCase):
+    """
+        Categories are resolved in bulk, a name we've already resolved never hits the database again
+    """
+    def setUp(self):
+        super().setUp()
+        clear_category_cache()
+        Category.objects.create(category_name='food')
+
+    def test_bulk_resolve_and_slug_collisions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            # lookup, taken slugs, numbered slugs of the colliding ones, bulk insert (+ the savepoint around it)
+            with self.assertNumQueries(6):
+                category_ids = resolve_category_ids(['food', 'food!', 'Food?', 'travel'])
+        slugs = dict(Category.objects.values_list('category_name', 'slug'))
+        self.assertEqual(sorted(slugs.values()), ['food', 'food-1', 'food-2', 'travel'])
+        self.assertEqual(category_ids, dict(Category.objects.values_list('category_name', 'id')))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_category_ids(['food', 'travel']), {name: category_ids[name] for name in ['food', 'travel']})
+
+    def test_rename_clears_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            food_id = resolve_category_ids(['food'])['food']
+            self.client.put('/categories/food/', {'category_name': 'groceries'}, content_type='application/json')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertNotEqual(resolve_category_ids(['food'])['food'], food_id)
+
+
+class VendorDimensionTests(TestCase):
+    """
+        Transactions point at an interned Vendor by id, the API still reads and writes vendor names
+    """
+    def setUp(self):
+        super().setUp()
+        clear_vendor_cache()
+        self.override(SNAPSHOT_DIR=self.temp_dir())
+
+    def test_ingest_interns_vendors(self):
+        upload = TransactionUploads.objects.create(file='transaction_uploads/test.csv', status=TransactionUploads.Status.DONE)
+        statement = 'Date,Vendor,Category,Amount\n' + ''.join(
+            f'{day.strftime("%b-%d-%Y")},{vendor},{category},{amount}\n' for vendor, category, amount, day in UploadSummaryTests.rows
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_csv(io.StringIO(statement), upload)
+
+        self.assertEqual(Vendor.objects.count(), 5)
+        self.assertEqual(Vendor.objects.get(name='Starbucks').slug, 'starbucks')
+        self.assertEqual(upload.transactions.filter(vendor__name='Starbucks').count(), 2)
+        self.assertEqual(build_upload_summary(upload).spending_per_vendor['Starbucks'], [975, 2])
+        # Every name the upload had is cached once it committed
+        with self.assertNumQueries(0):
+            resolve_vendor_ids(['Starbucks', 'Walmart'])
+
+    def test_api_reads_and_writes_names(self):
+        category = Category.objects.create(category_name='dining')
+        upload = TransactionUploads.objects.create(file='transaction_uploads/test.csv', status=TransactionUploads.Status.DONE)
+        payload = {'vendor': 'Blue Bottle', 'amount': '6.00', 'date': '2025-06-08', 'category': category.id, 'transaction_upload': upload.id}
+        self.assertEqual(self.client.post('/transactions/', payload).json()['vendor'], 'Blue Bottle')
+
+        transaction = Transactions.objects.get()
+        response = self.client.put(f'/transactions/{transaction.id}/', {'vendor': 'Blue Bottle!'}, content_type='application/json')
+        self.assertEqual(response.json()['vendor'], 'Blue Bottle!')
+        self.assertEqual(sorted(Vendor.objects.values_list('slug', flat=True)), ['blue-bottle', 'blue-bottle-1'])
+
+        self.assertEqual(self.client.get('/transactions/').json()['all_transactions'][0]['vendor'], 'Blue Bottle!')
+        series = self.client.get('/analytics/timeseries/', {'group_by': 'vendor', 'granularity': 'day'}).json()['series']
+        self.assertEqual(series, [{'period': '2025-06-08', 'vendor': 'Blue Bottle!', 'total': 6.0, 'transactions': 1}])
+
+
+class TimeSeriesTests(TestCase):
+    """
+        The time series is answered from the daily rollups, which follow every transaction write
+    """
+    def test_monthly_category_series_follows_edits(self):
+        category = Category.objects.create(category_name='dining')
+        upload = TransactionUploads.objects.create(file='transaction_uploads/test.csv', status=TransactionUploads.Status.DONE)
+        payload = {'vendor': 'Starbucks', 'amount': '4.50', 'category': category.id, 'transaction_upload': upload.id}
+        self.client.post('/transactions/', {**payload, 'date': '2025-06-01'})
+        self.client.post('/transactions/', {**payload, 'date': '2025-06-20'})
+        self.client.post('/transactions/', {**payload, 'date': '2025-07-02'})
+
+        transaction = Transactions.objects.get(date=date(2025, 7, 2))
+        self.client.put(f'/transactions/{transaction.id}/', {'amount': '10.00'}, content_type='application/json')
+
+        response = self.client.get('/analytics/timeseries/', {'start': '2025-06-01', 'end': '2025-07-31', 'granularity': 'month'})
+        self.assertEqual(response.json()['series'], [
+            {'period': '2025-06-01', 'category': 'dining', 'total': 9.0, 'transactions': 2},
+            {'period': '2025-07-01', 'category': 'dining', 'total': 10.0, 'transactions': 1},
+        ])
+
+
+class TransactionListTests(TestCase):
+    """
+        Keyset pagination: every page is one query, however deep we scroll
+    """
+    def test_pages_are_one_query_each(self):
+        make_upload(UploadSummaryTests.rows * 10)
+        seen = []
+        url = '/transactions/?page_size=7'
+        while url:
+            with self.assertNumQueries(1):
+                response = self.client.get(url).json()
+            seen += [transaction['id'] for transaction in response['all_transactions']]
+            url = response['next']
+
+        expected = list(Transactions.objects.order_by('-date', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+
+class TransactionFilterTests(TestCase):
+    """
+        List filters, vendor search goes through the trigram index over vendor names
+    """
+    def setUp(self):
+        super().setUp()
+        make_upload(UploadSummaryTests.rows + [('STARBUCKS RESERVE', 'dining', '9.00', date(2025, 6, 7))])
+
+    def vendors(self, **params):
+        response = self.client.get('/transactions/', params)
+        return sorted(transaction['vendor'] for transaction in response.json()['all_transactions'])
+
+    def test_filters(self):
+        self.assertEqual(self.vendors(vendor='Starbucks'), ['Starbucks', 'Starbucks'])
+        self.assertEqual(self.vendors(vendor_prefix='Star'), ['Starbucks', 'Starbucks'])
+        # Case-insensitive substring, the short one falls back to scanning names
+        self.assertEqual(self.vendors(vendor_search='bucks'), ['STARBUCKS RESERVE', 'Starbucks', 'Starbucks'])
+        self.assertEqual(self.vendors(vendor_search='"bucks" OR'), [])
+        self.assertEqual(self.vendors(vendor_search='ub'), ['Uber'])
+        self.assertEqual(self.vendors(min_amount='5', max_amount='30', start='2025-06-02'), ['Netflix', 'STARBUCKS RESERVE', 'Starbucks', 'Uber'])
+        self.assertEqual(self.vendors(category='dining', vendor_search='RESERVE'), ['STARBUCKS RESERVE'])
+        self.assertEqual(self.client.get('/transactions/', {'min_amount': '9', 'max_amount': '1'}).status_code, 400)
+
+    def test_new_vendors_are_searchable(self):
+        self.client.post('/transactions/', {
+            'vendor': 'Blue Bottle Coffee', 'amount': '6.00', 'date': '2025-06-08',
+            'category': Category.objects.get(category_name='dining').id,
+            'transaction_upload': TransactionUploads.objects.get().id
+        })
+        self.assertEqual(self.vendors(vendor_search='bottle'), ['Blue Bottle Coffee'])
+
+
+class TransactionExportTests(TestCase):
+    """
+        CSV/NDJSON exports stream the filtered transactions, oldest first
+    """
+    def setUp(self):
+        super().setUp()
+        self.upload = make_upload(UploadSummaryTests.rows)
+        make_upload([('Lyft', 'transport', '12.00', date(2025, 6, 4))])
+
+    def export(self, **params):
+        response = self.client.get('/transactions/export/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.is_async)
+        return b''.join(response.streaming_content).decode().splitlines()
+
+    def test_csv(self):
+        response = self.client.get('/transactions/export/')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="transactions.csv"')
+        lines = self.export()
+        self.assertEqual(lines[0], 'Date,Vendor,Category,Amount')
+        self.assertEqual(lines[1:4], [
+            '2025-05-30,Amazon,shopping,89.99', '2025-06-01,Starbucks,dining,4.50', '2025-06-02,Walmart,grocery,124.56'
+        ])
+        self.assertEqual(len(lines), len(UploadSummaryTests.rows) + 2)
+        # Same layout as an upload, the export parses back into the same rows
+        raw = next(read_chunks(io.StringIO('\n'.join(lines)), 100, engine='c'))
+        parsed, rejected = StatementParser().parse(raw)
+        self.assertEqual((len(parsed), rejected), (len(UploadSummaryTests.rows) + 1, 0))
+
+    def test_filters(self):
+        self.assertEqual(self.export(upload=self.upload.id, category='transport'), [
+            'Date,Vendor,Category,Amount', '2025-06-10,Uber,transport,25.00'
+        ])
+        self.assertEqual(self.export(start='2025-06-03', end='2025-06-05')[1:], [
+            '2025-06-03,Starbucks,dining,5.25', '2025-06-04,Lyft,transport,12.00', '2025-06-05,Netflix,entertainment,15.99'
+        ])
+        # Nothing matches, still a valid file
+        self.assertEqual(self.export(category='transport', start='2025-07-01'), ['Date,Vendor,Category,Amount'])
+        self.assertEqual(self.client.get('/transactions/export/', {'file_type': 'xlsx'}).status_code, 400)
+
+    def test_ndjson(self):
+        response = self.client.get('/transactions/export/', {'file_type': 'ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in self.export(file_type='ndjson', vendor='Walmart')]
+        walmart = Transactions.objects.get(vendor__name='Walmart')
+        self.assertEqual(rows, [{
+            'id': walmart.id, 'upload_id': self.upload.id, 'date': '2025-06-02',
+            'vendor': 'Walmart', 'category': 'grocery', 'amount': '124.56'
+        }])
+
+    @mock.patch('spending_app.exports.STREAM_BUFFER_SIZE', 60)
+    def test_streamed_in_pieces(self):
+        make_upload(UploadSummaryTests.rows * 50)
+        response = self.client.get('/transactions/export/')
+        pieces = list(response.streaming_content)
+        # First row right away, then about STREAM_BUFFER_SIZE characters a piece
+        self.assertEqual(pieces[0], b'Date,Vendor,Category,Amount\r\n2025-05-30,Amazon,shopping,89.99\r\n')
+        self.assertGreater(len(pieces), 10)
+        self.assertTrue(all(len(piece) < 120 for piece in pieces))
+        self.assertEqual(b''.join(pieces).count(b'\r\n'), len(UploadSummaryTests.rows) * 51 + 2)
+
+class SummaryReportCacheTests(TestCase):
+    """
+        PDFs are rendered once per upload + summary, repeat downloads come from the cache
+    """
+    def setUp(self):
+        super().setUp()
+        # Render inside the test (no render processes) so render_report can be mocked
+        self.override(REPORT_CACHE_DIR=self.temp_dir(), REPORT_RENDER_WORKERS=0)
+
+    @mock.patch('spending_app.rendering.render_report', return_value=b'%PDF-1.7 report')
+    def test_cached_download_and_etag(self, render_report):
+        upload = make_upload(UploadSummaryTests.rows)
+        url = f'/uploads/{upload.id}/summary/download/'
+
+        first = self.client.get(url)
+        self.assertEqual(b''.join(first.streaming_content), b'%PDF-1.7 report')
+        second = self.client.get(url)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(render_report.call_count, 1)
+
+        not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+        # Editing a transaction changes the summary, so the next download is a new report
+        transaction = upload.transactions.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(f'/transactions/{transaction.id}/', {'amount': '1.00'}, content_type='application/json')
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+        self.assertEqual(render_report.call_count, 2)
+
+
+    def test_unknown_upload(self):
+        self.assertEqual(self.client.get('/uploads/0/summary/download/').status_code, 404)
+        self.assertEqual(self.client.post('/uploads/0/summary/download/').status_code, 404)
+
+    @skipUnless(weasyprint_available(), 'WeasyPrint needs pango/cairo installed')
+    def test_render_in_pool(self):
+        self.addCleanup(shutdown_report_pool)
+        with override_settings(REPORT_RENDER_WORKERS=1):
+            warm_report_pool()
+            upload = make_upload(UploadSummaryTests.rows)
+            response = self.client.get(f'/uploads/{upload.id}/summary/download/?wait={settings.REPORT_RENDER_TIMEOUT}')
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+            # Stored by this process, into the cache dir the web worker reads from
+            self.assertEqual(len(os.listdir(settings.REPORT_CACHE_DIR)), 1)
+
+    @mock.patch('spending_app.rendering._render_in_worker', return_value=b'%PDF-1.7 report')
+    def test_broken_render_pool_is_replaced(self, render):
+        self.override(REPORT_RENDER_WORKERS=1)
+        working = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(working.shutdown)
+        # Broken before we submit: replaced right away
+        broken = mock.Mock()
+        broken.submit.side_effect = BrokenProcessPool('A process in the process pool was terminated abruptly')
+        with mock.patch('spending_app.rendering._pool', broken):
+            with mock.patch('spending_app.rendering.get_report_pool', side_effect=[broken, working]):
+                self.assertEqual(submit_report('first', {}, '').result(timeout=5), b'%PDF-1.7 report')
+            self.assertIsNone(rendering._pool)
+
+        # Breaks mid-render: that render fails, nothing stays pending, the next one gets a new pool
+        died = Future()
+        died.set_exception(BrokenProcessPool('A process in the process pool was terminated abruptly'))
+        breaking = mock.Mock()
+        breaking.submit.return_value = died
+        with mock.patch('spending_app.rendering._pool', breaking):
+            with mock.patch('spending_app.rendering.get_report_pool', side_effect=[breaking, working]):
+                with self.assertRaises(BrokenProcessPool):
+                    submit_report('second', {}, '').result(timeout=5)
+                self.assertEqual(rendering._pending, {})
+                self.assertIsNone(rendering._pool)
+                self.assertEqual(submit_report('second', {}, '').result(timeout=5), b'%PDF-1.7 report')
+        breaking.shutdown.assert_called_once_with(wait=False)
+
+class UploadDedupeTests(TestCase):
+    """
+        The same file twice is answered with the first upload, overlapping rows are only inserted once
+    """
+    statement = b'Date,Vendor,Category,Amount\n2025-06-01,Starbucks,Dining,4.50\n2025-06-01,Starbucks,Dining,4.50\n2025-06-02,Walmart,Grocery,124.56\n'
+
+    def setUp(self):
+        super().setUp()
+        self.use_temp_media()
+
+    def upload(self, name, content):
+        return self.client.post('/uploads/', {'file': SimpleUploadedFile(name, content, content_type='text/csv')})
+
+    def test_same_file_is_not_ingested_twice(self):
+        first = self.upload('june.csv', self.statement)
+        again = self.upload('june-copy.csv', self.statement)
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.json()['upload_id'], first.json()['upload_id'])
+        self.assertEqual(TransactionUploads.objects.count(), 1)
+        self.assertEqual(Transactions.objects.count(), 3)
+
+    def test_overlapping_rows_are_skipped(self):
+        self.upload('june.csv', self.statement)
+        # One more 4.50 Starbucks on the same day is a new purchase, the rest we already have
+        overlap = self.statement + b'2025-06-01,Starbucks,Dining,4.50\n2025-06-03,Uber,Transport,25.00\n'
+        upload = TransactionUploads.objects.get(id=self.upload('june-july.csv', overlap).json()['upload_id'])
+        self.assertEqual((upload.rows_processed, upload.rows_skipped), (2, 3))
+        self.assertEqual(Transactions.objects.count(), 5)
+        self.assertEqual(upload.get_summary()['total_transactions'], 2)
+
+
+    def test_stale_upload_is_not_a_duplicate(self):
+        stale = make_upload(UploadSummaryTests.rows)
+        TransactionUploads.objects.filter(id=stale.id).update(
+            status=TransactionUploads.Status.PROCESSING, content_hash=sha256(self.statement).hexdigest(),
+            heartbeat_at=timezone.now() - timedelta(seconds=settings.UPLOAD_JOB_TIMEOUT + 60)
+        )
+        response = self.upload('june.csv', self.statement)
+        self.assertEqual(response.status_code, 202)
+        self.assertNotEqual(response.json()['upload_id'], stale.id)
+        # Swept on the way, it would otherwise hold on to the file
+        self.assertEqual(TransactionUploads.objects.get(id=stale.id).status, TransactionUploads.Status.FAILED)
+
+    def test_concurrent_upload_is_a_duplicate(self):
+        first = self.upload('june.csv', self.statement).json()['upload_id']
+        # The second request checked before the first one inserted
+        with mock.patch('spending_app.batchuploads.duplicates_of', return_value=TransactionUploads.objects.none()):
+            again = self.upload('june-copy.csv', self.statement)
+            batch = self.client.post('/uploads/', {'file': [
+                SimpleUploadedFile('a.csv', self.statement, content_type='text/csv'),
+                SimpleUploadedFile('b.csv', self.statement, content_type='text/csv'),
+            ]})
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.json()['upload_id'], first)
+        self.assertEqual([(file['status'], file['upload_id']) for file in batch.json()['uploads']], [('duplicate', first)] * 2)
+        self.assertEqual(TransactionUploads.objects.count(), 1)
+        # The losing requests' files aren't left behind
+        self.assertEqual(len(os.listdir(os.path.join(settings.MEDIA_ROOT, 'transaction_uploads'))), 1)
+
+    def fingerprint(self, frame, chunk_size):
+        counter = FingerprintCounter()
+        fingerprints = []
+        for start in range(0, len(frame), chunk_size):
+            fingerprints += counter.fingerprints(frame.iloc[start:start + chunk_size])
+            # Only the dates of the last chunk are kept
+            self.assertLessEqual(len(counter.seen), chunk_size)
+        return fingerprints
+
+    def test_fingerprint_state_is_bounded(self):
+        # 30 days, the same two coffees every day
+        days = [date(2025, 6, 1) + timedelta(days=day) for day in range(30)]
+        frame = pd.DataFrame({
+            'Date': [day for day in days for _ in range(2)],
+            'Vendor': 'Starbucks', 'Category': 'dining', 'Cents': 450
+        })
+        # In date order (either way), chunking changes nothing
+        self.assertEqual(self.fingerprint(frame, 7), self.fingerprint(frame, len(frame)))
+        backwards = frame.iloc[::-1].reset_index(drop=True)
+        self.assertEqual(sorted(self.fingerprint(backwards, 7)), sorted(self.fingerprint(frame, len(frame))))
+        # Out of order: a date coming back never repeats a fingerprint of the same file
+        shuffled = pd.concat([frame, frame]).sample(frac=1, random_state=0).reset_index(drop=True)
+        fingerprints = self.fingerprint(shuffled, 5)
+        self.assertEqual(len(set(fingerprints)), len(fingerprints))
+
+
+class StaleUploadTests(TestCase):
+    """
+        Uploads whose job went away are failed + cleaned up, ones whose job is alive are left alone
+    """
+    def in_flight(self, seconds_quiet):
+        upload = make_upload(UploadSummaryTests.rows)
+        apply_rows(added=[transaction_row(row) for row in upload.transactions.select_related('category', 'vendor')])
+        TransactionUploads.objects.filter(id=upload.id).update(
+            status=TransactionUploads.Status.PROCESSING, heartbeat_at=timezone.now() - timedelta(seconds=seconds_quiet)
+        )
+        return upload
+
+    def test_recover_stale_uploads(self):
+        stale = self.in_flight(settings.UPLOAD_JOB_TIMEOUT + 60)
+        alive = self.in_flight(5)
+
+        self.assertEqual(recover_stale_uploads(), [stale.id])
+        stale.refresh_from_db()
+        self.assertEqual((stale.status, stale.rows_processed), (TransactionUploads.Status.FAILED, 0))
+        self.assertFalse(stale.transactions.exists())
+        self.assertEqual(DailyVendorSpend.objects.aggregate(count=Sum('transaction_count'))['count'], len(UploadSummaryTests.rows))
+        self.assertEqual(alive.transactions.count(), len(UploadSummaryTests.rows))
+
+    def test_swept_upload_is_not_processed(self):
+        upload = TransactionUploads.objects.create(file='transaction_uploads/test.csv', status=TransactionUploads.Status.FAILED)
+        self.assertEqual(process_upload(upload.id), TransactionUploads.Status.FAILED)
+        upload.refresh_from_db()
+        self.assertIsNone(upload.started_at)
+
+class UploadJobTests(TestCase):
+    """
+        A job takes its upload from pending to processing to done (or failed), /status/ follows along
+    """
+    statement = b'Date,Vendor,Category,Amount\n2025-06-01,Starbucks,Dining,4.50\n2025-06-02,Walmart,Grocery,124.56\n2025-06-03,Uber,Transport,oops\n'
+
+    def setUp(self):
+        super().setUp()
+        self.use_temp_media(PARSE_WORKERS=0)
+        self.upload = TransactionUploads.objects.create(file=SimpleUploadedFile('june.csv', self.statement))
+
+    def status(self):
+        return self.client.get(f'/uploads/{self.upload.id}/status/').json()
+
+    def run_job(self, after_ingest):
+        # Real ingest, then after_ingest(result) while the upload is still processing
+        def ingest(upload, on_progress):
+            result = ingest_upload(upload, on_progress=on_progress)
+            after_ingest(result)
+            return result
+        with mock.patch('spending_app.jobs.ingest_upload', side_effect=ingest):
+            return process_upload(self.upload.id)
+
+    def test_pending_processing_done(self):
+        status = self.status()
+        self.assertEqual((status['status'], status['rows_processed'], status['summary_url']), ('pending', 0, None))
+
+        def while_processing(result):
+            status = self.status()
+            self.assertEqual((status['status'], status['rows_processed'], status['rows_rejected']), ('processing', 2, 1))
+            self.assertIsNone(status['summary_url'])
+        self.assertEqual(self.run_job(while_processing), TransactionUploads.Status.DONE)
+
+        status = self.status()
+        self.assertEqual((status['status'], status['rows_processed'], status['rows_rejected']), ('done', 2, 1))
+        self.assertEqual(status['rejections']['counts'], {'invalid amount': 1})
+        self.assertEqual(status['rejections']['rows'][0]['line'], 4)
+        self.assertTrue(status['summary_url'].endswith(f'/uploads/{self.upload.id}/summary/'))
+        # Done once, a second run of the same job doesn't ingest it again
+        self.assertEqual(process_upload(self.upload.id), TransactionUploads.Status.FAILED)
+        self.assertEqual(self.upload.transactions.count(), 2)
+
+    def test_failed(self):
+        def fail(result):
+            raise OSError('disk full')
+        self.assertEqual(self.run_job(fail), TransactionUploads.Status.FAILED)
+
+        status = self.status()
+        self.assertEqual(status['status'], 'failed')
+        self.assertEqual(status['error'], 'disk full')
+        # The rows that made it in are taken back out, the counters say so
+        self.assertEqual((status['rows_processed'], status['rows_rejected'], status['rows_skipped']), (0, 0, 0))
+        self.assertFalse(self.upload.transactions.exists())
+        self.assertFalse(DailyVendorSpend.objects.exists())
+
+class BatchUploadTests(TestCase):
+    """
+        Several files or a ZIP of statements: one upload per CSV, every file gets a status back
+    """
+    june = UploadDedupeTests.statement
+    july = b'Date,Vendor,Category,Amount\n2025-07-01,Uber,Transport,25.00\n2025-07-02,Netflix,Entertainment,15.99\n'
+
+    def setUp(self):
+        super().setUp()
+        self.use_temp_media()
+
+    def archive(self, members):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for name, content in members:
+                archive.writestr(name, content)
+        return SimpleUploadedFile('statements.zip', buffer.getvalue(), content_type='application/zip')
+
+    def test_zip_members_are_uploaded_one_by_one(self):
+        archive = self.archive([
+            ('2025/june.csv', self.june),
+            ('2025/july.csv', self.july),
+            ('2025/june-copy.csv', self.june),
+            ('2025/notes.txt', b'hello'),
+            ('__MACOSX/2025/._june.csv', b'resource fork'),
+        ])
+        response = self.client.post('/uploads/', {'file': archive})
+        self.assertEqual(response.status_code, 202)
+        body = response.json()
+        self.assertEqual(body['counts'], {'done': 2, 'duplicate': 1, 'rejected': 1})
+        self.assertEqual(
+            [(upload['file_name'], upload['status']) for upload in body['uploads']],
+            [('2025/june.csv', 'done'), ('2025/july.csv', 'done'), ('2025/june-copy.csv', 'duplicate'), ('2025/notes.txt', 'rejected')]
+        )
+        self.assertEqual(body['uploads'][2]['upload_id'], body['uploads'][0]['upload_id'])
+        self.assertEqual(TransactionUploads.objects.get(id=body['uploads'][1]['upload_id']).get_file_name(), 'july.csv')
+        self.assertEqual(Transactions.objects.count(), 5)
+
+    def test_several_files(self):
+        files = [SimpleUploadedFile(name, content, content_type='text/csv') for name, content in (('june.csv', self.june), ('july.csv', self.july))]
+        response = self.client.post('/uploads/', {'file': files})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['counts'], {'done': 2})
+        self.assertEqual(sorted(TransactionUploads.objects.values_list('rows_processed', flat=True)), [2, 3])
+
+    def test_plain_files_are_validated_like_members(self):
+        files = [
+            SimpleUploadedFile(name, content, content_type='text/csv')
+            for name, content in (('june.csv', self.june), ('june.txt', self.july), ('empty.csv', b''))
+        ]
+        response = self.client.post('/uploads/', {'file': files})
+        self.assertEqual(
+            [(upload['status'], upload.get('error')) for upload in response.json()['uploads']],
+            [('done', None), ('rejected', 'Only .csv files are ingested.'), ('rejected', 'The submitted file is empty.')]
+        )
+        # A single file is held to the same rules
+        single = self.client.post('/uploads/', {'file': SimpleUploadedFile('july.txt', self.july, content_type='text/csv')})
+        self.assertEqual(single.status_code, 400)
+        self.assertEqual(single.json()['file'], ['Only .csv files are ingested.'])
+        self.assertEqual(TransactionUploads.objects.count(), 1)
+
+    @override_settings(UPLOAD_ARCHIVE_MAX_FILES=1)
+    def test_archive_limits(self):
+        response = self.client.post('/uploads/', {'file': self.archive([('june.csv', self.june), ('july.csv', self.july)])})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['uploads'][0]['error'], 'Archives may hold at most 1 files.')
+        self.assertFalse(TransactionUploads.objects.exists())
+
+
+class StatementParserTests(TestCase):
+    """
+        The date format is picked once per file and bad rows end up in the rejection report
+    """
+    def test_parse_and_reject(self):
+        raw = pd.DataFrame({
+            'Date': ['Nov-08-2024', 'not a date', 'Nov-09-2024', 'Nov-10-2024', 'Nov-11-2024'],
+            'Vendor': [' Starbucks ', 'Walmart', None, 'Uber', 'Netflix'],
+            'Category': ['Dining', 'Grocery', 'Dining', 'Transport', 'Entertainment'],
+            'Amount': ['4.50', '1.00', '2.00', '$1,234.56', 'abc'],
+        })
+        parser = StatementParser()
+        df, rejected = parser.parse(raw)
+
+        self.assertEqual(parser.date_format, '%b-%d-%Y')
+        self.assertEqual(rejected, 3)
+        self.assertEqual(df['Date'].tolist(), [date(2024, 11, 8), date(2024, 11, 10)])
+        self.assertEqual(df['Vendor'].tolist(), ['Starbucks', 'Uber'])
+        self.assertEqual(df['Cents'].tolist(), [450, 123456])
+        self.assertEqual(df['Amount'].tolist(), [Decimal('4.50'), Decimal('1234.56')])
+
+        report = parser.report.as_dict()
+        self.assertEqual(report['counts'], {'invalid date': 1, 'missing vendor': 1, 'invalid amount': 1})
+        self.assertEqual([row['line'] for row in report['rows']], [3, 4, 6])
+
+
+    def test_non_finite_amounts_are_rejected(self):
+        raw = pd.DataFrame({
+            'Date': ['Nov-08-2024'] * 3, 'Vendor': ['Starbucks'] * 3, 'Category': ['Dining'] * 3, 'Amount': ['inf', '-inf', '4.50']
+        })
+        parser = StatementParser()
+        df, rejected = parser.parse(raw)
+        self.assertEqual((rejected, df['Cents'].tolist()), (2, [450]))
+        self.assertEqual(parser.report.as_dict()['counts'], {'invalid amount': 2})
+
+    def test_malformed_lines_are_reported(self):
+        statement = (
+            'Date,Vendor,Category,Amount\n'
+            'Nov-08-2024,Starbucks,Dining,4.50\n'
+            'Nov-09-2024,Acme, Inc,Shopping,19.99\n'
+            'Nov-10-2024,Uber,Transport,25.00\n'
+        )
+        # A bad line at the start of a chunk too (pandas' parsers would quietly cut it down there)
+        for chunk_size in [1, 2]:
+            report = RejectionReport()
+            chunks = list(read_chunks(io.StringIO(statement), chunk_size, report=report, engine='c'))
+            self.assertEqual([vendor for chunk in chunks for vendor in chunk['Vendor']], ['Starbucks', 'Uber'])
+            self.assertEqual(report.as_dict(), {
+                'counts': {'malformed line': 1}, 'rows': [{'line': 3, 'reason': 'malformed line', 'row': 'Nov-09-2024,Acme, Inc,Shopping,19.99'}]
+            })
+        # Line numbers of rejected rows still line up after it (Uber is on line 4)
+        self.assertEqual(chunks[0].index.tolist(), [0, 2])
+
+class ParsePoolTests(TestCase):
+    """
+        Jobs waiting on a parse process keep showing signs of life, the parsed chunks' spool never outlives the job
+    """
+    def setUp(self):
+        super().setUp()
+        self.use_temp_media()
+        self.addCleanup(clear_category_cache)
+        self.addCleanup(clear_vendor_cache)
+        self.spool_dir = self.temp_dir()
+        # Parse in a thread of this process: the spool lands in our directory and parse_file can be slowed down
+        self.pool = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(self.pool.shutdown)
+        for patcher in (
+            mock.patch('spending_app.parsepool.get_parse_pool', return_value=self.pool),
+            mock.patch('spending_app.parsepool.HEARTBEAT_INTERVAL', 0.05),
+            mock.patch('spending_app.parsepool.parse_file', side_effect=self.slow_parse),
+            mock.patch('tempfile.tempdir', self.spool_dir),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.upload = TransactionUploads.objects.create(file=SimpleUploadedFile('june.csv', UploadJobTests.statement))
+
+    def slow_parse(self, path, chunk_size):
+        time.sleep(0.3)
+        return parse_file(path, chunk_size)
+
+    def test_heartbeat_while_parsing(self):
+        progress = []
+        result = ingest_upload(self.upload, on_progress=lambda *counts: progress.append(counts))
+        self.assertEqual(result['transactions_created'], 2)
+        self.assertEqual(progress[0], (0, 0, 0))
+        self.assertEqual(progress[-1], (2, 1, 0))
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    def test_swept_while_parsing(self):
+        def swept(*counts):
+            raise UploadSwept('The upload was marked failed while it was being processed.')
+        with self.assertRaises(UploadSwept):
+            ingest_upload(self.upload, on_progress=swept)
+        # The parse finishes without us, its spool goes right after
+        self.pool.shutdown(wait=True)
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    def test_broken_pool_is_replaced(self):
+        broken = mock.Mock()
+        broken.submit.side_effect = BrokenProcessPool('A process in the process pool was terminated abruptly')
+        with mock.patch('spending_app.parsepool._pool', broken), \
+                mock.patch('spending_app.parsepool.get_parse_pool', side_effect=[broken, self.pool]):
+            result = ingest_upload(self.upload)
+            self.assertIsNone(parsepool._pool)
+        broken.shutdown.assert_called_once_with(wait=False)
+        self.assertEqual(result['transactions_created'], 2)
+
+    def test_spool_removed_when_writes_fail(self):
+        with mock.patch('spending_app.ingest.ingest_parsed', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                ingest_upload(self.upload)
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+
+class IngestTests(TestCase):
+    """
+        Statements are ingested set by set (whole columns, one lookup per dimension, batched INSERTs), not row by row
+    """
+    def setUp(self):
+        super().setUp()
+        self.override(SNAPSHOT_DIR=self.temp_dir())
+        self.addCleanup(clear_category_cache)
+        self.addCleanup(clear_vendor_cache)
+        with open(os.path.join(settings.BASE_DIR, 'sample_transactions.csv')) as file:
+            self.header, self.body = file.read().split('\n', 1)
+
+    def test_bulk_ingest(self):
+        upload = TransactionUploads.objects.create(file='transaction_uploads/test.csv')
+        copies = 20
+        with CaptureQueriesContext(connection) as queries:
+            result = ingest_csv(io.StringIO(self.header + '\n' + self.body * copies), upload, chunk_size=100000)
+
+        rows = self.body.count('\n') * copies
+        self.assertEqual((result['transactions_created'], result['rows_rejected']), (rows, 0))
+        # A get_or_create + create per row would be over 2 queries a row
+        self.assertLess(len(queries), 50)
+        sample = pd.read_csv(io.StringIO(self.header + '\n' + self.body))
+        total = upload.transactions.aggregate(total=Sum('amount'))['total']
+        self.assertEqual(total, Decimal(str(round(sample['Amount'].sum() * copies, 2))))
+        self.assertEqual(
+            sorted(Category.objects.values_list('category_name', flat=True)), sorted(sample['Category'].str.lower().unique())
+        )
+
+
+    def test_chunks(self):
+        statement = self.header + '\n' + self.body * 3
+        rows = self.body.count('\n') * 3
+        whole = ingest_csv(io.StringIO(statement), TransactionUploads.objects.create(file='transaction_uploads/whole.csv'), chunk_size=100000)
+        # Same rows again would all be skipped as duplicates
+        Transactions.objects.all().delete()
+
+        progress = []
+        upload = TransactionUploads.objects.create(file='transaction_uploads/chunked.csv')
+        chunked = ingest_csv(io.StringIO(statement), upload, chunk_size=40, on_progress=lambda *counts: progress.append(counts))
+        # One commit per chunk of at most chunk_size rows, the totals are added up across them
+        self.assertEqual(progress, [(40, 0, 0)] * (rows // 40) + [(rows % 40, 0, 0)])
+        self.assertEqual(upload.transactions.count(), rows)
+        self.assertEqual(chunked['spending_summary'].keys(), whole['spending_summary'].keys())
+        for category, total in whole['spending_summary'].items():
+            self.assertAlmostEqual(chunked['spending_summary'][category], total, places=6)
+        self.assertEqual(upload.summary.total_transactions, rows)
+
+class SyntheticStatementTests(TestCase):
+    """
+        The benchmark data has to be the same every run, otherwise runs can't be compared
+    """
+    def test_seeded_and_parseable(self):
+        first = pd.concat(generate_chunks(5000, seed=7, vendors=300, chunk_size=2000))
+        again = pd.concat(generate_chunks(5000, seed=7, vendors=300, chunk_size=2000))
+        pd.testing.assert_frame_equal(first, again)
+        self.assertEqual(len(first), 5000)
+        self.assertLessEqual(first['Vendor'].nunique(), 300)
+
+        df, rejected = StatementParser().parse(first.astype(str))
+        self.assertEqual(rejected, 0)
+
+
+class DatabaseProfileTests(TestCase):
+    """
+        DATABASE_PROFILE=concurrent: WAL + tuned pragmas, IMMEDIATE transactions, persistent connections
+    """
+    def profile(self, name):
+        with mock.patch.dict(os.environ, {'DATABASE_PROFILE': name}):
+            return runpy.run_path(importlib.util.find_spec('spending_analysis.settings').origin)
+
+    def connections(self, database):
+        # Two connections to a database file of our own
+        database = {**database, 'NAME': os.path.join(self.temp_dir(), 'db.sqlite3')}
+        connections = ConnectionHandler({'default': database, 'other': database})
+        self.addCleanup(connections.close_all)
+        return connections
+
+    def pragmas(self, database):
+        with self.connections(database)['default'].cursor() as cursor:
+            return {
+                pragma: cursor.execute(f'PRAGMA {pragma}').fetchone()[0]
+                for pragma in ('journal_mode', 'synchronous', 'cache_size', 'temp_store')
+            }
+
+    def test_concurrent_profile(self):
+        profile = self.profile('concurrent')
+        database = profile['DATABASES']['default']
+        self.assertEqual(self.pragmas(database), {'journal_mode': 'wal', 'synchronous': 1, 'cache_size': -32000, 'temp_store': 2})
+        self.assertEqual((database['CONN_MAX_AGE'], database['CONN_HEALTH_CHECKS']), (600, True))
+        # Short write transactions, several workers take turns on the lock
+        self.assertLess(profile['INGEST_CHUNK_SIZE'], self.profile('default')['INGEST_CHUNK_SIZE'])
+
+    def test_transactions_take_the_write_lock_up_front(self):
+        database = self.profile('concurrent')['DATABASES']['default']
+        connections = self.connections({**database, 'OPTIONS': {**database['OPTIONS'], 'timeout': 0.1}})
+        first, second = connections['default'], connections['other']
+        with second.cursor() as cursor:
+            cursor.execute('CREATE TABLE spend (cents integer)')
+        # atomic() looks its connection up by alias
+        with mock.patch('django.db.transaction.connections', connections), transaction.atomic(), first.cursor() as cursor:
+            # Only a read so far, the write lock is already ours
+            cursor.execute('SELECT count(*) FROM spend')
+            with self.assertRaisesMessage(OperationalError, 'database is locked'), second.cursor() as other:
+                other.execute('INSERT INTO spend VALUES (1)')
+            # Readers aren't blocked by it (WAL)
+            with second.cursor() as other:
+                self.assertEqual(other.execute('SELECT count(*) FROM spend').fetchone()[0], 0)
+
+    def test_default_profile(self):
+        database = self.profile('default')['DATABASES']['default']
+        self.assertEqual(self.pragmas(database)['journal_mode'], 'delete')
+        self.assertNotIn('OPTIONS', database)
+
+
+class RequestMetricsTests(TestCase):
+    """
+        Every response says where its time went, /metrics adds it up per view
+    """
+    def test_server_timing_and_metrics(self):
+        upload = make_upload(UploadSummaryTests.rows)
+        build_upload_summary(upload)
+
+        response = self.client.get(f'/uploads/{upload.id}/summary/')
+        self.assertIn('db;dur=', response['Server-Timing'])
+        # Response cache version and the upload
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
+        self.assertIn('summary;dur=', response['Server-Timing'])
+
+        metrics = self.client.get('/metrics').content.decode()
+        self.assertIn('spending_requests_total{view="summary-transaction-uploads",method="GET",status="200"}', metrics)
+        self.assertIn('spending_request_span_seconds_count{view="summary-transaction-uploads",span="db"}', metrics)
+
+
+class AsyncViewTests(TestCase):
+    """
+        The read paths are async views, the writes on the same urls still work through them
+    """
+    async def test_async_read_paths(self):
+        upload = await sync_to_async(make_upload)(UploadSummaryTests.rows)
+        await sync_to_async(build_upload_summary)(upload)
+        category = await Category.objects.order_by('id').afirst()
+
+        for url in ['/', '/categories/', f'/categories/{category.slug}/', '/transactions/', f'/uploads/{upload.id}/summary/']:
+            self.assertTrue(iscoroutinefunction(resolve(url).func), url)
+            response = await self.async_client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+
+        response = await self.async_client.get(f'/uploads/{upload.id}/summary/')
+        self.assertEqual(response.json()['total_transactions'], len(UploadSummaryTests.rows))
+        response = await self.async_client.get('/uploads/0/summary/')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_sync_write_on_async_view(self):
+        response = await self.async_client.post('/categories/', {'category_name': 'Pets'})
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(await Category.objects.filter(slug='pets').aexists())
+
+
+    async def test_export_streams_async(self):
+        await sync_to_async(make_upload)(UploadSummaryTests.rows)
+        response = await self.async_client.get('/transactions/export/?file_type=csv')
+        # An async body is sent chunk by chunk under ASGI, a sync one would be collected into a list first
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        lines = content.splitlines()
+        self.assertEqual(lines[0], 'Date,Vendor,Category,Amount')
+        self.assertEqual(lines[1], '2025-05-30,Amazon,shopping,89.99')
+        self.assertEqual(len(lines), len(UploadSummaryTests.rows) + 1)
+
+class UploadSnapshotTests(TestCase):
+    """
+        Ingest writes the columnar snapshot, edits make it stale and it gets rebuilt from the rows
+    """
+    def setUp(self):
+        super().setUp()
+        self.override(SNAPSHOT_DIR=self.temp_dir())
+
+    def test_snapshot_follows_edits(self):
+        upload = TransactionUploads.objects.create(file='transaction_uploads/test.csv', status=TransactionUploads.Status.DONE)
+        statement = 'Date,Vendor,Category,Amount\n' + ''.join(
+            f'{day.strftime("%b-%d-%Y")},{vendor},{category},{amount}\n' for vendor, category, amount, day in UploadSummaryTests.rows
+        )
+        ingest_csv(io.StringIO(statement), upload)
+
+        snapshot = load_snapshot(upload)
+        self.assertEqual(len(snapshot), len(UploadSummaryTests.rows))
+        self.assertEqual(str(snapshot.cents.dtype), 'int64')
+        overall, per_category, per_vendor = snapshot.spending_totals()
+        self.assertEqual(overall['total'], Decimal('265.29'))
+        self.assertEqual(per_category[0], ('grocery', Decimal('124.56'), 1))
+        self.assertEqual((overall['begin_date'], overall['end_date']), (date(2025, 5, 30), date(2025, 6, 10)))
+
+        transaction = upload.transactions.get(vendor__name='Uber')
+        self.client.put(f'/transactions/{transaction.id}/', {'amount': '100.00'}, content_type='application/json')
+        upload.refresh_from_db()
+        self.assertIsNone(load_snapshot(upload))
+        overall, per_category, _ = get_snapshot(upload).spending_totals()
+        self.assertEqual(overall['total'], Decimal('340.29'))
+        self.assertEqual(per_category[0], ('grocery', Decimal('124.56'), 1))
+        self.assertEqual(len(os.listdir(settings.SNAPSHOT_DIR)), 1)
+
+
+class SpendingInsightsTests(TestCase):
+    """
+        Monthly subscriptions + spikes per category, per upload and across uploads, cached until an edit
+    """
+    rows = [
+        ('Netflix', 'entertainment', '15.99', date(2025, month, 5)) for month in range(1, 7)
+    ] + [
+        ('Starbucks', 'dining', f'{4 + day % 3}.50', date(2025, 1, day)) for day in range(1, 21)
+    ] + [
+        ('Steakhouse', 'dining', '180.00', date(2025, 1, 25)),
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.override(SNAPSHOT_DIR=self.temp_dir())
+
+    def test_upload_insights(self):
+        upload = make_upload(self.rows)
+        insights = self.client.get(f'/uploads/{upload.id}/insights/').json()
+        self.assertEqual(insights['transactions'], len(self.rows))
+        self.assertEqual([entry['vendor'] for entry in insights['recurring']], ['Netflix'])
+        netflix = insights['recurring'][0]
+        self.assertEqual((netflix['period'], netflix['occurrences'], netflix['amount']), ('monthly', 6, 15.99))
+        self.assertEqual(netflix['next_date'], '2025-07-05')
+        self.assertEqual(insights['anomaly_count'], 1)
+        self.assertEqual(insights['anomalies'][0]['vendor'], 'Steakhouse')
+        self.assertEqual(insights['anomalies'][0]['category'], 'dining')
+
+    def test_insights_follow_edits(self):
+        upload = make_upload(self.rows)
+        other = make_upload([('Spotify', 'entertainment', '9.99', date(2025, 1, day)) for day in (1, 8, 15, 22)])
+        first = self.client.get('/analytics/insights/')
+        self.assertEqual({entry['vendor']: entry['period'] for entry in first.json()['recurring']}, {'Netflix': 'monthly', 'Spotify': 'weekly'})
+        self.assertEqual(self.client.get('/analytics/insights/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        steak = upload.transactions.get(vendor__name='Steakhouse')
+        self.client.put(f'/transactions/{steak.id}/', {'amount': '5.00'}, content_type='application/json')
+        changed = self.client.get('/analytics/insights/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()['anomalies'], [])
+        self.assertEqual(changed.json()['transactions'], len(self.rows) + 4)
+
+
+class CategoryDetailTests(TestCase):
+    """
+        The category detail is aggregates + one bounded page of transactions, never every transaction
+    """
+    def test_stats_and_recent_transactions(self):
+        upload = make_upload(UploadSummaryTests.rows + [
+            ('Chipotle', 'dining', '12.00', date(2025, 6, day)) for day in range(4, 28)
+        ])
+        apply_rows(added=[transaction_row(transaction) for transaction in upload.transactions.select_related('category', 'vendor')])
+
+        response = self.client.get('/categories/dining/', {'page_size': 10})
+        body = response.json()
+        self.assertEqual(body['stats'], {
+            'total_spent': 297.75,
+            'total_transactions': 26,
+            'average_amount': 11.45,
+            'first_date': '2025-06-01',
+            'last_date': '2025-06-27',
+            'top_vendors': {'Chipotle': 288.0, 'Starbucks': 9.75}
+        })
+        self.assertEqual(len(body['recent_transactions']), 10)
+        self.assertEqual(body['recent_transactions'][0]['date'], '2025-06-27')
+        self.assertIsNone(body['previous'])
+
+        # Next page picks up right where the first left off
+        later = self.client.get(body['next']).json()
+        self.assertEqual(later['recent_transactions'][0]['date'], '2025-06-17')
+        self.assertEqual(later['stats'], body['stats'])
+
+    def test_top_vendors_follow_edits(self):
+        upload = make_upload(UploadSummaryTests.rows + [('Chipotle', 'dining', '12.00', date(2025, 6, 4))] * 3)
+        apply_rows(added=[transaction_row(transaction) for transaction in upload.transactions.select_related('category', 'vendor')])
+        chipotle = upload.transactions.filter(vendor__name='Chipotle').first()
+        self.client.put(f'/transactions/{chipotle.id}/', {'amount': '30.00'}, content_type='application/json')
+        self.client.delete(f'/transactions/{upload.transactions.filter(vendor__name="Starbucks").first().id}/')
+
+        dining = Category.objects.get(slug='dining')
+        # Read off the rollup, the transactions table isn't touched
+        with CaptureQueriesContext(connection) as queries:
+            stats = dining.get_stats()
+        self.assertFalse([query for query in queries.captured_queries if '"spending_app_transactions"' in query['sql']])
+        self.assertEqual(stats['top_vendors'], {'Chipotle': 54.0, 'Starbucks': 5.25})
+
+
+class BulkTransactionTests(TestCase):
+    """
+        Batches are validated as a whole and written in one go, summaries + rollups follow like for single writes
+    """
+    def setUp(self):
+        super().setUp()
+        self.upload = make_upload(UploadSummaryTests.rows)
+        build_upload_summary(self.upload)
+        self.dining = Category.objects.get(category_name='dining')
+        self.item = {'vendor': 'Chipotle', 'amount': '12.00', 'date': '2025-06-04', 'category': self.dining.id, 'transaction_upload': self.upload.id}
+
+    def summary(self):
+        return self.client.get(f'/uploads/{self.upload.id}/summary/').json()
+
+    def test_invalid_items_write_nothing(self):
+        response = self.client.post('/transactions/bulk/', [
+            self.item,
+            {**self.item, 'amount': '1.005', 'category': 999},
+            'not a transaction',
+        ], content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], [
+            {'index': 1, 'errors': {
+                'amount': ['A valid number with at most 2 decimal places is required.'],
+                'category': ['Invalid pk "999" - object does not exist.'],
+            }},
+            {'index': 2, 'errors': {'non_field_errors': ['Expected an object but got type "str".']}},
+        ])
+        self.assertEqual(Transactions.objects.count(), 6)
+
+    def test_create_patch_and_delete_by_filter(self):
+        response = self.client.post('/transactions/bulk/', [self.item] * 3, content_type='application/json')
+        self.assertEqual(response.json()['created'], 3)
+        self.assertEqual(self.summary()['spending_per_vendor']['Chipotle'], 36.0)
+
+        ids = response.json()['ids']
+        response = self.client.patch('/transactions/bulk/', [
+            {'id': ids[0], 'amount': 20},
+            {'id': ids[1], 'vendor': 'Qdoba', 'date': '2025-07-01'},
+        ], content_type='application/json')
+        self.assertEqual(response.json(), {'updated': 2})
+        summary = self.summary()
+        self.assertEqual(summary['spending_per_vendor']['Chipotle'], 32.0)
+        self.assertEqual(summary['spending_per_vendor']['Qdoba'], 12.0)
+        self.assertEqual(summary['end_date'], '2025-07-01')
+
+        # Nothing to filter by would be everything
+        self.assertEqual(self.client.delete('/transactions/bulk/').status_code, 400)
+        response = self.client.delete('/transactions/bulk/?category=dining&start=2025-06-02')
+        self.assertEqual(response.json(), {'deleted': 4})
+        summary = self.summary()
+        self.assertEqual(summary['spending_per_category']['dining'], 4.5)
+        self.assertEqual(summary['end_date'], '2025-06-10')
+
+
+class ResponseCacheTests(TestCase):
+    """
+        Cached responses carry strong ETags, writes through the API bump the versions they depend on
+    """
+    def setUp(self):
+        super().setUp()
+        self.override(SNAPSHOT_DIR=self.temp_dir())
+
+    def test_category_list_etag(self):
+        first = self.client.get('/categories/')
+        etag = first['ETag']
+        self.assertEqual(self.client.get('/categories/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.post('/categories/', {'category_name': 'Pets'})
+        changed = self.client.get('/categories/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+        self.assertEqual([category['slug'] for category in changed.json()], ['pets'])
+
+    def test_reads_dont_write(self):
+        upload = make_upload(UploadSummaryTests.rows)
+        build_upload_summary(upload)
+        with CaptureQueriesContext(connection) as queries:
+            for url in ('/categories/', '/categories/dining/', f'/uploads/{upload.id}/', f'/uploads/{upload.id}/summary/'):
+                self.assertEqual(self.client.get(url).status_code, 200)
+        writes = [query['sql'] for query in queries if query['sql'].split()[0] in ('INSERT', 'UPDATE', 'DELETE')]
+        self.assertEqual(writes, [])
+        self.assertFalse(CacheVersion.objects.exists())
+
+    def test_storing_a_response_doesnt_query_per_row(self):
+        # Nested transactions are hyperlinks, storing them must not load anything about the rows they point to
+        queries = []
+        for rows in (UploadSummaryTests.rows, UploadSummaryTests.rows * 3):
+            upload = make_upload(rows)
+            # What ingesting them would have done
+            bump_versions(upload_ids=[upload.id], category_slugs=['dining'])
+            with CaptureQueriesContext(connection) as context:
+                self.client.get(f'/uploads/{upload.id}/')
+                self.client.get('/categories/dining/')
+            queries.append(len(context))
+        self.assertEqual(queries[0], queries[1])
+
+    def test_upload_creating_category_bumps_list(self):
+        first = self.client.get('/categories/')
+        self.assertEqual(first.json(), [])
+
+        upload = TransactionUploads.objects.create(file='transaction_uploads/test.csv')
+        # Running the on_commit callbacks also caches ids the test's rollback is about to take away
+        self.addCleanup(clear_category_cache)
+        self.addCleanup(clear_vendor_cache)
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_csv(io.StringIO('Date,Vendor,Category,Amount\nJun-01-2025,Starbucks,dining,4.50\n'), upload)
+        changed = self.client.get('/categories/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual([category['slug'] for category in changed.json()], ['dining'])
+
+    def test_transaction_edit_bumps_upload_and_category(self):
+        upload = make_upload(UploadSummaryTests.rows)
+        build_upload_summary(upload)
+        transaction = upload.transactions.get(vendor__name='Uber')
+        summary_url, category_url = f'/uploads/{upload.id}/summary/', f'/categories/{transaction.category.slug}/'
+        summary_etag = self.client.get(summary_url)['ETag']
+        category_etag = self.client.get(category_url)['ETag']
+
+        self.client.put(f'/transactions/{transaction.id}/', {'amount': '100.00'}, content_type='application/json')
+        summary = self.client.get(summary_url, HTTP_IF_NONE_MATCH=summary_etag)
+        self.assertEqual(summary.status_code, 200)
+        self.assertEqual(summary.json()['total_spent'], 340.29)
+        category = self.client.get(category_url, HTTP_IF_NONE_MATCH=category_etag)
+        self.assertEqual(category.status_code, 200)
+        self.assertEqual(category.json()['recent_transactions'][0]['amount'], '100.00')
+        # Nothing changed on the upload detail's side of things since the edit
+        detail_etag = self.client.get(f'/uploads/{upload.id}/')['ETag']
+        self.assertEqual(self.client.get(f'/uploads/{upload.id}/', HTTP_IF_NONE_MATCH=detail_etag).status_code, 304)
@@ -0,0 +1,49 @@
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from hashlib import sha256
+
+
+class ContentHashMixin:
+    """
+        Hashes the file while Django streams it in, the uploaded file comes out with a .content_hash
+
+        Saves us from reading the whole file a second time just to check if we've seen it before
+    """
+    def new_file(self, *args, **kwargs):
+        # Before super(), the memory handler raises StopFutureHandlers from new_file when it takes the file
+        self.hasher = sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        remaining = super().receive_data_chunk(raw_data, start)
+        # None means we kept the chunk, otherwise it's passed on to the next handler (which hashes it)
+        if remaining is None:
+            self.hasher.update(raw_data)
+        return remaining
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.content_hash = self.hasher.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(ContentHashMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(ContentHashMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def file_content_hash(file):
+    """
+        sha256 of an uploaded file, straight from the upload handler if it already did the work
+    """
+    content_hash = getattr(file, 'content_hash', None)
+    if content_hash:
+        return content_hash
+    hasher = sha256()
+    for chunk in file.chunks():
+        hasher.update(chunk)
+    file.seek(0)
+    return hasher.hexdigest()
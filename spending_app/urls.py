@@ -1,21 +1,31 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from . import views
+from .metrics import metrics_view
 
 router = DefaultRouter()
 router.register('categories', views.CategoryViewSet, basename='category')
 
 urlpatterns = [
     # Make sure our Home Page API goes first to show all the urls
-    path('', views.home_page, name='home-page'),
+    path('', views.HomePageAPIView.as_view(), name='home-page'),
     path('', include(router.urls)),
     # Transactions
     path('transactions/', views.ListCreateTransactionAPIView.as_view(), name='transaction-list-create'),
     path('transactions/<int:pk>/', views.TransactionDetailsAPIView.as_view(), name='transactions-detail'),
+    path('transactions/export/', views.TransactionExportAPIView.as_view(), name='transactions-export'),
+    path('transactions/bulk/', views.BulkTransactionAPIView.as_view(), name='transactions-bulk'),
     # Upload CSV Transactions 
     path('uploads/', views.TransactionUploadAPIView.as_view(), name='transaction-uploads-list-create'),
     path('uploads/<int:id>/', views.TransactionUploadDetailsAPIView.as_view(), name='transaction-uploads-detail'),
+    path('uploads/<int:id>/status/', views.TransactionUploadStatusAPIView.as_view(), name='transaction-uploads-status'),
     # Summary 
     path('uploads/<int:upload_id>/summary/', views.TransactionSummaryAPIView.as_view(), name='summary-transaction-uploads'),
-    path('uploads/<int:upload_id>/summary/download/', views.TransactionPDFView.as_view(), name='summary-transaction-uploads-download')
+    path('uploads/<int:upload_id>/summary/download/', views.TransactionPDFView.as_view(), name='summary-transaction-uploads-download'),
+    path('uploads/<int:upload_id>/insights/', views.UploadInsightsAPIView.as_view(), name='insights-transaction-uploads'),
+    # Analytics across every upload
+    path('analytics/timeseries/', views.SpendingTimeSeriesAPIView.as_view(), name='analytics-timeseries'),
+    path('analytics/insights/', views.SpendingInsightsAPIView.as_view(), name='analytics-insights'),
+    # Prometheus scrapes /metrics (no trailing slash)
+    path('metrics', metrics_view, name='metrics'),
 ]
@@ -0,0 +1,39 @@
+from django.db.models.expressions import RawSQL
+from .dimensions import NameResolver
+from .models import Vendor
+
+# The trigram index only knows 3 character pieces, shorter searches scan the vendor names instead
+TRIGRAM_LENGTH = 3
+
+
+# name -> id of every vendor this process has already looked up or created
+# Vendors are never renamed or deleted, so the cache only ever grows (one entry per distinct name)
+_vendors = NameResolver(Vendor, 'name')
+
+
+def clear_vendor_cache():
+    _vendors.clear()
+
+
+def resolve_vendor_ids(names):
+    """
+        Maps every vendor name to its Vendor id, creating (and so indexing for search) the ones we've never seen
+
+        Call it inside the same atomic block as the transaction writes that point at them
+    """
+    return _vendors.resolve(names)
+
+
+def search_vendors(text):
+    """
+        Vendors whose name contains text (case-insensitive), as a queryset to use as a subquery
+
+        Looks through the few thousand distinct names with the trigram index, never through the transactions
+    """
+    if len(text) < TRIGRAM_LENGTH:
+        return Vendor.objects.filter(name__icontains=text)
+    # One quoted phrase: the text has to show up as is, its quotes/operators are just characters
+    phrase = '"%s"' % text.replace('"', '""')
+    return Vendor.objects.filter(
+        id__in=RawSQL('SELECT rowid FROM spending_app_vendor_search WHERE spending_app_vendor_search MATCH %s', [phrase])
+    )
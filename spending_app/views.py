@@ -3,33 +3,67 @@ from rest_framework import viewsets, status, generics
 from rest_framework.parsers import MultiPartParser
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.decorators import api_view
 from rest_framework.reverse import reverse
-from .models import Category, Transactions, TransactionUploads
-from .serializers import CategoryReadSerializer, CategoryWriteSerializer, CategoryRetrieveSerializer, TransactionReadSerializer, TransactionWriteSerializer, TransactionUploadsSerializer, TransactionDetailsSerializer
-import pandas as pd
-from django.template.loader import render_to_string
-from weasyprint import HTML
-from django.http import HttpResponse
+from .models import Category, Transactions, TransactionUploads, DailyCategorySpend, DailyVendorSpend, Vendor
+from django.db.models import Prefetch, Sum
+from django.db.models.functions import TruncDay, TruncWeek, TruncMonth, TruncYear
+from .serializers import CategoryReadSerializer, CategoryWriteSerializer, CategoryRetrieveSerializer, NestedTransactionSerializer, TransactionReadSerializer, TransactionWriteSerializer, TransactionUploadsSerializer, TransactionDetailsSerializer, TransactionUploadStatusSerializer, TimeSeriesQuerySerializer, TransactionExportQuerySerializer, TransactionFilterSerializer
+from .jobs import enqueue_upload
+from .pagination import CategoryTransactionPagination, TransactionKeysetPagination
+from .filters import filter_transactions
+from .exports import astream_csv, astream_ndjson, stream_csv, stream_ndjson
+from django.core.handlers.asgi import ASGIRequest
+from .summaries import aget_upload_summary, get_upload_summary, rename_category
+from .categories import clear_category_cache
+from .uploadhandlers import file_content_hash
+from .batchuploads import close_members, create_upload, expand_uploads, is_zip_archive, start_uploads
+from .changes import delete_category, delete_transactions, delete_upload, transaction_row, transactions_changed
+from .bulk import TransactionBatch
+from django.db import transaction
+from .reports import cache_path, open_cached_report, report_context, report_key
+from .rendering import submit_report
+from .metrics import span
+from .asyncviews import AsyncAPIViewMixin
+from .responsecache import CATEGORIES, UPLOADS, bump_versions, cache_response, category_key, upload_key
+from .insights import all_insights, upload_insights
+from asgiref.sync import sync_to_async
+from django.shortcuts import aget_object_or_404, get_object_or_404
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from django.conf import settings
+from io import BytesIO
+from collections import Counter
+import os
+from django.utils.http import parse_etags, quote_etag
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 
 # Create your views here.
 
 # Creating a homepage view to have all of our links 
-@api_view(['GET'])
-def home_page(request, format=None):
-    return Response({
-        # We used category-list because that's the default name of our Viewset 
-        'categories': reverse('category-list', request=request, format=format),
-        'transactions': reverse('transaction-list-create', request=request, format=format),
-        'transactions_upload': reverse('transaction-uploads-list-create', request=request, format=format)
-    })
+class HomePageAPIView(AsyncAPIViewMixin, APIView):
+    async def get(self, request, format=None):
+        return Response({
+            # We used category-list because that's the default name of our Viewset 
+            'categories': reverse('category-list', request=request, format=format),
+            'transactions': reverse('transaction-list-create', request=request, format=format),
+            'transactions_export': reverse('transactions-export', request=request, format=format),
+            'transactions_bulk': reverse('transactions-bulk', request=request, format=format),
+            'transactions_upload': reverse('transaction-uploads-list-create', request=request, format=format),
+            'analytics_timeseries': reverse('analytics-timeseries', request=request, format=format),
+            'analytics_insights': reverse('analytics-insights', request=request, format=format)
+        })
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(AsyncAPIViewMixin, viewsets.ModelViewSet):
     """
         Category View Set for listing, retrieving, creating, updating and detroying our categories
+
+        - list + retrieve are async (async ORM), the writes stay sync (see asyncviews.py)
+        - list + retrieve are cached with ETags until a write bumps their version (see responsecache.py)
+        - retrieve has the category's stats + its recent transactions one page at a time (?cursor=...&page_size=...),
+          so it costs the same for 10 transactions or a million
     """
     queryset = Category.objects.all()
     lookup_field = 'slug'
+    pagination_class = CategoryTransactionPagination
 
     # Custom Serializer Class 
     def get_serializer_class(self):
@@ -40,34 +74,53 @@ class CategoryViewSet(viewsets.ModelViewSet):
             return CategoryRetrieveSerializer
         return CategoryReadSerializer
     
-    def list(self, request):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
+    @cache_response(lambda view, **kwargs: [CATEGORIES])
+    async def list(self, request):
+        categories = [category async for category in self.get_queryset()]
+        serializer = self.get_serializer(categories, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
     
-    def retrieve(self, request, *args, **kwargs):
-        instance = self.get_object() 
-        serializer = self.get_serializer(instance, many=False)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+    @cache_response(lambda view, slug, **kwargs: [category_key(slug)])
+    async def retrieve(self, request, *args, **kwargs):
+        instance = await aget_object_or_404(self.get_queryset(), slug=kwargs['slug'])
+        self.check_object_permissions(request, instance)
+        stats = await sync_to_async(instance.get_stats)()
+        page = await self.paginator.apaginate_queryset(instance.transactions.select_related('vendor'), request, view=self)
+        context = self.get_serializer_context()
+        serializer = self.get_serializer(instance, many=False, context={**context, 'stats': stats})
+        transactions = NestedTransactionSerializer(page, many=True, context=context)
+        return Response({**serializer.data, **self.paginator.get_paginated_data(transactions.data)}, status=status.HTTP_200_OK)
     
     def create(self, request):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                instance = serializer.save()
+                bump_versions(category_slugs=[instance.slug], categories=True)
+            clear_category_cache()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
+        old_name, old_slug = instance.category_name, instance.slug
         serializer = self.get_serializer(instance, data=request.data, partial=True)
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
+                # Upload summaries are keyed by category name
+                renamed_in = rename_category(old_name, instance.category_name)
+                bump_versions(upload_ids=renamed_in, category_slugs=[old_slug, instance.slug], categories=True)
+                # Cached name -> id is keyed by the old name
+                transaction.on_commit(clear_category_cache)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
-        instance.delete()
+        # Deleting a category cascades to its transactions, so summaries + rollups built from them follow (changes.py)
+        delete_category(instance)
+        clear_category_cache()
         return Response({
             'message': "Category was removed..."
         }, status=status.HTTP_200_OK)
@@ -80,25 +133,36 @@ class TransactionSerializerMixin:
             return TransactionWriteSerializer
         return TransactionReadSerializer
 
-class ListCreateTransactionAPIView(TransactionSerializerMixin, generics.ListCreateAPIView):
+class ListCreateTransactionAPIView(AsyncAPIViewMixin, TransactionSerializerMixin, generics.ListCreateAPIView):
     """
         View all Transactions in our Database
         - Create a Transaction if needed
     """
-    queryset = Transactions.objects.all()
+    # Category is needed for category_name + its hyperlink, vendor for its name, grab them in the same query
+    queryset = Transactions.objects.select_related('category', 'vendor')
+    pagination_class = TransactionKeysetPagination
 
-    def get(self, request):
+    async def get(self, request):
         """
-            Returns all our transactions that exists
+            Returns our transactions newest first, one page at a time (?cursor=...&page_size=...)
+
+            Narrowed down by ?upload, category, start, end, min_amount, max_amount, vendor, vendor_prefix
+            and vendor_search (see filters.py), the page links keep them
         """
-        transactions = self.get_queryset()
-        serializer = self.get_serializer(transactions, many=True)
-        return Response({'all_transactions': serializer.data})
+        params = TransactionFilterSerializer(data=request.query_params)
+        if not params.is_valid():
+            return Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+        queryset = filter_transactions(self.get_queryset(), params.validated_data)
+        page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     def post(self, request):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                instance = serializer.save()
+                transactions_changed(added=[transaction_row(instance)])
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST) 
 
@@ -114,23 +178,111 @@ class TransactionDetailsAPIView(TransactionSerializerMixin, generics.RetrieveUpd
         serializer = self.get_serializer(instance)
         return Response(serializer.data, status=status.HTTP_200_OK)
     
+    def get_object_for_update(self):
+        # Only inside transaction.atomic(): the row stays locked until we commit, so another edit can't land
+        # between reading what it counted for and writing ours
+        queryset = self.get_queryset().select_related('category', 'vendor').select_for_update(of=('self',))
+        instance = get_object_or_404(queryset, pk=self.kwargs['pk'])
+        self.check_object_permissions(self.request, instance)
+        return instance
+
     def put(self, request, *args, **kwargs):
-        instance = self.get_object()
-        serialzier = self.get_serializer(instance, data=request.data, partial=True)
-        if serializer.is_valid():
-            serialzier.save()
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            instance = self.get_object_for_update()
+            # What this transaction counted for in summaries + rollups before the edit
+            old_row = transaction_row(instance)
+            serializer = self.get_serializer(instance, data=request.data, partial=True)
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            instance = serializer.save()
+            transactions_changed(added=[transaction_row(instance)], removed=[old_row])
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    def patch(self, request, *args, **kwargs):
+        # put is already a partial update
+        return self.put(request, *args, **kwargs)
     
     def delete(self, request, *args, **kwargs):
-        instance = self.get_object()
-        instance.delete()
+        with transaction.atomic():
+            instance = self.get_object_for_update()
+            old_row = transaction_row(instance)
+            instance.delete()
+            transactions_changed(removed=[old_row])
         return Response({'message': 'Transaction was removed'}, status=status.HTTP_200_OK)
 
-class TransactionUploadAPIView(generics.ListCreateAPIView):
+class BulkTransactionAPIView(APIView):
+    """
+        Many transactions per request, for reconciliation jobs pushing thousands of corrections at once
+
+        - POST [{vendor, amount, date, category, transaction_upload}, ...]: creates all of them
+        - PATCH [{id, ...fields to change}, ...]: updates all of them
+        - DELETE ?upload=<id>&category=<slug>&start=YYYY-MM-DD&...: deletes every match of the list's filters (at least one)
+        The whole list is validated in one pass (see bulk.py) and written in one atomic block: either every item
+        makes it in, or nothing does and the errors of every bad item come back by their index
+    """
+    def post(self, request):
+        batch = TransactionBatch(request.data)
+        if batch.list_error or batch.errors:
+            return Response(batch.error_report(), status=status.HTTP_400_BAD_REQUEST)
+        ids = batch.create()
+        return Response({'created': len(ids), 'ids': ids}, status=status.HTTP_201_CREATED)
+
+    def patch(self, request):
+        # Validated inside the write so the rows we take back out of summaries/rollups can't change underneath us
+        with transaction.atomic():
+            batch = TransactionBatch(request.data, partial=True)
+            if batch.list_error or batch.errors:
+                return Response(batch.error_report(), status=status.HTTP_400_BAD_REQUEST)
+            updated = batch.update()
+        return Response({'updated': updated}, status=status.HTTP_200_OK)
+
+    def delete(self, request):
+        params = TransactionFilterSerializer(data=request.query_params)
+        if not params.is_valid():
+            return Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+        if not params.validated_data:
+            # A DELETE without filters would wipe every transaction
+            return Response({'non_field_errors': ['At least one filter is required.']}, status=status.HTTP_400_BAD_REQUEST)
+        deleted = delete_transactions(filter_transactions(Transactions.objects.all(), params.validated_data))
+        return Response({'deleted': deleted}, status=status.HTTP_200_OK)
+
+class TransactionExportAPIView(APIView):
+    """
+        Streams transactions out as CSV (same layout as our uploads) or NDJSON
+
+        - ?file_type=csv|ndjson&upload=<id>&category=<slug>&start=YYYY-MM-DD&end=YYYY-MM-DD
+        - Rows go from the database cursor straight to the client, server memory stays flat however many rows there are
+        - Under ASGI the body is an async generator, Django would collect a sync one into a list first
+          (and the other way around under WSGI)
+    """
+    STREAMS = {
+        'csv': (stream_csv, astream_csv, 'text/csv'),
+        'ndjson': (stream_ndjson, astream_ndjson, 'application/x-ndjson')
+    }
+
+    def get(self, request):
+        params = TransactionExportQuerySerializer(data=request.query_params)
+        if not params.is_valid():
+            return Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+        file_type = params.validated_data['file_type']
+        transactions = filter_transactions(Transactions.objects.all(), params.validated_data)
+
+        stream, astream, content_type = self.STREAMS[file_type]
+        if isinstance(request._request, ASGIRequest):
+            stream = astream
+        response = StreamingHttpResponse(stream(transactions), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="transactions.{file_type}"'
+        response['Access-Control-Expose-Headers'] = 'Content-Disposition'
+        return response
+
+class TransactionUploadAPIView(AsyncAPIViewMixin, generics.ListCreateAPIView):
     """
         File Uploads to perform data analytics 
-    
+
+        - Under ASGI the request body is read on the event loop before we get here, a slow client
+          uploading a big statement doesn't hold a worker thread
+        - Several files (repeat the file field) and/or ZIP archives of CSVs: one upload per CSV, parsed in
+          parallel by the background jobs, answered with the status of every file (see batchuploads.py)
     """
     queryset = TransactionUploads.objects.all()
     serializer_class = TransactionUploadsSerializer
@@ -145,114 +297,299 @@ class TransactionUploadAPIView(generics.ListCreateAPIView):
             'uploaded_files': serializer.data
         })
     
-    def post(self, request):
+    async def post(self, request):
         # Uploading the file 
         # serializer = self.get_serializer(data=request.data,files=request.FILES)  ## No longer have to use request.FILES in GenericAPIVIews
-        serializer = self.get_serializer(data=request.data)
-        if serializer.is_valid():
-            instance = serializer.save() 
-            # Work with pandas???
-            file = instance.file
-            df = pd.read_csv(file)
-
-            # Normalize/Clean Data (lowercase vendors, making sure amount is float)
-            #
-            # Assuming we have headers => Date,Vendor,Category,Amount
-            df['Vendor'] = df['Vendor'].str.strip()     # Removing White Spaces 
-            df['Category'] = df['Category'].str.strip().str.lower()     # Remove White Spaces + Lower because we'll be adding them into Category model
-            df['Amount'] = df['Amount'].astype(float)
-            # Making sure our date follows the right format 
-            df['Date'] = pd.to_datetime(df['Date'], errors='coerce')    # coerce just fills in NA if time isn't valid 
-            df['Date'] = df['Date'].dt.strftime('%Y-%m-%d')   # We could use .dt to transform into date time 
-
-
-            # Create Categories if not exists
-            # Insert Transactions 
-            transactions_created = 0 
-            for index, row in df.iterrows():
-                # We could use get_or_create it's simialrt to get_or_404
-                # Row is our series 
-                category_obj, _ = Category.objects.get_or_create(category_name=row['Category'])
-                # Now let's make our Transactions 
-                transaction = Transactions.objects.create(
-                    vendor=row['Vendor'],
-                    amount=row['Amount'],
-                    date=row['Date'],
-                    # We need to provide the object itself for FK
-                    category=category_obj,
-                    transaction_upload=instance
-                )
-                transactions_created += 1
-
-            # Summary 
-            # Group by Category, Sum the total, Sort by descing (Largest-Smallest), transform to dict for our resposne
-            summary = df.groupby('Category')['Amount'].sum().sort_values(ascending=False).to_dict()
+        # request.data splits up the multipart body (+ spools big files to disk), keep that off the event loop
+        data = await sync_to_async(lambda: request.data)()
+        files = data.getlist('file') if hasattr(data, 'getlist') else []
+        if len(files) > 1 or (files and await sync_to_async(is_zip_archive)(files[0])):
+            return await sync_to_async(self.post_batch)(request, files)
+        serializer = self.get_serializer(data=data)
+        if await sync_to_async(serializer.is_valid)():
+            # Hashed by our upload handler while the file came in (uploadhandlers.py)
+            content_hash = file_content_hash(serializer.validated_data['file'])
+            instance, duplicate = await sync_to_async(create_upload)(serializer.validated_data['file'], content_hash)
+            if duplicate:
+                # Same file as before, nothing to parse or insert: point them at the first upload
+                return Response({
+                    'message': "This file was already uploaded.",
+                    'upload_id': duplicate.id,
+                    'status_url': reverse('transaction-uploads-status', args=[duplicate.id], request=request)
+                }, status=status.HTTP_200_OK)
+            # Parsing + inserting happens on our background worker pool (see jobs.py), we only hand back the job
+            await sync_to_async(enqueue_upload)(instance.id)
             return Response({
-                'message': f"{transactions_created} number of Transactions were created from your uploaded file.",
+                'message': "Your file was uploaded and is being processed.",
                 'upload_id': instance.id,
-                'spending_summary': summary
-            }, status=status.HTTP_201_CREATED)
+                'status_url': reverse('transaction-uploads-status', args=[instance.id], request=request)
+            }, status=status.HTTP_202_ACCEPTED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    def post_batch(self, request, files):
+        members = expand_uploads(files)
+        try:
+            results = start_uploads(members)
+        finally:
+            close_members(members)
+
+        uploads = []
+        for member, (file_status, upload_id, error) in zip(members, results):
+            entry = {'file_name': member.name, 'archive': member.archive, 'status': file_status}
+            if upload_id:
+                entry['upload_id'] = upload_id
+                entry['status_url'] = reverse('transaction-uploads-status', args=[upload_id], request=request)
+            if error:
+                entry['error'] = error
+            uploads.append(entry)
+        counts = Counter(file_status for file_status, _, _ in results)
+        started = sum(count for file_status, count in counts.items() if file_status not in ('duplicate', 'rejected'))
+
+        if started:
+            response_status = status.HTTP_202_ACCEPTED
+        elif counts['duplicate']:
+            response_status = status.HTTP_200_OK
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response({
+            'message': f"{started} of {len(uploads)} file(s) were uploaded and are being processed.",
+            'counts': dict(counts),
+            'uploads': uploads
+        }, status=response_status)
+
+class TransactionUploadStatusAPIView(generics.RetrieveAPIView):
+    """
+        Progress of the background job processing an upload (rows processed/rejected, elapsed time)
+    """
+    queryset = TransactionUploads.objects.all()
+    serializer_class = TransactionUploadStatusSerializer
+    lookup_field = 'id'
+
+    def get(self, request, *args, **kwargs):
+        instance = self.get_object()
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data)
+
 class TransactionUploadDetailsAPIView(generics.RetrieveDestroyAPIView):
     """
         API View to Retrieve or Destroy
         - When we destroy this file... we remove all the related transactions 
         - We don't to want update because it'll mess with the transactions 
     """
-    queryset = TransactionUploads
+    # Every nested transaction shows its vendor's name, one query for all of them
+    queryset = TransactionUploads.objects.prefetch_related(
+        Prefetch('transactions', queryset=Transactions.objects.select_related('vendor'))
+    )
     serializer_class = TransactionDetailsSerializer
     lookup_field = 'id'
 
+    @cache_response(lambda view, id, **kwargs: [upload_key(id)])
     def get(self, request, *args, **kwargs):
         instance = self.get_object()
         serializer = self.get_serializer(instance)
         return Response(serializer.data)
     
-    def delete(self, request):
+    def delete(self, request, *args, **kwargs):
         instance = self.get_object()
-        instance.delete()
+        delete_upload(instance)
         return Response({
             'message': "Upload file and all related transactions were removed from our system..."
         })
     
+def upload_not_ready(upload):
+    # Summaries are only meaningful once the background job inserted every row
+    return Response({
+        'message': f"Upload is {upload.status}, the summary is available once processing is done.",
+        'status': upload.status,
+        'error': upload.error
+    }, status=status.HTTP_409_CONFLICT)
+
 # Summary (Actionable & Meaningful Insights)
-class TransactionSummaryAPIView(APIView):
+class TransactionSummaryAPIView(AsyncAPIViewMixin, APIView):
     """
         Returns Actionable & Meaningful Data based on all the transaction related to our file 
+
+        Cached with an ETag until the upload's transactions change (see responsecache.py)
     """
 
-    def get(self, request, upload_id):
-        # Prefetch transactions for one bulky query instead of opening the DB again and again
-        upload = TransactionUploads.objects.prefetch_related('transactions').get(id=upload_id)
-        # Now when we do upload.transactions.all() we don't open the DB again since its prefetchedc
-        prefetched_transactions = upload.transactions.all()
-        summary = upload.get_summary(prefetched_transactions)
+    @cache_response(lambda view, upload_id, **kwargs: [upload_key(upload_id)])
+    async def get(self, request, upload_id):
+        # The summary is precomputed at ingest (UploadSummary) so this is a single lookup
+        upload = await aget_object_or_404(TransactionUploads.objects.select_related('summary'), id=upload_id)
+        if upload.status != TransactionUploads.Status.DONE:
+            return upload_not_ready(upload)
+        with span('summary'):
+            summary = (await aget_upload_summary(upload)).as_dict()
 
         return Response(summary)
 
+class SpendingTimeSeriesAPIView(APIView):
+    """
+        Spending over time across every upload
+
+        - ?start=YYYY-MM-DD&end=YYYY-MM-DD&granularity=day|week|month|year&group_by=category|vendor|total
+        - Reads the daily rollups (DailyCategorySpend/DailyVendorSpend) so the cost depends on the
+          number of days in the range, not on the number of transactions
+    """
+    TRUNC = {
+        'day': TruncDay,
+        'week': TruncWeek,
+        'month': TruncMonth,
+        'year': TruncYear
+    }
+
+    def get(self, request):
+        params = TimeSeriesQuerySerializer(data=request.query_params)
+        if not params.is_valid():
+            return Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+        start, end = params.validated_data.get('start'), params.validated_data.get('end')
+        granularity = params.validated_data['granularity']
+        group_by = params.validated_data['group_by']
+
+        if group_by == 'vendor':
+            # Grouped by the integer key, the names come after (one lookup of the vendors in the series)
+            rollup, group_fields = DailyVendorSpend.objects.all(), ['vendor_id']
+        elif group_by == 'category':
+            rollup, group_fields = DailyCategorySpend.objects.all(), ['category__category_name']
+        else:
+            rollup, group_fields = DailyCategorySpend.objects.all(), []
+        if start:
+            rollup = rollup.filter(date__gte=start)
+        if end:
+            rollup = rollup.filter(date__lte=end)
+
+        points = (
+            rollup.annotate(period=self.TRUNC[granularity]('date'))
+            .values('period', *group_fields)
+            .annotate(total_cents=Sum('total_cents'), transactions=Sum('transaction_count'))
+            .order_by('period', *group_fields)
+        )
+        series = []
+        with span('series'):
+            for point in points:
+                entry = {'period': point['period']}
+                if group_fields:
+                    entry[group_by] = point[group_fields[0]]
+                entry['total'] = point['total_cents'] / 100
+                entry['transactions'] = point['transactions']
+                series.append(entry)
+            if group_by == 'vendor':
+                names = Vendor.objects.in_bulk({entry['vendor'] for entry in series})
+                for entry in series:
+                    entry['vendor'] = names[entry['vendor']].name
+
+        return Response({
+            'start': start,
+            'end': end,
+            'granularity': granularity,
+            'group_by': group_by,
+            'series': series
+        })
+
+class UploadInsightsAPIView(APIView):
+    """
+        Recurring charges (subscriptions) + unusual spikes of an upload (see insights.py)
+
+        Computed from the upload's snapshot, cached with an ETag until its transactions change
+    """
+
+    @cache_response(lambda view, upload_id, **kwargs: [upload_key(upload_id)])
+    def get(self, request, upload_id):
+        upload = get_object_or_404(TransactionUploads, id=upload_id)
+        if upload.status != TransactionUploads.Status.DONE:
+            return upload_not_ready(upload)
+        with span('insights'):
+            insights = upload_insights(upload)
+        return Response(insights)
+
+class SpendingInsightsAPIView(APIView):
+    """
+        Recurring charges + unusual spikes across every finished upload
+
+        Cached with an ETag until any upload's transactions (or a category name) change
+    """
+
+    @cache_response(lambda view, **kwargs: [UPLOADS, CATEGORIES])
+    def get(self, request):
+        with span('insights'):
+            insights = all_insights()
+        return Response(insights)
+
 class TransactionPDFView(APIView):
     """
         Downloading a summary report 
+
+        - PDFs are cached on disk by upload + summary + template (see reports.py), re-downloads skip WeasyPrint
+        - The cache key doubles as a strong ETag, If-None-Match gets a 304 without sending the PDF again
+        - Rendering happens in a pool of render processes (see rendering.py), never in the web worker
+        - GET waits for the PDF up to ?wait=<seconds> (REPORT_RENDER_TIMEOUT by default), then answers 202 while it keeps rendering
+        - POST starts rendering without waiting, GET the same url once it's ready
     """
 
+    def get_upload_report(self, upload_id):
+        upload = get_object_or_404(TransactionUploads.objects.select_related('summary'), id=upload_id)
+        summary = get_upload_summary(upload).as_dict() if upload.status == TransactionUploads.Status.DONE else None
+        return upload, summary
+
+    def get_wait(self, request):
+        try:
+            wait = float(request.query_params.get('wait', settings.REPORT_RENDER_TIMEOUT))
+        except ValueError:
+            wait = settings.REPORT_RENDER_TIMEOUT
+        return max(0, min(wait, settings.REPORT_RENDER_TIMEOUT))
+
+    def rendering(self, request, upload):
+        response = Response({
+            'message': "Your report is being rendered, try downloading it again in a moment.",
+            'status': 'rendering',
+            'download_url': reverse('summary-transaction-uploads-download', args=[upload.id], request=request)
+        }, status=status.HTTP_202_ACCEPTED)
+        response['Retry-After'] = 2
+        return response
+
     def get(self, request, upload_id):
-        upload = TransactionUploads.objects.prefetch_related('transactions').get(id=upload_id)
-        prefetched_transactions = upload.transactions.all()
-        summary = upload.get_summary(prefetched_transactions)
-
-        # Using HTML to String so we could pass this through WeasyPrint 
-        # By passing context we could now use this context in our HTML template
-        html_str = render_to_string('reports/summary_report.html', {
-            'file_name': upload.get_file_name(),
-            'summary': summary
-        })
+        upload, summary = self.get_upload_report(upload_id)
+        if summary is None:
+            return upload_not_ready(upload)
+
+        key = report_key(upload, summary)
+        etag = quote_etag(key)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = etag
+            return response
+
+        with span('cache'):
+            report = open_cached_report(key)
+        if report is None:
+            try:
+                # Waiting on the render process (or rendering right here when REPORT_RENDER_WORKERS = 0)
+                with span('render'):
+                    future = submit_report(key, report_context(upload, summary), base_url=request.build_absolute_uri())
+                    report = BytesIO(future.result(timeout=self.get_wait(request)))
+            except FutureTimeoutError:
+                return self.rendering(request, upload)
 
-        # Must provode base_url because of static files 
-        weasy_html = HTML(string=html_str, base_url=request.build_absolute_uri())
-        pdf = weasy_html.write_pdf()
-        response = HttpResponse(pdf, content_type='application/pdf')
         filename = upload.get_file_name().split('.')[0]
-        response['Content-Disposition'] = f'attachment; filename="{filename}_summary_report.pdf"'
-        response['Access-Control-Expose-Headers'] = 'Content-Disposition'
+        response = FileResponse(report, content_type='application/pdf', as_attachment=True, filename=f'{filename}_summary_report.pdf')
+        response['ETag'] = etag
+        response['Access-Control-Expose-Headers'] = 'Content-Disposition, ETag'
         return response
+
+    def post(self, request, upload_id):
+        upload, summary = self.get_upload_report(upload_id)
+        if summary is None:
+            return upload_not_ready(upload)
+
+        key = report_key(upload, summary)
+        if not os.path.exists(cache_path(key)):
+            future = submit_report(key, report_context(upload, summary), base_url=request.build_absolute_uri())
+            if not future.done():
+                return self.rendering(request, upload)
+            # Inline rendering (REPORT_RENDER_WORKERS = 0) is already done, surface its error if it had one
+            future.result()
+        return Response({
+            'message': "Your report is ready.",
+            'status': 'ready',
+            'download_url': reverse('summary-transaction-uploads-download', args=[upload.id], request=request)
+        })